@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""
+Measures the throughput of the avro loader on a generated corpus of .avsc files (records
+with enums, arrays, maps, optional fields and references to records in other files,
+some of which are only found through a resolver), eg:
+
+    bin/avrobench.py -n 5000 -j 8
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+
+from onering.core.context import OneringContext
+from onering.loaders import avro, resolver
+
+def generate_corpus(root_dir, num_schemas, num_namespaces, num_fields, seed):
+    """
+    Writes num_schemas records under root_dir/loaded (to be loaded) and root_dir/resolved
+    (to be found through a resolver) with each record in a file named by its full name.
+    """
+    rand = random.Random(seed)
+    fullnames = []
+    for i in xrange(num_schemas):
+        namespace = "com.bench.ns%d" % rand.randrange(num_namespaces)
+        fields = []
+        for j in xrange(num_fields):
+            choice = rand.random()
+            if fullnames and choice < 0.3:
+                field_type = rand.choice(fullnames)
+            elif choice < 0.4:
+                field_type = ["null", "string"]
+            elif choice < 0.5:
+                field_type = {"type": "array", "items": "long"}
+            elif choice < 0.6:
+                field_type = {"type": "map", "values": "double"}
+            else:
+                field_type = rand.choice(["int", "long", "string", "boolean", "bytes"])
+            fields.append({"name": "field%d" % j, "type": field_type, "doc": "Field %d" % j})
+        fields.append({"name": "status", "type": {"type": "enum", "name": "Status%d" % i, "symbols": ["ON", "OFF"]}})
+        schema = {"type": "record", "name": "Record%d" % i, "namespace": namespace, "fields": fields}
+        fullname = namespace + ".Record%d" % i
+        fullnames.append(fullname)
+        subdir = "resolved" if rand.random() < 0.2 else "loaded"
+        path = os.path.join(root_dir, subdir, *fullname.split(".")) + ".avsc"
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            json.dump(schema, f)
+
+from optparse import OptionParser
+parser = OptionParser(usage = "%prog [options]")
+parser.add_option("-n", "--schemas", dest = "schemas", type = "int", help = "Number of schemas in the corpus", default = 5000)
+parser.add_option("-s", "--namespaces", dest = "namespaces", type = "int", help = "Number of namespaces the schemas are spread over", default = 50)
+parser.add_option("-f", "--fields", dest = "fields", type = "int", help = "Number of fields in each record", default = 10)
+parser.add_option("-j", "--jobs", dest = "workers", type = "int", help = "Number of processes schemas are decoded in", default = 1)
+parser.add_option("-r", "--seed", dest = "seed", type = "int", help = "Seed of the generated corpus", default = 0)
+
+options,args = parser.parse_args()
+
+root_dir = tempfile.mkdtemp(prefix = "avrobench")
+try:
+    generate_corpus(root_dir, options.schemas, options.namespaces, options.fields, options.seed)
+    context = OneringContext()
+    context.entity_resolver.add_resolver(resolver.FilePathEntityResolver(os.path.join(root_dir, "resolved")))
+    loader = avro.Loader(context, {"dir": os.path.join(root_dir, "loaded"), "files": "*.avsc"}, workers = options.workers)
+    start_time = time.time()
+    found_entities = loader.load()
+    elapsed = time.time() - start_time
+    print >> sys.stderr, "%d types (%d schemas) loaded in %.3fs: %.1f types/s" % (len(found_entities), options.schemas,
+                                                                                elapsed, len(found_entities) / elapsed)
+finally:
+    shutil.rmtree(root_dir)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+"""
+Measures the time and memory taken to load a deep hierarchy of pegasus records (each
+record includes the one before it and adds its own fields) when the fields of included
+records are copied and when they are shared, eg:
+
+    bin/includebench.py -d 200 -f 20
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import tempfile
+import multiprocessing
+
+from onering.core.context import OneringContext
+from onering.loaders import pegasus, resolver
+
+def generate_hierarchy(root_dir, depth, num_fields):
+    for i in xrange(depth):
+        schema = {"type": "record", "name": "Level%d" % i, "namespace": "com.bench.includes",
+                  "fields": [{"name": "level%d_field%d" % (i, j), "type": "string", "doc": "Field %d of level %d" % (j, i)}
+                             for j in xrange(num_fields)]}
+        if i > 0:
+            schema["include"] = ["Level%d" % (i - 1)]
+        with open(os.path.join(root_dir, "Level%d.pdsc" % i), "w") as f:
+            json.dump(schema, f)
+
+def load_hierarchy(args):
+    """ Loads the hierarchy (in a fresh process) and returns the time taken, memory used and number of fields. """
+    root_dir, share = args
+    pegasus.Loader.share_included_fields = share
+    context = OneringContext()
+    context.entity_resolver.add_resolver(resolver.FilePathEntityResolver(root_dir))
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start_time = time.time()
+    found_entities = pegasus.Loader(context, {"dir": root_dir, "files": "*.pdsc"}, workers = 1).load()
+    elapsed = time.time() - start_time
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss
+    return elapsed, rss, sum(len(entity.args) for entity in found_entities.itervalues())
+
+from optparse import OptionParser
+parser = OptionParser(usage = "%prog [options]")
+parser.add_option("-d", "--depth", dest = "depth", type = "int", help = "Number of records in the hierarchy", default = 200)
+parser.add_option("-f", "--fields", dest = "fields", type = "int", help = "Number of fields each record adds", default = 20)
+
+options,args = parser.parse_args()
+
+root_dir = tempfile.mkdtemp(prefix = "includebench")
+try:
+    generate_hierarchy(root_dir, options.depth, options.fields)
+    for name, share in [("copied", False), ("shared", True)]:
+        pool = multiprocessing.Pool(1)
+        try:
+            elapsed, rss, num_fields = pool.apply(load_hierarchy, [(root_dir, share)])
+        finally:
+            pool.close()
+            pool.join()
+        print >> sys.stderr, "%-8s %10d fields: %.3fs, %d KB" % (name, num_fields, elapsed, rss)
+finally:
+    shutil.rmtree(root_dir)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+"""
+Measures lexer throughput and peak memory for a lexer engine over a set of onering sources.
+
+Each run should be in its own process (as peak RSS is per process) and engines should be
+compared with the same options (eg all with -k, as a parser holding on to its tokens), eg:
+
+    for engine in classic regex table; do bin/lexbench.py -e $engine -s 5000 -k; done
+"""
+import sys
+import os
+import time
+import resource
+
+from onering.dsl import lexer
+
+def synthesize_source(num_records):
+    """ Generates a source with the given number of records. """
+    out = []
+    for i in xrange(num_records):
+        out.append("""
+// Docs for Record%d
+@annotation(a = 1, b = "two")
+record Record%d {
+    name : string
+    count : int = %d
+    ratio : double = 0.5
+    tags : list<string> ?
+    parent : Record%d
+}
+""" % (i, i, i, max(0, i - 1)))
+    return "".join(out)
+
+from optparse import OptionParser
+parser = OptionParser(usage = "%prog [options] [files...]")
+parser.add_option("-e", "--engine", dest = "engine", help = "Lexer engine to measure: %s" % ", ".join(sorted(lexer.ENGINES.keys())), default = lexer.DEFAULT_ENGINE)
+parser.add_option("-s", "--synthesize", dest = "num_records", type = "int", help = "Lex a generated source with this many records instead of files", default = 0)
+parser.add_option("-n", "--repeat", dest = "repeat", type = "int", help = "Number of times each source is lexed", default = 1)
+parser.add_option("-k", "--keep", dest = "keep", action = "store_true", help = "Keep all tokens alive (as a parser with full lookahead would) instead of discarding them", default = False)
+
+options,args = parser.parse_args()
+
+if options.num_records > 0:
+    sources = [("<synthetic>", synthesize_source(options.num_records))]
+elif args:
+    sources = [(path, open(path).read()) for path in args]
+else:
+    parser.error("Either source files or a --synthesize count is required")
+
+kept = []
+num_tokens = num_chars = 0
+start_time = time.time()
+for i in xrange(options.repeat):
+    for path, source in sources:
+        num_chars += len(source)
+        for token in lexer.make_lexer(source, path, engine = options.engine):
+            token.value
+            num_tokens += 1
+            if options.keep:
+                kept.append(token)
+elapsed = time.time() - start_time
+
+print "Engine:          %s" % options.engine
+print "Tokens:          %d (%d chars)" % (num_tokens, num_chars)
+print "Time:            %.3fs" % elapsed
+print "Throughput:      %d tokens/s" % (num_tokens / max(elapsed, 1e-9))
+print "Peak RSS:        %d KB" % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
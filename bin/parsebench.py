@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+"""
+Measures how long expressions and type expressions take to parse on generated deep
+(nested) and wide (long) inputs, eg:
+
+    bin/parsebench.py -d 2000 -w 5000 -n 3
+"""
+import sys
+import time
+
+from onering.core.context import OneringContext
+from onering.dsl.parser import Parser
+from onering.dsl.parser.rules.exprs import parse_expr
+from onering.dsl.parser.rules.types import ensure_typeexpr
+
+def deep_inputs(depth):
+    return [("deep call", parse_expr, "f(" * depth + "x" + ")" * depth),
+            ("deep list", parse_expr, "[" * depth + "1" + "]" * depth),
+            ("deep block", parse_expr, "{ g(" * depth + "x" + ") => y }" * depth),
+            ("deep type", ensure_typeexpr, "list<" * depth + "int" + ">" * depth)]
+
+def wide_inputs(width):
+    return [("wide block", parse_expr, "{ %s }" % " ".join("f(a%d, [1, 2], (b, c), g<int>(d/e)) => x/y;" % i for i in xrange(width))),
+            ("wide call", parse_expr, "f(%s)" % ", ".join("a%d" % i for i in xrange(width))),
+            ("wide type", ensure_typeexpr, "map<%s>" % ", ".join("list<map<string, T%d>>" % i for i in xrange(width)))]
+
+from optparse import OptionParser
+parser = OptionParser(usage = "%prog [options]")
+parser.add_option("-d", "--depth", dest = "depth", type = "int", help = "Nesting depth of the deep inputs", default = 2000)
+parser.add_option("-w", "--width", dest = "width", type = "int", help = "Number of items in the wide inputs", default = 5000)
+parser.add_option("-n", "--repeat", dest = "repeat", type = "int", help = "Number of times each input is parsed", default = 1)
+
+options,args = parser.parse_args()
+
+context = OneringContext()
+for name, rule, source in deep_inputs(options.depth) + wide_inputs(options.width):
+    start_time = time.time()
+    try:
+        for i in xrange(options.repeat):
+            rule(Parser(source, context))
+        result = "%.3fs" % ((time.time() - start_time) / options.repeat)
+    except RuntimeError, exc:
+        result = "failed (%s)" % exc
+    print "%-12s %8d chars: %s" % (name, len(source), result)
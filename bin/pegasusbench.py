@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""
+Measures how long a synthetic corpus of pegasus schemas (records referring to and
+including records in other files and namespaces) takes to load one file at a time
+and with the two phase (scan then load) loader, and checks both find the same types, eg:
+
+    bin/pegasusbench.py -n 5000 -j 8
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+
+from onering.core.context import OneringContext
+from onering.loaders import pegasus, resolver
+
+def generate_corpus(root_dir, num_records, num_namespaces, num_fields, seed):
+    """ Writes num_records records (each in its own .pdsc file) under root_dir. """
+    rand = random.Random(seed)
+    fqns = []
+    for i in xrange(num_records):
+        namespace = "com.bench.ns%d" % rand.randrange(num_namespaces)
+        fields = []
+        for j in xrange(num_fields):
+            if fqns and rand.random() < 0.3:
+                field_type = rand.choice(fqns)
+            else:
+                field_type = rand.choice(["int", "long", "string", "boolean", "double"])
+            fields.append({"name": "field%d" % j, "type": field_type, "optional": rand.random() < 0.5})
+        schema = {"type": "record", "name": "Record%d" % i, "namespace": namespace, "doc": "Record %d" % i, "fields": fields}
+        if fqns and rand.random() < 0.2:
+            schema["include"] = [rand.choice(fqns)]
+        fqn = namespace + ".Record%d" % i
+        fqns.append(fqn)
+        path = os.path.join(root_dir, *fqn.split(".")) + ".pdsc"
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            json.dump(schema, f)
+    return fqns
+
+def make_loader(root_dir, workers):
+    context = OneringContext()
+    context.entity_resolver.add_resolver(resolver.FilePathEntityResolver(root_dir))
+    return pegasus.Loader(context, {"dir": root_dir, "files": "*.pdsc"}, workers = workers)
+
+def load_one_at_a_time(root_dir):
+    loader = make_loader(root_dir, 1)
+    for path in loader.context.fs_index.match(root_dir, "*.pdsc"):
+        loader.load_from_path(path)
+    return loader.found_entities
+
+def load_two_phase(root_dir, workers):
+    return make_loader(root_dir, workers).load()
+
+from optparse import OptionParser
+parser = OptionParser(usage = "%prog [options]")
+parser.add_option("-n", "--records", dest = "records", type = "int", help = "Number of records in the corpus", default = 5000)
+parser.add_option("-s", "--namespaces", dest = "namespaces", type = "int", help = "Number of namespaces the records are spread over", default = 50)
+parser.add_option("-f", "--fields", dest = "fields", type = "int", help = "Number of fields in each record", default = 10)
+parser.add_option("-j", "--jobs", dest = "workers", type = "int", help = "Number of processes schemas are scanned in", default = 4)
+parser.add_option("-r", "--seed", dest = "seed", type = "int", help = "Seed of the generated corpus", default = 0)
+
+options,args = parser.parse_args()
+
+root_dir = tempfile.mkdtemp(prefix = "pegasusbench")
+try:
+    generate_corpus(root_dir, options.records, options.namespaces, options.fields, options.seed)
+    results = []
+    for name, load in [("one at a time", lambda: load_one_at_a_time(root_dir)),
+                       ("two phase (1 process)", lambda: load_two_phase(root_dir, 1)),
+                       ("two phase (%d processes)" % options.workers, lambda: load_two_phase(root_dir, options.workers))]:
+        start_time = time.time()
+        found_entities = load()
+        results.append((name, time.time() - start_time, sorted(found_entities.keys())))
+    for name, elapsed, fqns in results:
+        print >> sys.stderr, "%-28s %8d types: %.3fs" % (name, len(fqns), elapsed)
+    if any(fqns != results[0][2] for name, elapsed, fqns in results):
+        print >> sys.stderr, "Loaders found different types!"
+        sys.exit(1)
+finally:
+    shutil.rmtree(root_dir)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+"""
+Submits a build request for a package to a running generation daemon (bin/pkgdaemon.py), eg:
+
+    bin/pkgclient.py -p path/to/package -o output -t es6
+"""
+import os
+import sys
+
+from onering.packaging.daemon import send_request
+
+DEFAULT_TARGET = "es6"
+
+from optparse import OptionParser
+parser = OptionParser()
+parser.add_option("-s", "--socket", dest = "socket", help = "Path of the unix domain socket the daemon serves requests on.", default = "/tmp/onering-%d.sock" % os.getuid())
+parser.add_option("-p", "--package", dest = "package_path", help = "Folder containing the package.spec file or the path to the package.spec file.")
+parser.add_option("-o", "--output_dir", dest = "output_dir", help = "Root output folder where all generated artifacts are written to", default = None)
+parser.add_option("-t", "--target_platform", dest = "target_platform", help = "The target platform for which artifacts are to be generted.", default = DEFAULT_TARGET)
+parser.add_option("-x", "--stop", dest = "stop", action = "store_true", help = "Stop the daemon.", default = False)
+
+options,args = parser.parse_args()
+
+if options.stop:
+    request = {"command": "stop"}
+elif not options.package_path or not options.output_dir:
+    parser.error("Package path and output folder required")
+else:
+    request = {"command": "build",
+               "package": os.path.abspath(options.package_path),
+               "output_dir": os.path.abspath(options.output_dir),
+               "platform": options.target_platform}
+
+response = send_request(options.socket, request)
+if response["status"] != "ok":
+    print >> sys.stderr, "Build failed: %s" % response["error"]
+    sys.exit(1)
+if options.stop:
+    print >> sys.stderr, "Stopped"
+else:
+    print >> sys.stderr, "%(package)s built in %(seconds).3fs: %(up_to_date)d outputs up to date" % response, \
+                         "(%d generated, %d sources loaded)" % (len(response["generated"]), len(response["reloaded"]))
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+"""
+Runs a long lived generation daemon that keeps a warm context (with the packages it has
+built and their dependencies loaded) and serves build requests (see bin/pkgclient.py) on
+a unix domain socket, eg:
+
+    bin/pkgdaemon.py -s /tmp/onering.sock -c /tmp/onering-cache
+
+With -w it instead watches the given packages and builds them again whenever their
+sources, templates or specs change:
+
+    bin/pkgdaemon.py -w -p path/to/package -o output -t es6
+"""
+import os
+import sys
+
+from onering.packaging.daemon import Daemon, DaemonServer
+
+DEFAULT_TARGET = "es6"
+
+from optparse import OptionParser
+parser = OptionParser()
+parser.add_option("-s", "--socket", dest = "socket", help = "Path of the unix domain socket build requests are served on.", default = "/tmp/onering-%d.sock" % os.getuid())
+parser.add_option("-c", "--cache_dir", dest = "cache_dir", help = "Folder in which results (eg parsed schemas and rendered text) are cached between runs.", default = None)
+parser.add_option("-j", "--jobs", dest = "parse_workers", type = "int", help = "Number of processes package inputs are parsed in.", default = None)
+parser.add_option("-w", "--watch", dest = "watch", action = "store_true", help = "Watch the given packages (instead of serving requests) and build them when they change.", default = False)
+parser.add_option("-p", "--package", dest = "package_paths", action = "append", help = "Package (folder or package.spec) to watch.  Can be repeated.", default = [])
+parser.add_option("-o", "--output_dir", dest = "output_dir", help = "Root output folder of the watched packages.", default = None)
+parser.add_option("-t", "--target_platform", dest = "target_platform", help = "The target platform of the watched packages.", default = DEFAULT_TARGET)
+parser.add_option("-i", "--interval", dest = "interval", type = "float", help = "Seconds between checks for changes when watching.", default = 1.0)
+
+options,args = parser.parse_args()
+
+def configure(context):
+    context.parse_workers = options.parse_workers
+
+def print_result(result):
+    if result.get("status") == "error":
+        print >> sys.stderr, "%(package)s failed to build:\n%(error)s" % result
+        return
+    print >> sys.stderr, "%(package)s built in %(seconds).3fs: %(up_to_date)d outputs up to date" % result, \
+                         "(%d generated, %d sources loaded)" % (len(result["generated"]), len(result["reloaded"]))
+
+daemon = Daemon(options.cache_dir, configure)
+if options.watch:
+    if not options.package_paths or not options.output_dir:
+        parser.error("Packages and an output folder are required when watching")
+    daemon.watch([(path, options.output_dir, options.target_platform) for path in options.package_paths],
+                 options.interval, print_result)
+else:
+    print >> sys.stderr, "Serving build requests on %s" % options.socket
+    DaemonServer(options.socket, daemon).serve_until_stopped()
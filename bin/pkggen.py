@@ -1,7 +1,10 @@
 #!/usr/bin/env python
 
 """
-Generates a package given the path to a package.spec.
+Generates a package given the path to a package.spec or, with -b, several packages given
+the paths to their package.specs (as arguments) eg:
+
+    bin/pkggen.py -b -w 8 -o output path/to/package1 path/to/package2 ...
 """
 import sys
 import os
@@ -27,6 +30,18 @@ parser = OptionParser()
 parser.add_option("-p", "--package", dest = "package_path", help = "Folder containing the package.spec file or the path to the package.spec file.")
 parser.add_option("-o", "--output_dir", dest = "output_dir", help = "Root output folder where all generated schemas, models, transformers, interfaces and clients are written to", default = None)
 parser.add_option("-t", "--target_platform", dest = "target_platform", help = "The target platform for which artifacts are to be generted.  eg 'es6', 'swift', 'java', 'python'", default = DEFAULT_TARGET)
+parser.add_option("-j", "--jobs", dest = "parse_workers", type = "int", help = "Number of processes package inputs are parsed in.  Overrides the package's parse_workers setting.", default = None)
+parser.add_option("-e", "--lexer_engine", dest = "lexer_engine", help = "Lexer engine onering sources are loaded with: classic (the default), regex or table.", default = None)
+parser.add_option("-l", "--lazy_bodies", dest = "lazy_bodies", action = "store_true", help = "Only parse function bodies when they are needed (eg for generation).", default = False)
+parser.add_option("-d", "--lazy_dependencies", dest = "lazy_dependencies", action = "store_true", help = "Only load the entities of dependency packages when they are first referred to.", default = False)
+parser.add_option("-r", "--rule_profile", dest = "rule_profile", help = "Profile the grammar rules while parsing and write the report (as JSON) to this file.  Parsing is done in this process when profiling.", default = None)
+parser.add_option("-c", "--cache_dir", dest = "cache_dir", help = "Folder in which results (eg parsed schemas) are cached between runs.  Nothing is cached if not specified.", default = None)
+parser.add_option("-i", "--incremental", dest = "incremental", action = "store_true", help = "Only regenerate the outputs whose inputs, templates or settings changed since the last build (recorded in a manifest in the output folder).", default = False)
+parser.add_option("-f", "--fingerprints", dest = "fingerprints", help = "Write the structural fingerprints of the package's entities (and modules) to this file (as JSON).", default = None)
+parser.add_option("-b", "--batch", dest = "batch", action = "store_true", help = "Build all the packages given as arguments loading the packages they share once.", default = False)
+parser.add_option("-w", "--workers", dest = "build_workers", type = "int", help = "Number of processes packages are generated in (in batch mode).", default = 1)
+parser.add_option("-s", "--stream", dest = "stream", action = "store_true", help = "Generate entities as soon as they (and the entities they refer to) are loaded instead of after the whole package is loaded.", default = False)
+parser.add_option("-m", "--schema_cache_mb", dest = "schema_cache_mb", type = "int", help = "Size (in MB) of the schemas kept decoded in memory while loading.", default = None)
 
 options,args = parser.parse_args()
 
@@ -35,7 +50,11 @@ if options.output_dir is None:
 else:
     dirutils.ensure_dir(options.output_dir)
 
-if not options.package_path:
+if options.batch:
+    if not args:
+        exit_with_error(parser, "Package paths required")
+    args = [os.path.join(path, "package.spec") if os.path.isdir(path) else path for path in args]
+elif not options.package_path:
     exit_with_error(parser, "Package path required")
 else:
     if os.path.isdir(options.package_path):
@@ -44,11 +63,62 @@ else:
         exit_with_error(parser, "Invalid package spec path: %d" % options.package_spec)
 
 context = orcontext.OneringContext()
-package = context.load_package(options.package_path)
-package.select_platform(options.target_platform)
-
-pkgdir = os.path.abspath(os.path.join(options.output_dir, package.name))
-package.copy_resources(context, pkgdir)
-
-generator = package.get_generator(context, pkgdir)
-# generator.generate()
+context.parse_workers = options.parse_workers
+context.lazy_function_bodies = options.lazy_bodies
+context.lexer_engine = options.lexer_engine
+context.lazy_dependencies = options.lazy_dependencies
+if options.schema_cache_mb is not None:
+    context.schema_cache.max_bytes = options.schema_cache_mb * 1024 * 1024
+if options.cache_dir:
+    from onering.dsl.parser.cache import ParseCache
+    context.parse_cache = ParseCache(os.path.join(options.cache_dir, "parse"))
+    from onering.loaders import jarindex
+    jarindex.default_index.cache_dir = os.path.join(options.cache_dir, "jars")
+    context.fs_index.cache_dir = os.path.join(options.cache_dir, "files")
+if options.batch:
+    from onering.packaging.batch import BatchBuild
+    render_cache_dir = os.path.join(options.cache_dir, "render", options.target_platform) if options.cache_dir else None
+    batch = BatchBuild(context, [os.path.abspath(path) for path in args], options.output_dir, options.target_platform,
+                       options.build_workers, options.incremental, render_cache_dir)
+    batch.run()
+    print batch.format_timings()
+    sys.exit(1 if any("error" in timings for timings in batch.timings.itervalues()) else 0)
+if options.rule_profile:
+    from onering.dsl.parser.profiler import RuleProfiler
+    context.parse_workers = 1
+    with RuleProfiler() as profiler:
+        package = context.load_package(options.package_path)
+    print profiler.format_report(limit = 20)
+    with open(options.rule_profile, "w") as f:
+        json.dump(profiler.report(), f, indent = 4)
+elif options.stream:
+    # The package is loaded as it is generated
+    package = packages.Package(options.package_path)
+    context.packages[package.name] = package
+else:
+    package = context.load_package(options.package_path)
+render_cache = None
+if options.cache_dir:
+    from onering.targets.rendercache import RenderCache
+    render_cache = RenderCache(os.path.join(options.cache_dir, "render", options.target_platform))
+generator = package.build_generator(context, options.output_dir, options.target_platform,
+                                    incremental = options.incremental, render_cache = render_cache)
+if options.stream and not options.rule_profile:
+    generator.entity_stream = package.iter_entities(context)
+generator.generate()
+if generator.manifest:
+    print "Outputs: %d generated, %d up to date" % (len(generator.file_entities), len(generator.skipped_files))
+if generator.render_cache:
+    print "Render cache: %(hits)d hits, %(misses)d misses" % generator.render_cache.stats
+print "Schema cache: %(hits)d hits, %(misses)d misses, %(evictions)d evictions, %(entries)d schemas (%(bytes)d bytes)" % context.schema_cache.stats
+if context.lazy_entities:
+    print "Dependency sources: %d loaded, %d not needed" % (len(context.lazy_entities.loaded), context.lazy_entities.num_pending)
+if options.fingerprints:
+    from onering.core.fingerprints import Fingerprints
+    fingerprints = Fingerprints.for_package(context, package)
+    fqns = package.found_entities.keys()
+    modules = set(fqn.rpartition(".")[0] for fqn in fqns)
+    with open(options.fingerprints, "w") as f:
+        json.dump({"entities": fingerprints.dump(fqns),
+                   "modules": dict((module, fingerprints.of_module(module, fqns)) for module in modules)},
+                  f, indent = 4, sort_keys = True)
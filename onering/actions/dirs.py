@@ -2,13 +2,13 @@
 import os, sys
 import ipdb
 from onering.loaders import resolver
-from onering import utils as orutils
+from onering.utils import misc
 from onering.actions.base import ActionGroup
 
 def jar_collector(context, path):
     if context.isdir(path):
         return [ resolver.ZipFilePathEntityResolver(jar_file, "pegasus")
-                        for jar_file in orutils.collect_jars(context.abspath(path)) ]
+                        for jar_file in misc.collect_jars(context.abspath(path), context.fs_index) ]
     elif context.isfile(path):
         return [ resolver.ZipFilePathEntityResolver(context.abspath(path), "pegasus") ]
     else:
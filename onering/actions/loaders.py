@@ -4,18 +4,33 @@ from collections import defaultdict
 import fnmatch
 import os, sys
 import importlib
+import multiprocessing
+from cPickle import PicklingError
 from ipdb import set_trace
 from onering import dsl
+from onering.dsl.parser.cache import dump_parse, load_parse
 from onering.loaders import resolver
-from onering.utils.misc import collect_files
 from onering.actions.base import ActionGroup
 
 class LoaderActions(ActionGroup):
     """
     Actions to load models from different different sources.
     """
-    def __init__(self, context):
+    def __init__(self, context, use_mmap = True, workers = 1):
+        """
+        *Parameters:*
+
+            context     -   The onering context into which entities are loaded.
+            use_mmap    -   If True, onering sources are memory mapped and lexed in place
+                            instead of being read into strings when they are lexed by an
+                            engine that lexes in place (see dsl.lexer.IN_PLACE_ENGINES).
+            workers     -   Number of processes onering sources are parsed in.  If more than
+                            1, the sources matching all entries are parsed in parallel and 
+                            then merged into the context in the same order as a serial load.
+        """
         ActionGroup.__init__(self, context)
+        self.use_mmap = use_mmap
+        self.workers = workers
 
     def load_entries(self, entries):
         """ Entry point for loading either a single file, a wild card of files, multiple files or
@@ -36,51 +51,246 @@ class LoaderActions(ActionGroup):
                               is imported, instantiated with the dictionary as its arguments and will
                               have its "load" method called with the context as its arguments.
         """
-        found_entities = {}
+        return dict(self.iter_entries(entries))
+
+    def iter_entries(self, entries):
+        """
+        Loads entries (as load_entries does) but as a generator that yields the (fqn, entity)
+        of each entity as soon as it has been loaded.  Onering sources are streamed entity by 
+        entity (see Parser.iter_entities) and are released as soon as they have been parsed.
+        """
+        for batch in self.iter_batches(entries):
+            for fqn, entity in batch:
+                yield fqn, entity
+
+    def iter_batches(self, entries):
+        """
+        Loads entries (as iter_entries does) but yields the (fqn, entity) of the entities
+        registered in their modules together as a list, eg the entities of a declaration
+        in a onering source or all the entities of a custom loader or of the avro sources.
+        """
+        sources = self.collect_sources(entries)
+
+        parsed = {}
+        if self.workers > 1:
+            parsed = self.parse_files([s for s in sources if type(s) is not dict and is_onering_source(s)])
+
+        avro_paths = []
+        for source in sources:
+            if type(source) is not dict and is_avro_source(source) and source not in avro_paths:
+                avro_paths.append(source)
+
+        for source in sources:
+            # Each batch is a list of (fqn, entity, path of the source it was loaded from)
+            if type(source) is dict:
+                batches = [[(fqn, entity, None) for fqn, entity in self.load_custom(source).iteritems()]]
+            elif source in avro_paths:
+                # All avro sources are loaded together (when the first of them is reached)
+                batches = [list(self.iter_avro_files(avro_paths))] if source == avro_paths[0] else []
+            elif parsed.get(source) is not None:
+                batches = [[(fqn, entity, source) for fqn, entity in self.load_parsed(source, parsed[source]).iteritems()]]
+            else:
+                batches = ([(fqn, entity, source) for fqn, entity in batch] for batch in self.iter_file_batches(source))
+            for batch in batches:
+                for fqn, entity, path in batch:
+                    if path is not None:
+                        self.context.entity_sources[fqn] = self.context.abspath(path)
+                if batch:
+                    yield [(fqn, entity) for fqn, entity, path in batch]
+
+    def collect_sources(self, entries):
+        """
+        Returns the sources to be loaded for the given entries (see load_entries) with
+        wild cards expanded.  Each source is either a path or a custom loader dictionary.
+        """
         context = self.context
         if type(entries) is not list:
             entries = [entries]
 
-        # Collect all entries first by normalizing the wild cards
+        sources = []
         for entry in entries:
             if type(entry) in (str, unicode):
                 # Load by file extensions
                 paths_or_wildcards = entry
                 if context.isfile(entry):
-                    found_entities.update(self.load_file(entry))
+                    sources.append(entry)
                 else:
                     abspath = context.abspath(entry)
                     dirname = os.path.dirname(abspath)
                     if not context.isdir(dirname):
                         raise OneringException("Invalid path: %s" % abspath)
                     base_wildcard = os.path.basename(abspath) or "*.onering"
-                    for f in collect_files(dirname):
-                        if fnmatch.fnmatch(f, base_wildcard):
-                            found_entities.update(self.load_file(f))
+                    sources.extend(context.fs_index.match(dirname, base_wildcard))
             elif not issubclass(entry.__class__, dict):
                 raise OneringException("Entry can be a string or a dictionary")
             else:
-                loader_class_parts = entry["loader"].split(".")
-                basemod, classname = ".".join(loader_class_parts[:-1]), loader_class_parts[-1]
-                loader_class = getattr(importlib.import_module(basemod), classname)
-                entry_args = entry.get("args",[])
-                entry_kwargs = entry.get("kwargs",{})
-                loader = loader_class(context, *entry_args, **entry_kwargs)
-                found = loader.load()
-                found_entities.update(found)
-        return found_entities
+                sources.append(entry)
+        return sources
+
+    def load_custom(self, entry):
+        """ Loads entities with a custom loader (see load_entries). """
+        loader_class_parts = entry["loader"].split(".")
+        basemod, classname = ".".join(loader_class_parts[:-1]), loader_class_parts[-1]
+        loader_class = getattr(importlib.import_module(basemod), classname)
+        entry_args = entry.get("args",[])
+        entry_kwargs = entry.get("kwargs",{})
+        loader = loader_class(self.context, *entry_args, **entry_kwargs)
+        return loader.load()
+
+    def parse_files(self, paths):
+        """
+        Parses the given onering sources in a pool of worker processes (or picks them up
+        from the context's parse cache) without loading them into the context.
+
+        Returns a dictionary of path -> parse serialized with dump_parse.  Sources that
+        could not be serialized are mapped to None and are to be loaded with load_file.
+        """
+        out = {}
+        pending, cache_keys = [], {}
+        parse_cache = self.context.parse_cache
+        entity_parsers = dsl.parser.default_entity_parsers()
+        for path in paths:
+            if path in out: continue
+            out[path] = None
+            if parse_cache:
+                source = self.read_source(path, self.source_engine)
+                try:
+                    cache_keys[path] = parse_cache.key_for(source, self.context.global_module.fqn, entity_parsers,
+                                                           self.context.lazy_function_bodies)
+                finally:
+                    dsl.lexer.close_source(source)
+                out[path] = parse_cache.get(cache_keys[path])
+            if out[path] is None:
+                pending.append(path)
+
+        if pending:
+            pool = multiprocessing.Pool(min(self.workers, len(pending)))
+            try:
+                lazy, engine = self.context.lazy_function_bodies, self.context.lexer_engine
+                results = pool.map(_parse_file_in_worker, [(path, self.use_mmap, engine, lazy) for path in pending])
+            finally:
+                pool.close()
+                pool.join()
+            for path, data in zip(pending, results):
+                out[path] = data
+                if parse_cache and data is not None:
+                    parse_cache.put(cache_keys[path], data)
+        return out
+
+    def iter_avro_files(self, paths):
+        """
+        Loads avro schema files with a single avro Loader (so the names they refer to are
+        resolved in batches) yielding the (fqn, entity, path of the file declaring it) of
+        each entity loaded.  The path is None for entities resolved from elsewhere.
+        """
+        from onering.loaders import avro
+        loader = avro.Loader(self.context)
+        for fqn, entity in loader.load_paths(paths).iteritems():
+            yield fqn, entity, loader.entity_paths.get(fqn)
+
+    def load_parsed(self, path, data):
+        """ Loads the entities of a source parsed with parse_files into the context. """
+        print "Loading parsed schema from %s: " % path
+        parser = dsl.parser.Parser(dsl.lexer.make_lexer("", path), self.context)
+        load_parse(data, parser)
+        return parser.found_entities
+
+    @property
+    def source_engine(self):
+        """ The lexer engine onering sources are loaded with (see source_engine). """
+        return source_engine(self.context.lexer_engine)
+
+    def read_source(self, path, engine = None):
+        """ Reads a onering source to be lexed by the given engine (see read_source). """
+        return read_source(path, self.use_mmap, engine)
 
     def load_file(self, path):
+        entities = dict(self.iter_file(path))
+        for fqn in entities:
+            self.context.entity_sources[fqn] = self.context.abspath(path)
+        return entities
+
+    def iter_file(self, path):
+        """ Loads a single file yielding the (fqn, entity) of each entity loaded from it. """
+        for batch in self.iter_file_batches(path):
+            for fqn, entity in batch:
+                yield fqn, entity
+
+    def iter_file_batches(self, path):
+        """
+        Loads a single file yielding the (fqn, entity) of the entities registered together
+        (see iter_batches) as a list.
+        """
         print "Loading schema from %s: " % path
         basepath, ext = os.path.splitext(path)
         if ext.lower() == ".pdsc":
-            return readers.pegasus.Loader(self.context).load(fqn_or_path)
+            entities = readers.pegasus.Loader(self.context).load(fqn_or_path)
         elif ext.lower() == ".avsc":
-            return readers.avro.Loader(self.context).load(fqn_or_path)
+            from onering.loaders import avro
+            entities = avro.Loader(self.context).load_paths([path])
         elif ext.lower() == ".thrift":
-            return readers.thrift.Loader(self.context).load(fqn_or_path)
+            entities = readers.thrift.Loader(self.context).load(fqn_or_path)
         else:   # onering
-            parser = dsl.parser.Parser(open(path), self.context)
-            parser.parse()
-            return parser.found_entities
+            engine = self.source_engine
+            source = self.read_source(path, engine)
+            try:
+                parser = dsl.parser.Parser(dsl.lexer.make_lexer(source, path, engine = engine), self.context)
+                parser.defer_function_bodies = self.context.lazy_function_bodies
+                parse_cache = self.context.parse_cache
+                if parse_cache:
+                    cache_key = parse_cache.key_for(source, parser.root_module.fqn, parser._entity_parsers,
+                                                    parser.defer_function_bodies)
+                if parse_cache and parse_cache.load(cache_key, parser):
+                    entities = parser.found_entities
+                else:
+                    for batch in parser.iter_entity_batches():
+                        yield batch
+                    if parse_cache:
+                        parse_cache.save(cache_key, parser)
+                    return
+            finally:
+                dsl.lexer.close_source(source)
+        if entities:
+            yield entities.items()
+
+def source_engine(engine = None):
+    """ Returns the lexer engine onering sources are loaded with ie the given engine or the default one. """
+    return engine or dsl.lexer.DEFAULT_ENGINE
+
+def read_source(path, use_mmap, engine = None):
+    """
+    Returns the contents of a onering source to be lexed by the given engine (or by the
+    default engine).  The source is only memory mapped (if use_mmap is True) when the
+    engine lexes it in place as other engines read it into strings anyway.
+    """
+    if use_mmap and (engine or dsl.lexer.DEFAULT_ENGINE) in dsl.lexer.IN_PLACE_ENGINES:
+        return dsl.lexer.map_source(path)
+    return open(path).read()
+
+def is_avro_source(path):
+    return os.path.splitext(path)[1].lower() == ".avsc"
+
+def is_onering_source(path):
+    """ Tells if a path is to be loaded as a onering source (and not by another schema loader). """
+    return os.path.splitext(path)[1].lower() not in (".pdsc", ".avsc", ".thrift")
 
+def _parse_file_in_worker(args):
+    """
+    Parses an onering source in a fresh context and returns its declarations serialized 
+    with dump_parse (or None if they cannot be serialized).  Run by the workers of
+    LoaderActions.parse_files.
+    """
+    path, use_mmap, engine, lazy_function_bodies = args
+    from onering.core.context import OneringContext
+    engine = source_engine(engine)
+    source = read_source(path, use_mmap, engine)
+    parser = dsl.parser.Parser(dsl.lexer.make_lexer(source, path, engine = engine), OneringContext())
+    parser.defer_function_bodies = lazy_function_bodies
+    try:
+        parser.parse()
+        return dump_parse(parser)
+    except (PicklingError, TypeError, AttributeError), exc:
+        print "Cannot send parse of %s from worker: %s" % (path, exc)
+        return None
+    finally:
+        dsl.lexer.close_source(source)
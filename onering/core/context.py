@@ -6,10 +6,23 @@ import os
 from typecube import core as tccore
 from typecube import ext as tcext
 from typecube import runtime as tcruntime
-from onering.utils import dirutils
+from onering.utils import dirutils, fsindex
 from onering.core import errors
 from onering.core import fgraph
 
+""" Types that are registered in the global module of every context. """
+DEFAULT_TYPES = [tccore.AnyType,
+                 tccore.VoidType,
+                 tcext.BooleanType,
+                 tcext.ByteType, 
+                 tcext.IntType,
+                 tcext.LongType,
+                 tcext.FloatType, 
+                 tcext.DoubleType,
+                 tcext.StringType,
+                 tcext.ListType,
+                 tcext.MapType]
+
 class OneringContext(dirutils.DirPointer):
     def __init__(self):
         dirutils.DirPointer.__init__(self)
@@ -18,8 +31,40 @@ class OneringContext(dirutils.DirPointer):
         self.register_default_types()
         self.template_dirs = []
         self.packages = {}
-        from onering.loaders import resolver
+        from onering.loaders import resolver, schemacache
+
+        # Files under the directories schemas and sources are loaded from (see onering.utils.fsindex.FileIndex)
+        self.fs_index = fsindex.FileIndex()
+
+        # Named avro schemas shared by all avro loaders (see onering.loaders.avro.Registry)
+        self.avro_registry = None
+
+        # Decoded schemas shared by all entity resolvers (see onering.loaders.schemacache.SchemaCache)
+        self.schema_cache = schemacache.SchemaCache()
         self.entity_resolver = resolver.EntityResolver()
+        self.entity_resolver.schema_cache = self.schema_cache
+
+        # Cache of parsed compilation units (see onering.dsl.parser.cache.ParseCache)
+        self.parse_cache = None
+
+        # Number of processes package inputs are parsed in.  If None then the
+        # number specified by each package is used.
+        self.parse_workers = None
+
+        # If True, function bodies in onering sources are only parsed when needed
+        self.lazy_function_bodies = False
+
+        # Lexer engine onering sources are loaded with (see onering.dsl.lexer.ENGINES).
+        # If None then the default engine is used.
+        self.lexer_engine = None
+
+        # If True, the onering sources of dependency packages are only loaded when the entities
+        # or modules in them are first looked up (see onering.packaging.lazy.LazyEntities)
+        self.lazy_dependencies = False
+        self.lazy_entities = None
+
+        # FQN -> path of the source file each entity was loaded from
+        self.entity_sources = {}
 
         from onering.core import templates as tplloader
         self.template_loader = tplloader.TemplateLoader(self.template_dirs)
@@ -33,17 +78,7 @@ class OneringContext(dirutils.DirPointer):
 
     def register_default_types(self):
         # register references to default types.
-        for t in [tccore.AnyType,
-                  tccore.VoidType,
-                  tcext.BooleanType,
-                  tcext.ByteType, 
-                  tcext.IntType,
-                  tcext.LongType,
-                  tcext.FloatType, 
-                  tcext.DoubleType,
-                  tcext.StringType,
-                  tcext.ListType,
-                  tcext.MapType]:
+        for t in DEFAULT_TYPES:
             t.parent = self.global_module
             self.global_module.add(t.fqn, t)
 
@@ -59,15 +94,21 @@ class OneringContext(dirutils.DirPointer):
 
     def ensure_package(self, package_name, package_spec_path = None):
         if package_name not in self.packages:
-            return self.load_package(package_spec_path)
+            return self.load_package(package_spec_path, lazy = self.lazy_dependencies)
         return self.packages[package_name]
 
-    def load_package(self, package_spec_path):
+    def load_package(self, package_spec_path, lazy = False):
         from onering.packaging import packages
         package = packages.Package(package_spec_path)
 
         # Now check if it exists already
         if package.name not in self.packages:
-            package.load_entities(self)
+            if lazy:
+                if self.lazy_entities is None:
+                    from onering.packaging.lazy import LazyEntities
+                    self.lazy_entities = LazyEntities(self)
+                package.index_entities(self)
+            else:
+                package.load_entities(self)
             self.packages[package.name] = package
         return self.packages[package.name]
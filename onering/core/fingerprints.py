@@ -0,0 +1,215 @@
+
+from __future__ import absolute_import
+import hashlib
+from typecube import core as tccore
+
+"""
+Stable structural fingerprints of entities (product, sum, enum and alias types, type
+operators and applications and functions) ie hashes of their shape that only change when
+their structure (fields, optionality, defaults, annotations, docs ...) changes.
+"""
+
+""" Attributes that are not part of the structure of an entity. """
+IGNORED_ATTRS = frozenset(["parent", "_parent"])
+
+""" Attributes holding documentation (that can be left out of fingerprints). """
+DOC_ATTRS = frozenset(["docs", "doc"])
+
+def is_module(value):
+    """ Tells if a value is a module (that entities are declared in). """
+    return callable(getattr(value, "ensure_module", None))
+
+def deferred_source(value):
+    """
+    Returns the (source uri, module fqn, text) of a function body whose parsing was deferred
+    (see onering.dsl.parser.deferred.DeferredExpr) whether or not it has been parsed since,
+    or None for any other value.  Such bodies are fingerprinted by their text alone so that
+    their fingerprints do not change when they are parsed and do not depend on the parser
+    state (eg the context) they hold on to.
+    """
+    from onering.dsl.parser.deferred import DeferredExpr
+    if isinstance(value, DeferredExpr):
+        return value.source_parts
+    if isinstance(value, tccore.Expr):
+        return value.__dict__.get("deferred_source")
+    return None
+
+def entity_references(entity):
+    """
+    Returns the FQNs of the entities an entity refers to (through type references anywhere
+    in its structure).  Parents (ie the modules entities are in) are not followed and nor
+    are deferred function bodies (see deferred_source).
+    """
+    out = set()
+    visited = set()
+    pending = [entity]
+    while pending:
+        value = pending.pop()
+        if id(value) in visited or isinstance(value, (basestring, int, long, float, bool)) or value is None:
+            continue
+        visited.add(id(value))
+        if isinstance(value, tccore.TypeRef):
+            fqn = getattr(value, "fqn", None)
+            if fqn: out.add(fqn)
+        if deferred_source(value) is not None:
+            continue
+        if isinstance(value, dict):
+            pending.extend(value.itervalues())
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            pending.extend(value)
+        elif hasattr(value, "__dict__") and not is_module(value):
+            pending.extend(child for name, child in value.__dict__.iteritems() if name not in IGNORED_ATTRS)
+    return out
+
+def fingerprint(entity, include_docs = True):
+    """
+    Returns a hash of the structure of an entity (ie of all its attributes and of the
+    values they refer to).  Type references are hashed by the FQNs they refer to (and not
+    followed) and the parents (modules) of entities are not part of their structure.
+    """
+    return _digest(entity, IGNORED_ATTRS if include_docs else IGNORED_ATTRS | DOC_ATTRS)
+
+def _digest(value, ignored):
+    digest = hashlib.sha1()
+    _update(digest, value, {}, ignored)
+    return digest.hexdigest()
+
+def _update(digest, value, seen, ignored):
+    if value is None or isinstance(value, (bool, int, long, float)):
+        digest.update(repr(value))
+        return
+    if isinstance(value, basestring):
+        if isinstance(value, unicode):
+            value = value.encode("utf-8")
+        digest.update("s%d:" % len(value))
+        digest.update(value)
+        return
+    if id(value) in seen:
+        # Cycles (and shared values) are referred to by the order they were first seen in
+        digest.update("@%d" % seen[id(value)])
+        return
+    seen[id(value)] = len(seen)
+    if isinstance(value, tccore.TypeRef):
+        digest.update("ref:%s" % value.fqn)
+    elif deferred_source(value) is not None:
+        digest.update("deferred:")
+        for part in deferred_source(value):
+            _update(digest, part, seen, ignored)
+    elif is_module(value):
+        digest.update("module:%s" % value.fqn)
+    elif isinstance(value, dict):
+        digest.update("{")
+        for key in sorted(value.keys()):
+            _update(digest, key, seen, ignored)
+            _update(digest, value[key], seen, ignored)
+        digest.update("}")
+    elif isinstance(value, (list, tuple)):
+        digest.update("[")
+        for item in value:
+            _update(digest, item, seen, ignored)
+        digest.update("]")
+    elif isinstance(value, (set, frozenset)):
+        digest.update("<%s>" % ",".join(sorted(_digest(item, ignored) for item in value)))
+    elif hasattr(value, "__dict__"):
+        digest.update(type(value).__name__ + "(")
+        attrs = value.__dict__
+        for name in sorted(attrs.keys()):
+            if name in ignored: continue
+            digest.update(name + "=")
+            _update(digest, attrs[name], seen, ignored)
+        digest.update(")")
+    else:
+        digest.update(type(value).__name__)
+
+class Fingerprints(object):
+    """
+    Memoized fingerprints of the entities found with find_entity (a function of an FQN
+    returning the entity or None).  For each entity:
+
+        local       -   fingerprint of its own structure (see fingerprint).
+        deep        -   fingerprint of its structure and of the structure of every entity it
+                        (transitively) refers to, ie it changes when a dependency changes.
+
+    When an entity changes, invalidate forgets the fingerprints of that entity and the deep
+    fingerprints of the entities that refer to it so they are the only ones recomputed.
+    """
+    def __init__(self, find_entity, include_docs = True):
+        self.find_entity = find_entity
+        self.include_docs = include_docs
+        self._local = {}
+        self._deep = {}
+        self._references = {}
+        # fqn -> FQNs of the entities whose deep fingerprints were computed with it
+        self._dependents = {}
+
+    @classmethod
+    def for_package(cls, context, package, include_docs = True):
+        """ Fingerprints of the entities of a package (and of the entities they refer to). """
+        def find_entity(fqn):
+            return package.found_entities.get(fqn) or context.global_module.find_fqn(fqn)
+        return cls(find_entity, include_docs)
+
+    def local(self, fqn):
+        if fqn not in self._local:
+            entity = self.find_entity(fqn)
+            self._local[fqn] = fingerprint(entity, self.include_docs) if entity is not None else None
+        return self._local[fqn]
+
+    def references(self, fqn):
+        """ FQNs of the entities an entity directly refers to. """
+        if fqn not in self._references:
+            entity = self.find_entity(fqn)
+            self._references[fqn] = frozenset(entity_references(entity)) if entity is not None else frozenset()
+        return self._references[fqn]
+
+    def closure(self, fqns):
+        """ FQNs of the given entities and of all the entities they (transitively) refer to. """
+        out = set()
+        pending = list(fqns)
+        while pending:
+            fqn = pending.pop()
+            if fqn in out: continue
+            out.add(fqn)
+            pending.extend(self.references(fqn))
+        return out
+
+    def deep(self, fqn):
+        if fqn not in self._deep:
+            closure = self.closure([fqn])
+            parts = [(dep, self.local(dep)) for dep in sorted(closure)]
+            self._deep[fqn] = hashlib.sha1(repr((fqn, parts))).hexdigest()
+            for dep in closure:
+                self._dependents.setdefault(dep, set()).add(fqn)
+        return self._deep[fqn]
+
+    def of_entity(self, entity):
+        """ Deep fingerprint of an entity that need not have an FQN (eg a child type). """
+        closure = self.closure(entity_references(entity))
+        parts = [(dep, self.local(dep)) for dep in sorted(closure)]
+        return hashlib.sha1(repr((fingerprint(entity, self.include_docs), parts))).hexdigest()
+
+    def of_module(self, module_fqn, fqns):
+        """ Fingerprint of a module ie of the (deep fingerprints of) entities in it among the given FQNs. """
+        prefix = module_fqn + "." if module_fqn else ""
+        parts = [(fqn, self.deep(fqn)) for fqn in sorted(fqns) if fqn.startswith(prefix)]
+        return hashlib.sha1(repr((module_fqn, parts))).hexdigest()
+
+    def invalidate(self, fqn):
+        """ Forgets the fingerprints that depend on an entity that has changed. """
+        self._local.pop(fqn, None)
+        self._references.pop(fqn, None)
+        for dependent in self._dependents.pop(fqn, ()):
+            self._deep.pop(dependent, None)
+
+    def dump(self, fqns):
+        """ Returns fqn -> {"local", "deep", "references"} of the given entities. """
+        return dict((fqn, {"local": self.local(fqn), "deep": self.deep(fqn),
+                           "references": sorted(self.references(fqn))}) for fqn in fqns)
+
+def changed(previous, current):
+    """ Returns the FQNs whose (deep) fingerprints differ between two dumps (added and removed ones included). """
+    out = set(fqn for fqn in previous if fqn not in current)
+    for fqn, fingerprints in current.iteritems():
+        if previous.get(fqn, {}).get("deep") != fingerprints["deep"]:
+            out.add(fqn)
+    return sorted(out)
@@ -2,6 +2,7 @@
 from __future__ import absolute_import
 import pkgutil
 import os
+import hashlib
 from os.path import join, exists, getmtime
 import ipdb
 from jinja2 import BaseLoader, TemplateNotFound, StrictUndefined
@@ -16,8 +17,29 @@ class TemplateLoader(BaseLoader):
         self.template_dirs = template_dirs or []
         self.template_extension = default_extension or ""
         self.parent_loader = parent_loader
+        # Dicts into which the name -> hash of each template loaded is recorded
+        self.recorders = []
 
     def get_source(self, environment, template_name):
+        source, path, uptodate = self._get_source(environment, template_name)
+        if self.recorders:
+            source_hash = hashlib.sha1(source.encode("utf-8")).hexdigest()
+            for recorder in self.recorders:
+                recorder[template_name] = source_hash
+        return source, path, uptodate
+
+    def source_hash(self, template_name):
+        """ Returns the hash of the current source of a template (or None if it does not exist). """
+        recorders, self.recorders = self.recorders, []
+        try:
+            source = self._get_source(None, template_name)[0]
+        except (TemplateNotFound, IOError):
+            return None
+        finally:
+            self.recorders = recorders
+        return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+    def _get_source(self, environment, template_name):
         final_path = template_name
         if not template_name.startswith("/"):
             for tdir in self.template_dirs:
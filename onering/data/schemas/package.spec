@@ -7,6 +7,9 @@ description = """ Core onering schemas.  """
 # All schema files to load
 inputs = [ "./*.schema" ]
 
+# Number of processes the inputs are parsed in (in parallel)
+# parse_workers = 4
+
 # Extra template directories for use with this package
 # template_dirs = [ "../../apigen/data/templates" ]
 
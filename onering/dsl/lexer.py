@@ -1,9 +1,13 @@
 
+import array
+import bisect
 import cStringIO
 import ipdb
+import mmap
 import os
+import re
 import shlex
-from errors import SourceException
+from errors import SourceException, OneringException
 from enum import Enum
 
 class TokenType(Enum):
@@ -42,11 +46,73 @@ class TokenType(Enum):
     DOTDOTDOT           = "..."
 
 
-class Token(object):
-    def __init__(self, tok_type, position, length = None, value = None, line = 0, col = 0):
+class LineIndex(object):
+    """
+    Offsets at which the lines of a source start so that the line and column of any
+    position can be found with a bisect instead of being tracked for every character.
+
+    Columns are numbered as the lexers have always reported them - 1 based on the
+    first line and 0 based on the following lines.
+    """
+    def __init__(self, source = None, first_line = 1, first_col = 1):
+        """
+        If a source is given the index is built from it on first use otherwise it is
+        built with feed as the source is read.  first_line and first_col are the line and
+        column of the start of the source (if it is a span of a larger source).
+        """
+        self.source = source
+        self.first_line = first_line
+        self.line_starts = array.array("i", [(1 if first_line == 1 else 0) - first_col])
+
+    def feed(self, offset, text):
+        """ Records the starts of lines in a chunk of text found at the given offset in the source. """
+        nlpos = text.find("\n")
+        while nlpos >= 0:
+            self.line_starts.append(offset + nlpos + 1)
+            nlpos = text.find("\n", nlpos + 1)
+
+    def line_col(self, position):
+        """ Returns the (line, col) of the given position. """
+        if self.source is not None:
+            source, self.source = self.source, None
+            self.feed(0, source)
+        line = bisect.bisect_right(self.line_starts, position)
+        col = position - self.line_starts[line - 1]
+        line += self.first_line - 1
+        if line == 1:
+            col += 1
+        return line, col
+
+class BaseToken(object):
+    """
+    The Token API (tok_type, value, position, length, line and col) shared by tokens
+    and by views over the rows of a TokenTable.  It has no slots of its own so that
+    each kind of token only holds the slots it needs.
+    """
+    __slots__ = ()
+
+    @property
+    def endpos(self):
+        return self.position + self.length
+
+    def __repr__(self):
+        if self.value:
+            return "<[%d-%d], Line: %d, Col: %d, %s - %s>" % (self.position, self.endpos, self.line, self.col, self.tok_type, self.value)
+        else:
+            return "<[%d-%d], Line: %d, Col: %d, %s>" % (self.position, self.endpos, self.line, self.col, self.tok_type)
+
+class Token(BaseToken):
+    __slots__ = ("tok_type", "value", "_position", "_line", "_col", "_length", "_line_index")
+
+    def __init__(self, tok_type, position, length = None, value = None, line = 0, col = 0, line_index = None):
+        """
+        Creates a token.  If a line_index is given then the line and col of the 
+        token are looked up in it (from its position) when first required.
+        """
         self._position = position
         self._line = line
         self._col = col
+        self._line_index = line_index
         self.tok_type = tok_type
         if value is None:
             value = tok_type.value
@@ -56,12 +122,19 @@ class Token(object):
         self.value = value
         # print "Returning Token: %s" % repr(self)
 
+    def _locate(self):
+        if self._line_index is not None:
+            self._line, self._col = self._line_index.line_col(self._position)
+            self._line_index = None
+
     @property
     def line(self):
+        self._locate()
         return self._line
 
     @property
     def col(self):
+        self._locate()
         return self._col
 
     @property
@@ -72,39 +145,63 @@ class Token(object):
     def length(self):
         return self._length
 
-    @property
-    def endpos(self):
-        return self.position + self.length
+class SourceToken(Token):
+    """
+    A token that only holds the (start, end) offsets of its value in the source.
+    The value is sliced out of the source (and converted if required) only when it is 
+    first read so that lexing a memory mapped source does not copy it into strings.
+    """
+    __slots__ = ("source", "_start", "_value")
 
-    def __repr__(self):
-        if self.value:
-            return "<[%d-%d], Line: %d, Col: %d, %s - %s>" % (self.position, self.endpos, self.line, self.col, self.tok_type, self.value)
-        else:
-            return "<[%d-%d], Line: %d, Col: %d, %s>" % (self.position, self.endpos, self.line, self.col, self.tok_type)
+    def __init__(self, tok_type, source, position, start, end, line_index):
+        self.tok_type = tok_type
+        self.source = source
+        self._position = position
+        self._start = start
+        self._length = end - start
+        self._line_index = line_index
+        self._value = None
+
+    @property
+    def value(self):
+        if self._value is None:
+            text = self.source[self._start:self._start + self._length]
+            self._value = _token_value(self.tok_type, text)
+        return self._value
 
 class Lexer(object):
     """
     Tokenizers an input stream containing Onering records and returns the tokens.
     """
-    def __init__(self, instream, source_uri):
-        if type(instream) in (str, unicode):
-            instream = cStringIO.StringIO(instream)
+    def __init__(self, instream, source_uri, span = None, line_index = None):
+        """
+        Creates a lexer over the instream.  If span is provided only the (start, end)
+        offsets of the source are lexed (see span_lexer).  If a line_index is provided it
+        must already have the lines of the source (otherwise lines are recorded as the
+        source is read).
+        """
+        if type(instream) not in (str, unicode):
+            instream = instream[:] if isinstance(instream, mmap.mmap) else instream.read()
         self.source_uri = source_uri
-        self.instream = instream
-        self.next_pos = 0
-        self.next_line = 1
-        self.next_col  = 1
+        self.source = instream
+        self.instream = cStringIO.StringIO(instream)
+        self.next_pos, self.end_pos = span or (0, len(instream))
+        self.instream.seek(self.next_pos)
+        # Offset in the source of the end of the buffer
+        self.read_pos = self.next_pos
+        self.feed_lines = line_index is None
+        self.line_index = line_index or LineIndex()
         self.buffer = ""
         self.end_reached = False
         self.comments_enabled = True
 
     @property
     def line(self):
-        return self.next_line
+        return self.line_index.line_col(self.next_pos)[0]
 
     @property
     def column(self):
-        return self.next_col
+        return self.line_index.line_col(self.next_pos)[1]
 
     def _ensure_buffer(self, size = 1):
         buff_len = len(self.buffer)
@@ -112,7 +209,10 @@ class Lexer(object):
             if self.end_reached:
                 return False
             num_bytes = size - buff_len
-            readchars = self.instream.read(max(num_bytes, 64))
+            readchars = self.instream.read(min(max(num_bytes, 64), self.end_pos - self.read_pos))
+            if self.feed_lines:
+                self.line_index.feed(self.read_pos, readchars)
+            self.read_pos += len(readchars)
             self.buffer += readchars
             self.end_reached = len(readchars) < num_bytes
         return len(self.buffer) >= size
@@ -140,7 +240,7 @@ class Lexer(object):
         return True
 
     def matches_func(self, func, peek = True):
-        ch,_,_,_ = self.get_chars(peek = True)
+        ch,_ = self.get_chars(peek = True)
         if not ch or not func(ch):
             return None
         if not peek:
@@ -149,21 +249,14 @@ class Lexer(object):
         return True
 
     def get_chars(self, nchars = 1, peek = False):
-        curr_col = self.next_col
         curr_pos = self.next_pos
-        curr_line = self.next_line
         self._ensure_buffer(nchars)
         if peek:
             out = self.buffer[:nchars]
         else:
             out = self._read_buffer(nchars)
-            for i,ch in enumerate(out):
-                self.next_pos += 1
-                self.next_col += 1
-                if ch == "\n":
-                    self.next_line += 1
-                    self.next_col = 0
-        return (out, curr_pos, curr_line, curr_col)
+            self.next_pos += len(out)
+        return (out, curr_pos)
 
     def read_while(self, match_rule):
         """
@@ -171,7 +264,7 @@ class Lexer(object):
         """
         curr_tok_value = ""
         while self.matches_func(match_rule):
-            nextch,_,_,_ = self.get_chars()
+            nextch,_ = self.get_chars()
             curr_tok_value += nextch
         return curr_tok_value
 
@@ -183,10 +276,10 @@ class Lexer(object):
         while self.has_more:
             if self.matches_symbol("\\"):
                 self.out += "\\"
-                ch,_,_,_ = self.get_chars()
+                ch,_ = self.get_chars()
                 out += ch
             elif not self.matches_symbol(delim_str):
-                ch,_,_,_ = self.get_chars()
+                ch,_ = self.get_chars()
                 out += ch
             else:
                 if include:
@@ -201,12 +294,20 @@ class Lexer(object):
     def __iter__(self):
         return self
 
+    def span_lexer(self, start, end):
+        """
+        Returns a new lexer over the given offsets (already read by this lexer) of this
+        lexer's source.  Tokens from it have the same positions, lines and columns as they
+        do in this lexer.
+        """
+        return Lexer(self.source, self.source_uri, (start, end), self.line_index)
+
     def next(self):
         while self.has_more:
-            curr_pos, curr_line, curr_col = self.next_pos, self.next_line, self.next_col
+            curr_pos = self.next_pos
             curr_tok_value = ""
             def make_token(toktype, value = None, length = None):
-                return Token(toktype, curr_pos, value = value, line = curr_line, col = curr_col, length = length)
+                return Token(toktype, curr_pos, value = value, length = length, line_index = self.line_index)
 
             if self.matches_symbol("["):
                 return make_token(TokenType.OPEN_SQUARE)
@@ -273,7 +374,7 @@ class Lexer(object):
                 return make_token(TokenType.NUMBER, number_value, len(curr_tok_value))
             elif self.matches_func(lambda x: x == "_" or x.isalpha()):
                 while self.matches_func(lambda x: x == "_" or x.isalnum()):
-                    nextch,_,_,_ = self.get_chars()
+                    nextch,_ = self.get_chars()
                     curr_tok_value += nextch
                 return make_token(TokenType.IDENTIFIER, curr_tok_value)
 
@@ -290,11 +391,11 @@ class Lexer(object):
             if self.matches_symbol("/"):
                 return make_token(TokenType.SLASH)
             elif self.matches_symbol("'"):
-                curr_pos, curr_line, curr_col = self.next_pos, self.next_line, self.next_col
+                curr_pos = self.next_pos
                 curr_tok_value = self.read_till("'", include = False)
                 return make_token(TokenType.STRING, curr_tok_value)
             elif self.matches_symbol('"'):
-                curr_pos, curr_line, curr_col = self.next_pos, self.next_line, self.next_col
+                curr_pos = self.next_pos
                 curr_tok_value = self.read_till('"', include = False)
                 return make_token(TokenType.STRING, curr_tok_value)
             elif self.matches_func(str.isspace, peek = False):
@@ -304,5 +405,385 @@ class Lexer(object):
                 currch = self.get_chars(peek = True)[0]
                 if not currch:
                     raise StopIteration 
+                curr_line, curr_col = self.line_index.line_col(curr_pos)
                 raise SourceException(curr_line, curr_col, "Invalid character encountered: '%s'" % currch)
         raise StopIteration 
+
+########################################################################
+##          Table driven lexer
+########################################################################
+
+def _literal_rule(tok_type):
+    return (tok_type.name, re.escape(tok_type.value))
+
+# The rules of the master regex.  The order mirrors the order of the checks in
+# Lexer.next so that overlapping prefixes (eg "...", ".." and ".") resolve the
+# same way - the first alternative that matches wins.
+_HEAD_RULES = [_literal_rule(t) for t in [
+    TokenType.OPEN_SQUARE, TokenType.CLOSE_SQUARE,
+    TokenType.OPEN_BRACE, TokenType.CLOSE_BRACE,
+    TokenType.LT, TokenType.GT,
+    TokenType.OPEN_PAREN, TokenType.CLOSE_PAREN,
+    TokenType.COMMA,
+    TokenType.DOTDOTDOT, TokenType.DOTDOT, TokenType.DOT,
+    TokenType.QMARK, TokenType.AT ]] + [
+    ("HASH",                r"#[^\n]*"),
+] + [_literal_rule(t) for t in [
+    TokenType.ARROW, TokenType.STREAM, TokenType.EQUALS ]] + [
+    ("DOLLAR",              r"\$\w*"),
+] + [_literal_rule(t) for t in [
+    TokenType.COLON, TokenType.SEMI_COLON, TokenType.MINUS, TokenType.STAR ]] + [
+    ("NUMBER",              r"\d+\.?\d*"),
+    ("IDENTIFIER",          r"[^\W\d]\w*"),
+]
+
+_COMMENT_RULES = [
+    ("LINE_COMMENT",        r"//[^\n]*"),
+    ("BLOCK_COMMENT",       r"/\*[\s\S]*?\*/"),
+    ("OPEN_COMMENT",        r"/\*"),
+]
+
+_TAIL_RULES = [
+    _literal_rule(TokenType.SLASH),
+    ("STRING",              r"'(?:\\[\s\S]|[^\\'])*'|\"(?:\\[\s\S]|[^\\\"])*\""),
+    ("OPEN_STRING",         r"['\"]"),
+    ("SPACES",              r"\s+"),
+]
+
+def _compile_rules(rules):
+    return re.compile("|".join("(?P<%s>%s)" % rule for rule in rules))
+
+_MASTER_PATTERN = _compile_rules(_HEAD_RULES + _COMMENT_RULES + _TAIL_RULES)
+_MASTER_PATTERN_NO_COMMENTS = _compile_rules(_HEAD_RULES + _TAIL_RULES)
+
+class RegexLexer(object):
+    """
+    A single pass lexer that matches each token with one precompiled master regex
+    over the whole source instead of probing every token kind in turn.
+
+    Produces the same tokens (with the same positions, lines and columns) as Lexer.
+    Unlike Lexer, backslash escapes are honoured inside strings.
+
+    If the source is a memory map (see map_source) it is lexed in place and tokens
+    only refer to offsets in the map (see SourceToken).
+    """
+    def __init__(self, instream, source_uri, span = None, line_index = None):
+        """
+        Creates a lexer over the instream.  If span is provided only the (start, end) 
+        offsets of the source are lexed (see span_lexer).
+        """
+        self.lazy_values = isinstance(instream, mmap.mmap)
+        if type(instream) not in (str, unicode) and not self.lazy_values:
+            instream = instream.read()
+        self.source_uri = source_uri
+        self.source = instream
+        self.next_pos, self.end_pos = span or (0, len(instream))
+        self.line_index = line_index or LineIndex(instream)
+        self.comments_enabled = True
+
+    @property
+    def line(self):
+        return self.line_index.line_col(self.next_pos)[0]
+
+    @property
+    def column(self):
+        return self.line_index.line_col(self.next_pos)[1]
+
+    @property
+    def has_more(self):
+        return self.next_pos < self.end_pos
+
+    def __iter__(self):
+        return self
+
+    def span_lexer(self, start, end):
+        """
+        Returns a new lexer over the given offsets of this lexer's source.  Tokens
+        from it have the same positions, lines and columns as they do in this lexer.
+        """
+        return RegexLexer(self.source, self.source_uri, (start, end), self.line_index)
+
+    def _scan(self):
+        """
+        Moves past the next token in the source and returns its 
+        (tok_type, position, value_start, value_end) or None if the end of the
+        source has been reached.  value_start and value_end are None for tokens that
+        do not carry a value from the source.
+        """
+        source = self.source
+        pattern = _MASTER_PATTERN if self.comments_enabled else _MASTER_PATTERN_NO_COMMENTS
+        while self.next_pos < self.end_pos:
+            curr_pos = self.next_pos
+            m = pattern.match(source, curr_pos, self.end_pos)
+            if m is None:
+                curr_line, curr_col = self.line_index.line_col(curr_pos)
+                raise SourceException(curr_line, curr_col, "Invalid character encountered: '%s'" % source[curr_pos])
+            kind, endpos = m.lastgroup, m.end()
+            if kind == "SPACES":
+                self.next_pos = endpos
+                continue
+            elif kind in ("OPEN_COMMENT", "OPEN_STRING"):
+                delim = "*/" if kind == "OPEN_COMMENT" else source[curr_pos]
+                curr_line, curr_col = self.line_index.line_col(curr_pos)
+                raise SourceException(curr_line, curr_col, "EOF Reached.  Expected '%s'" % delim)
+
+            # A lone "$" is a DOLLAR token and has no value
+            if kind in _VALUE_SPANS and (kind != "DOLLAR" or endpos - curr_pos > 1):
+                tok_type, start_delta, end_delta = _VALUE_SPANS[kind]
+                value_start, value_end = curr_pos + start_delta, endpos - end_delta
+                if kind == "STRING":
+                    # String tokens start after the opening quote
+                    curr_pos = value_start
+            else:
+                tok_type, value_start, value_end = TokenType[kind], None, None
+            self.next_pos = endpos
+            return tok_type, curr_pos, value_start, value_end
+        return None
+
+    def next(self):
+        scanned = self._scan()
+        if scanned is None:
+            raise StopIteration 
+        tok_type, position, start, end = scanned
+        if start is None:
+            return Token(tok_type, position, line_index = self.line_index)
+        elif self.lazy_values:
+            return SourceToken(tok_type, self.source, position, start, end, self.line_index)
+        else:
+            value = _token_value(tok_type, self.source[start:end])
+            return Token(tok_type, position, end - start, value, line_index = self.line_index)
+
+    def tokenize(self, table = None):
+        """
+        Lexes the rest of the source into a TokenTable (a new one if not provided) and returns it.
+        """
+        if table is None:
+            table = TokenTable(self.source, self.source_uri, self.line_index)
+        scanned = self._scan()
+        while scanned is not None:
+            table.append(*scanned)
+            scanned = self._scan()
+        return table
+
+def _number_value(text):
+    try:
+        return int(text)
+    except ValueError, ve:
+        return float(text)
+
+def _token_value(tok_type, text):
+    """ Converts the text of a token's value into its value. """
+    if tok_type == TokenType.NUMBER:
+        return _number_value(text)
+    return text
+
+# For rules whose tokens carry a value from the source, the token type and the
+# number of characters to skip at the start and end of the match to get to the 
+# value.
+_VALUE_SPANS = {
+    "IDENTIFIER":       (TokenType.IDENTIFIER, 0, 0),
+    "NUMBER":           (TokenType.NUMBER, 0, 0),
+    "STRING":           (TokenType.STRING, 1, 1),
+    "LINE_COMMENT":     (TokenType.COMMENT, 0, 0),
+    "BLOCK_COMMENT":    (TokenType.COMMENT, 0, 0),
+    "HASH":             (TokenType.HASH, 1, 0),
+    "DOLLAR":           (TokenType.DOLLAR_LITERAL, 1, 0),
+}
+
+########################################################################
+##          Compact token tables
+########################################################################
+
+_TOKEN_TYPES = list(TokenType)
+_TOKEN_TYPE_CODES = dict((tok_type, code) for code, tok_type in enumerate(_TOKEN_TYPES))
+
+class TokenTable(object):
+    """
+    A compact struct-of-arrays buffer of tokens.  Each token is a row across the parallel
+    type, start and length columns where start and length give the span of the token's
+    value in the source.  Values are only sliced out of the source when first read and 
+    are interned in a value table shared by all rows.  Lines and columns are looked up
+    in the source's line index.
+    """
+    def __init__(self, source, source_uri = None, line_index = None):
+        self.source = source
+        self.source_uri = source_uri
+        self.line_index = line_index or LineIndex(source)
+        self.types = array.array("B")
+        self.starts = array.array("i")
+        self.lengths = array.array("i")
+        # Index into the value table for each token or -1 if the value has not been read yet
+        self.value_ids = array.array("i")
+        self.values = []
+        self._value_ids_by_key = {}
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        if index < 0 or index >= len(self.types):
+            raise IndexError(index)
+        return TokenView(self, index)
+
+    def append(self, tok_type, position, value_start = None, value_end = None):
+        """ Adds a new row for a token and returns its index. """
+        if value_start is None:
+            value_start, value_end = position, position + len(tok_type.value)
+            value_id = self.intern(tok_type.value)
+        else:
+            value_id = -1
+        self.types.append(_TOKEN_TYPE_CODES[tok_type])
+        self.starts.append(value_start)
+        self.lengths.append(value_end - value_start)
+        self.value_ids.append(value_id)
+        return len(self.types) - 1
+
+    def intern(self, value):
+        """ Returns the index of the given value in the value table adding it if required. """
+        # Key on the type as well so 1 and 1.0 are not collapsed
+        key = (type(value), value)
+        value_id = self._value_ids_by_key.get(key)
+        if value_id is None:
+            value_id = self._value_ids_by_key[key] = len(self.values)
+            self.values.append(value)
+        return value_id
+
+    def tok_type(self, index):
+        return _TOKEN_TYPES[self.types[index]]
+
+    def position(self, index):
+        # The value of directives and dollar literals starts after the leading "#" or "$"
+        tok_type = _TOKEN_TYPES[self.types[index]]
+        if tok_type == TokenType.HASH or tok_type == TokenType.DOLLAR_LITERAL:
+            return self.starts[index] - 1
+        return self.starts[index]
+
+    def value(self, index):
+        value_id = self.value_ids[index]
+        if value_id < 0:
+            start = self.starts[index]
+            text = self.source[start:start + self.lengths[index]]
+            value_id = self.value_ids[index] = self.intern(_token_value(self.tok_type(index), text))
+        return self.values[value_id]
+
+class TokenView(BaseToken):
+    """ A thin view over a row in a TokenTable that exposes the Token API. """
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @property
+    def tok_type(self):
+        return self.table.tok_type(self.index)
+
+    @property
+    def value(self):
+        return self.table.value(self.index)
+
+    @property
+    def line(self):
+        return self.table.line_index.line_col(self.position)[0]
+
+    @property
+    def col(self):
+        return self.table.line_index.line_col(self.position)[1]
+
+    @property
+    def position(self):
+        return self.table.position(self.index)
+
+    @property
+    def length(self):
+        return self.table.lengths[self.index]
+
+class TableLexer(object):
+    """
+    A lexer that records every token in a TokenTable as it is lexed (by a RegexLexer) 
+    and returns TokenViews over the table's rows instead of individual token objects.
+    """
+    def __init__(self, instream, source_uri):
+        self.scanner = RegexLexer(instream, source_uri)
+        self.table = TokenTable(self.scanner.source, source_uri, self.scanner.line_index)
+        self.source_uri = source_uri
+        self.next_index = 0
+
+    @property
+    def line(self):
+        return self.scanner.line
+
+    @property
+    def column(self):
+        return self.scanner.column
+
+    @property
+    def comments_enabled(self):
+        return self.scanner.comments_enabled
+
+    @comments_enabled.setter
+    def comments_enabled(self, value):
+        self.scanner.comments_enabled = value
+
+    def __iter__(self):
+        return self
+
+    def span_lexer(self, start, end):
+        return self.scanner.span_lexer(start, end)
+
+    def next(self):
+        if self.next_index >= len(self.table):
+            scanned = self.scanner._scan()
+            if scanned is None:
+                raise StopIteration 
+            self.table.append(*scanned)
+        out = TokenView(self.table, self.next_index)
+        self.next_index += 1
+        return out
+
+def map_source(path):
+    """
+    Returns a read only memory map of the file at the given path so it can be lexed without
+    copying it into strings.  Empty files cannot be mapped so an empty string is returned 
+    for them instead.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        return mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+
+def close_source(source):
+    """
+    Closes a source returned by map_source once the lexers (and the tokens) over it are
+    no longer needed.  Sources that are not memory maps are left alone.
+    """
+    if isinstance(source, mmap.mmap):
+        source.close()
+
+"""
+Lexer engines that can be selected when creating a lexer.  The "classic" engine is
+the original character at a time lexer and remains the default.  The "regex" and
+"table" engines are faster but also accept backslash escapes in strings and line
+comments at the end of the input without a trailing newline (which the classic engine
+rejects).  All engines can lex spans of their input (see span_lexer).
+"""
+ENGINES = {
+    "classic": Lexer,
+    "regex": RegexLexer,
+    "table": TableLexer,
+}
+
+DEFAULT_ENGINE = "classic"
+
+""" Engines that lex memory mapped sources (see map_source) in place. """
+IN_PLACE_ENGINES = frozenset(["regex", "table"])
+
+def make_lexer(instream, source_uri = None, engine = None):
+    """
+    Creates a lexer over the given input stream (or string) with the given engine.
+    If engine is not specified then DEFAULT_ENGINE is used.
+    """
+    engine = engine or DEFAULT_ENGINE
+    if engine not in ENGINES:
+        raise OneringException("Invalid lexer engine: '%s'" % engine)
+    return ENGINES[engine](instream, source_uri)
@@ -8,6 +8,27 @@ from onering.dsl.parser.tokstream import TokenStream
 from onering.dsl import errors
 from onering.dsl.lexer import Token, TokenType
 
+"""
+Version of the parser.  This must be bumped whenever the entities produced for a
+given source change so that earlier parses cached by a ParseCache are not reused.
+"""
+PARSER_VERSION = 1
+
+def default_entity_parsers():
+    """ Returns the keyword -> entity parser of the declarations every parser accepts. """
+    from onering.dsl.parser.rules.types import parse_alias_decl, parse_record_or_union, parse_enum
+    from onering.dsl.parser.rules.modules import parse_module
+    from onering.dsl.parser.rules.functions import parse_function, parse_quant_spec
+    return {
+        "alias": parse_alias_decl,
+        "record": parse_record_or_union,
+        "union": parse_record_or_union,
+        "enum": parse_enum,
+        "module": parse_module,
+        "fun": parse_function,
+        "funi": parse_quant_spec,
+    }
+
 class Parser(TokenStream):
     """
     Parses a Onering compilation unit and extracts all records define in it.
@@ -26,10 +47,9 @@ class Parser(TokenStream):
             context     -   The onering context into which all loaded entities will be registered into.
             root_module -   The module underwhich all declarations will be added/loaded.
         """
-        lexer_or_stream
         from onering.dsl import lexer
-        if type(lexer_or_stream) is not lexer.Lexer:
-            lexer_or_stream = lexer.Lexer(lexer_or_stream, source_uri = None)
+        if type(lexer_or_stream) not in lexer.ENGINES.values():
+            lexer_or_stream = lexer.make_lexer(lexer_or_stream, source_uri = None)
         super(Parser, self).__init__(lexer_or_stream)
 
         # The root module corresponds to the top level entity and has no name really
@@ -39,25 +59,16 @@ class Parser(TokenStream):
         self._last_docstring = ""
         self.injections = {}
         self.onering_context = context
+        # Declarations made by this parser (on the context) in the order they were made
+        # so they can be replayed without parsing.  See replay.
+        self.journal = []
+        # If True then function bodies are skipped and only parsed when needed (see deferred.DeferredExpr)
+        self.defer_function_bodies = False
         self.use_default_parsers()
 
     def use_default_parsers(self):
-        from onering.dsl.parser.rules.types import parse_alias_decl
-        self.register_entity_parser("alias", parse_alias_decl)
-
-        from onering.dsl.parser.rules.types import parse_record_or_union
-        self.register_entity_parser("record", parse_record_or_union)
-        self.register_entity_parser("union", parse_record_or_union)
-
-        from onering.dsl.parser.rules.types import parse_enum
-        self.register_entity_parser("enum", parse_enum)
-
-        from onering.dsl.parser.rules.modules import parse_module
-        self.register_entity_parser("module", parse_module)
-
-        from onering.dsl.parser.rules.functions import parse_function, parse_quant_spec
-        self.register_entity_parser("fun", parse_function)
-        self.register_entity_parser("funi", parse_quant_spec)
+        for keyword, entity_parser in default_entity_parsers().iteritems():
+            self.register_entity_parser(keyword, entity_parser)
 
     def get_entity_parser(self, entity_class):
         return self._entity_parsers.get(entity_class, None)
@@ -67,11 +78,52 @@ class Parser(TokenStream):
 
     def add_entity(self, name, entity):
         if name:
-            parent_fqn = self.current_module.fqn
-            fqn = parent_fqn + "." + name
-            assert fqn not in self.found_entities, "Entity '%s' already exists in module '%s'" % (name, parent_fqn)
-            self.found_entities[fqn] = entity
-            self.current_module.add(name, entity)
+            self._register_entity(self.current_module, name, entity)
+            self.journal.append(("entity", self.current_module, name, entity))
+
+    def _register_entity(self, module, name, entity):
+        parent_fqn = module.fqn
+        fqn = parent_fqn + "." + name
+        assert fqn not in self.found_entities, "Entity '%s' already exists in module '%s'" % (name, parent_fqn)
+        self.found_entities[fqn] = entity
+        module.add(name, entity)
+
+    def add_module(self, fqn, annotations, docs):
+        """ Ensures that a module with the given FQN exists and sets its annotations and docs. """
+        module = self.onering_context.global_module.ensure_module(fqn).set_annotations(annotations).set_docs(docs)
+        self.journal.append(("module", module, annotations, docs))
+        return module
+
+    def add_alias(self, alias, fqn):
+        """ Adds an alias to an FQN in the current module. """
+        self.current_module.set_alias(alias, fqn)
+        self.journal.append(("alias", self.current_module, alias, fqn))
+
+    def register_function(self, function):
+        """ Registers a function with the function graph of the context. """
+        self.onering_context.fgraph.register(function)
+        self.journal.append(("function", function))
+
+    def replay(self, journal, injections):
+        """
+        Replays the declarations journalled by an earlier parse of the same source 
+        into the context instead of parsing it again.
+        """
+        for entry in journal:
+            if entry[0] == "entity":
+                _, module, name, entity = entry
+                self._register_entity(module, name, entity)
+            elif entry[0] == "module":
+                _, module, annotations, docs = entry
+                module.set_annotations(annotations).set_docs(docs)
+            elif entry[0] == "alias":
+                _, module, alias, fqn = entry
+                module.set_alias(alias, fqn)
+            elif entry[0] == "function":
+                self.onering_context.fgraph.register(entry[1])
+        self.journal = list(journal)
+        self.injections.update(injections)
+        return self.root_module
 
     def last_docstring(self, reset = True):
         out = self._last_docstring
@@ -116,18 +168,41 @@ class Parser(TokenStream):
 
             module
         """
+        for fqn, entity in self.iter_entities():
+            pass
+        return self.root_module
+
+    def iter_entities(self):
+        """
+        Parses a Onering compilation unit (as parse does) but as a generator that yields 
+        the (fqn, entity) of each entity as soon as the declaration registering it has 
+        been parsed instead of after the whole unit has been consumed.
+        """
+        for batch in self.iter_entity_batches():
+            for fqn, entity in batch:
+                yield fqn, entity
+
+    def iter_entity_batches(self):
+        """
+        Parses a Onering compilation unit (as iter_entities does) but yields the (fqn, entity)
+        of the entities registered by each declaration (eg a record and the types declared
+        inline in it) together as a list.
+        """
+        num_reported = len(self.journal)
         try:
             # parse_namespace()
-            from onering.dsl.parser.rules.modules import parse_module_body
-            parse_module_body(self, self.root_module)
+            from onering.dsl.parser.rules.modules import iter_module_body
+            for _ in iter_module_body(self, self.root_module):
+                batch = [(entry[1].fqn + "." + entry[2], entry[3])
+                            for entry in self.journal[num_reported:] if entry[0] == "entity"]
+                num_reported = len(self.journal)
+                if batch:
+                    yield batch
         except errors.SourceException:
             raise
         except errors.OneringException, exc:
             # Change its message to reflect the line and col
             raise errors.SourceException(self.line, self.column, exc.message)
-        except:
-            raise
-        return self.root_module
 
     def process_directive(self, command):
         parts = [c.strip() for c in command.split(" ") if c.strip()]
@@ -0,0 +1,130 @@
+
+from __future__ import absolute_import
+import os
+import hashlib
+import cPickle as pickle
+import cStringIO
+import onering
+from onering.core.context import DEFAULT_TYPES
+from onering.dsl.parser import PARSER_VERSION
+
+class ParseCache(object):
+    """
+    A persistent cache of parsed onering compilation units.
+
+    Entries are keyed by the hash of the source contents, the parser version and the
+    entity parsers registered on the parser.  Each entry holds the parser's journal
+    (see Parser.journal) and injections so that a hit can be replayed into a context
+    without lexing or parsing the source.
+
+    Modules and default types are not stored in an entry but are referred to by FQN
+    and looked up in the context being replayed into.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.hits = self.misses = 0
+
+    def key_for(self, source, root_fqn, entity_parsers, lazy_function_bodies = False):
+        """
+        Returns the key for the given source (string or memory map) parsed into the module
+        with the given FQN with the given (keyword -> entity parser) entity parsers and
+        with function bodies deferred (see Parser.defer_function_bodies) or not.
+        """
+        if type(source) is unicode:
+            source = source.encode("utf-8")
+        hasher = hashlib.sha1()
+        hasher.update(source)
+        hasher.update("\0%s\0%d\0%s\0%d\0" % (onering.__version__, PARSER_VERSION, root_fqn, bool(lazy_function_bodies)))
+        for keyword, entity_parser in sorted(entity_parsers.iteritems()):
+            hasher.update("%s=%s.%s\0" % (keyword, entity_parser.__module__, entity_parser.__name__))
+        return hasher.hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".parse")
+
+    def get(self, key):
+        """ Returns the serialized parse (see dump_parse) for the given key or None on a miss. """
+        path = self.path_for(key)
+        if not os.path.isfile(path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        with open(path, "rb") as f:
+            return f.read()
+
+    def put(self, key, data):
+        """ Saves the serialized parse (see dump_parse) for the given key. """
+        path = self.path_for(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.rename(temp_path, path)
+
+    def load(self, key, parser):
+        """ Replays the entry with the given key into the parser returning True on a hit. """
+        data = self.get(key)
+        if data is None:
+            return False
+        try:
+            load_parse(data, parser)
+        except Exception, exc:
+            print "Ignoring invalid parse cache entry %s: %s" % (self.path_for(key), exc)
+            self.hits -= 1
+            self.misses += 1
+            return False
+        return True
+
+    def save(self, key, parser):
+        """ Saves the journal of a parser that has parsed the source with the given key. """
+        try:
+            data = dump_parse(parser)
+        except (pickle.PicklingError, TypeError, AttributeError), exc:
+            # Not all entities can be pickled (eg those holding native callables)
+            # so such sources are just not cached.
+            print "Cannot cache parse of %s: %s" % (parser.lexer.source_uri, exc)
+            return False
+        self.put(key, data)
+        return True
+
+def dump_parse(parser):
+    """
+    Serializes the declarations journalled by a parser (and its injections) into a 
+    string that can be replayed into any context with load_parse.  Modules and default
+    types are not serialized but referred to by their FQNs (and the context by the
+    context being replayed into).
+    """
+    external_ids = dict((id(t), ("type", t.fqn)) for t in DEFAULT_TYPES)
+    external_ids[id(parser.onering_context)] = ("context", None)
+    external_ids[id(parser.root_module)] = ("module", parser.root_module.fqn)
+    for entry in parser.journal:
+        if entry[0] != "function":
+            module = entry[1]
+            external_ids[id(module)] = ("module", module.fqn)
+
+    out = cStringIO.StringIO()
+    pickler = pickle.Pickler(out, pickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = lambda obj: external_ids.get(id(obj))
+    pickler.dump((parser.journal, parser.injections))
+    return out.getvalue()
+
+def load_parse(data, parser):
+    """ Replays declarations serialized with dump_parse into the parser's context. """
+    context = parser.onering_context
+    default_types = dict((t.fqn, t) for t in DEFAULT_TYPES)
+    def persistent_load(pid):
+        kind, fqn = pid
+        if kind == "type":
+            return default_types[fqn]
+        elif kind == "context":
+            return context
+        elif fqn == parser.root_module.fqn:
+            return parser.root_module
+        else:
+            return context.global_module.ensure_module(fqn)
+
+    unpickler = pickle.Unpickler(cStringIO.StringIO(data))
+    unpickler.persistent_load = persistent_load
+    journal, injections = unpickler.load()
+    return parser.replay(journal, injections)
@@ -0,0 +1,104 @@
+from __future__ import absolute_import
+from typecube import core as tccore
+from onering.dsl import errors
+from onering.dsl.lexer import TokenType, LineIndex
+
+class DeferredExpr(tccore.Expr):
+    """
+    A "{" ... "}" block (eg a function body) whose parsing has been deferred till it
+    is needed.  Only the text of the block (and where it starts in the source) is
+    recorded when the block is skipped by skip_expr_list and the block is parsed (once)
+    when it is resolved, when its type is evaluated or when parse is called.  Once
+    parsed, the expression replaces this one as the body of its function.
+
+    Pickling a deferred expression pickles the text of the block and not its parse so
+    that a deferred body stays unparsed across parse caches and parse workers.
+
+    The (source uri, module fqn, text) of the block (see source_parts) stand for its
+    structure (eg in fingerprints) both before and after it is parsed.
+    """
+    def __init__(self, parser, start, end):
+        tccore.Expr.__init__(self)
+        span = parser.lexer.span_lexer(start, end)
+        self.source_uri = span.source_uri
+        self.text = span.source[start:end]
+        self.line, self.col = span.line_index.line_col(start)
+        # The block is lexed by the same kind of lexer as the rest of the source
+        self.lexer_class = type(span)
+        self.onering_context = parser.onering_context
+        self.module = parser.current_module
+        self.entity_parsers = parser._entity_parsers
+        # The function this is the body of (see parse_function)
+        self.function = None
+        self._parsed = None
+
+    @property
+    def is_parsed(self):
+        return self._parsed is not None
+
+    @property
+    def source_parts(self):
+        """ The (source uri, module fqn, text) of the block. """
+        return self.source_uri, self.module.fqn if self.module is not None else None, self.text
+
+    def make_lexer(self):
+        """ Returns a lexer over the block whose tokens have the lines and columns they have in the source. """
+        line_index = LineIndex(self.text, first_line = self.line, first_col = self.col)
+        return self.lexer_class(self.text, self.source_uri, line_index = line_index)
+
+    def parse(self):
+        """ Parses the block (if not already parsed) and returns the parsed expression. """
+        if self._parsed is None:
+            from onering.dsl.parser import Parser
+            from onering.dsl.parser.rules.exprs import parse_expr
+            parser = Parser(self.make_lexer(), self.onering_context, self.module)
+            parser._entity_parsers.update(self.entity_parsers)
+            self._parsed = parse_expr(parser)
+            self._parsed.deferred_source = self.source_parts
+            if self._parsed.parent is None and self.parent is not None:
+                self._parsed.parent = self.parent
+            if self.function is not None and self.function.expr is self:
+                self.function.expr = self._parsed
+            self.entity_parsers = None
+        return self._parsed
+
+    def _evaltype(self):
+        return self.parse()._evaltype()
+
+    def _resolve(self):
+        return self.parse().resolve()
+
+def skip_expr_list(parser):
+    """
+    Moves past a "{" ... "}" block by matching braces without parsing it and returns
+    a DeferredExpr for it.  Comments in the block are recorded as docstrings as they
+    would be by parse_expr while directives are only processed when the block is parsed.
+    """
+    start = parser.next_token_if(TokenType.OPEN_BRACE, consume = True)
+    if start is None:
+        raise errors.UnexpectedTokenException(parser.peek_token(), TokenType.OPEN_BRACE)
+    depth = 1
+    while depth > 0:
+        token = parser.next_token()
+        if token.tok_type == TokenType.OPEN_BRACE:
+            depth += 1
+        elif token.tok_type == TokenType.CLOSE_BRACE:
+            depth -= 1
+        elif token.tok_type == TokenType.COMMENT:
+            parser._last_docstring = token.value
+        elif token.tok_type == TokenType.EOS:
+            raise errors.UnexpectedTokenException(token, TokenType.CLOSE_BRACE)
+    out = DeferredExpr(parser, start.position, token.position + 1)
+    parser.consume_tokens(TokenType.SEMI_COLON)
+    return out
+
+def ensure_body(function):
+    """
+    Ensures that the body of a function (or of the function a quantifier is over) is
+    parsed if it had been deferred and returns the body.
+    """
+    if function.isa(tccore.Quant):
+        function = function.expr
+    if isinstance(function.expr, DeferredExpr):
+        function.expr = function.expr.parse()
+    return function.expr
@@ -0,0 +1,202 @@
+
+from __future__ import absolute_import
+import time
+import importlib
+import functools
+from types import GeneratorType
+
+"""
+Modules whose parse_* and ensure_* functions are grammar rules that are profiled.
+"""
+RULE_MODULES = ["onering.dsl.parser.rules.annotations",
+                "onering.dsl.parser.rules.exprs",
+                "onering.dsl.parser.rules.functions",
+                "onering.dsl.parser.rules.modules",
+                "onering.dsl.parser.rules.types"]
+
+"""
+Modules whose iter_* functions are rule generators (run by exprs.run_rule) that are
+profiled.  Rules are also looked up in the module's *_RULES tables (eg PREFIX_RULES).
+"""
+GENERATOR_RULE_MODULES = ["onering.dsl.parser.rules.exprs"]
+
+class RuleStats(object):
+    __slots__ = ("rule", "source", "calls", "inclusive", "exclusive", "tokens", "exclusive_tokens")
+    def __init__(self, rule, source):
+        self.rule = rule
+        self.source = source
+        self.calls = 0
+        self.inclusive = self.exclusive = 0.0
+        self.tokens = self.exclusive_tokens = 0
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+class RuleProfiler(object):
+    """
+    Records the number of calls, the inclusive and exclusive wall time and the tokens
+    consumed by each grammar rule (the parse_* and ensure_* functions in RULE_MODULES
+    and the iter_* rule generators in GENERATOR_RULE_MODULES) per source file.  A rule
+    generator is timed from its first step till it yields its value and the rules run
+    for the expressions it requests are counted as its children.
+
+    Profiling is opt-in.  Rules are only instrumented while the profiler is enabled
+    (eg with "with profiler: ...") so parsing is not slowed down otherwise.  Only
+    parsing done in this process is profiled.
+
+    Inclusive times and tokens of a recursive rule (eg parse_expr) are only counted
+    for the outermost call.
+    """
+    def __init__(self):
+        self.stats = {}
+        self._frames = []
+        self._active = {}
+        self._originals = None
+        self._table_originals = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *args):
+        self.disable()
+
+    def enable(self):
+        """ Replaces all grammar rules with instrumented versions of them. """
+        if self._originals is not None: return
+        self._originals = []
+        self._table_originals = []
+        wrappers = {}
+        for value in self._generator_rules():
+            wrappers[value] = self._instrument_generator(value)
+        modules = [importlib.import_module(name) for name in RULE_MODULES]
+        for module in modules:
+            for name, value in vars(module).items():
+                if not callable(value) or getattr(value, "__module__", None) not in RULE_MODULES:
+                    continue
+                if value not in wrappers and (name.startswith("parse_") or name.startswith("ensure_")):
+                    wrappers[value] = self._instrument(value)
+                if value in wrappers:
+                    self._originals.append((module, name, value))
+                    setattr(module, name, wrappers[value])
+            for name, table in vars(module).items():
+                if name.endswith("_RULES") and isinstance(table, dict):
+                    for key, value in table.items():
+                        if value in wrappers:
+                            self._table_originals.append((table, key, value))
+                            table[key] = wrappers[value]
+
+    def disable(self):
+        """ Restores the original grammar rules. """
+        for module, name, value in self._originals or []:
+            setattr(module, name, value)
+        for table, key, value in self._table_originals or []:
+            table[key] = value
+        self._originals = self._table_originals = None
+
+    def _generator_rules(self):
+        for module in [importlib.import_module(name) for name in GENERATOR_RULE_MODULES]:
+            for name, value in vars(module).items():
+                if callable(value) and getattr(value, "__module__", None) == module.__name__ and \
+                        name.startswith("iter_"):
+                    yield value
+
+    def _instrument(self, rule):
+        profiler = self
+        @functools.wraps(rule)
+        def instrumented(parser, *args, **kwargs):
+            return profiler._call(rule, parser, args, kwargs)
+        return instrumented
+
+    def _instrument_generator(self, rule):
+        profiler = self
+        @functools.wraps(rule)
+        def instrumented(parser, *args, **kwargs):
+            return profiler._iterate(rule, parser, rule(parser, *args, **kwargs))
+        return instrumented
+
+    def _call(self, rule, parser, args, kwargs):
+        call = self._enter(rule, parser)
+        try:
+            return rule(parser, *args, **kwargs)
+        finally:
+            self._exit(parser, call)
+
+    def _iterate(self, rule, parser, generator):
+        """ Steps through a rule generator (for exprs.run_rule) timing it till it yields its value. """
+        from onering.dsl.parser.rules.exprs import EXPR
+        call = self._enter(rule, parser)
+        try:
+            value = None
+            while True:
+                request = generator.send(value)
+                if request is not EXPR and type(request) is not GeneratorType:
+                    break
+                value = yield request
+        finally:
+            self._exit(parser, call)
+        yield request
+
+    def _enter(self, rule, parser):
+        key = (parser.lexer.source_uri, rule.__name__)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = RuleStats(rule.__name__, key[0])
+        stats.calls += 1
+        # Each frame is [child time, child tokens]
+        frame = [0.0, 0]
+        self._frames.append(frame)
+        self._active[key] = self._active.get(key, 0) + 1
+        return key, stats, frame, parser.tokens_consumed, time.time()
+
+    def _exit(self, parser, call):
+        key, stats, frame, start_tokens, start_time = call
+        elapsed, tokens = time.time() - start_time, parser.tokens_consumed - start_tokens
+        # Frames are popped in order unless a rule generator was abandoned (eg on an error)
+        index = len(self._frames) - 1
+        while self._frames[index] is not frame:
+            index -= 1
+        del self._frames[index]
+        self._active[key] -= 1
+        if self._active[key] == 0:
+            stats.inclusive += elapsed
+            stats.tokens += tokens
+        stats.exclusive += elapsed - frame[0]
+        stats.exclusive_tokens += tokens - frame[1]
+        if self._frames:
+            self._frames[-1][0] += elapsed
+            self._frames[-1][1] += tokens
+
+    def reset(self):
+        self.stats = {}
+
+    def report(self, by_source = True):
+        """
+        Returns the recorded stats as a list of dictionaries (with the keys rule, source,
+        calls, inclusive, exclusive, tokens and exclusive_tokens) ordered by decreasing
+        exclusive time.  If by_source is False the stats of each rule are summed over all
+        sources (and source is None).
+        """
+        stats = self.stats.values()
+        if not by_source:
+            totals = {}
+            for s in stats:
+                total = totals.get(s.rule)
+                if total is None:
+                    total = totals[s.rule] = RuleStats(s.rule, None)
+                total.calls += s.calls
+                total.inclusive += s.inclusive
+                total.exclusive += s.exclusive
+                total.tokens += s.tokens
+                total.exclusive_tokens += s.exclusive_tokens
+            stats = totals.values()
+        return [s.as_dict() for s in sorted(stats, key = lambda s: s.exclusive, reverse = True)]
+
+    def format_report(self, by_source = False, limit = None):
+        """ Returns the report (see report) as a printable table. """
+        lines = ["%-32s %10s %12s %12s %10s   %s" % ("Rule", "Calls", "Incl (ms)", "Excl (ms)", "Tokens", "Source")]
+        for entry in self.report(by_source)[:limit]:
+            lines.append("%-32s %10d %12.2f %12.2f %10d   %s" % (entry["rule"], entry["calls"],
+                                                              entry["inclusive"] * 1000, entry["exclusive"] * 1000,
+                                                              entry["tokens"], entry["source"] or ""))
+        return "\n".join(lines)
@@ -1,5 +1,5 @@
-
 from __future__ import absolute_import
+from types import GeneratorType
 from ipdb import set_trace
 from typecube import core as tccore
 from typecube import ext as tcext
@@ -9,19 +9,137 @@ from onering.dsl.parser.rules.types import ensure_typeexpr
 from onering.dsl.lexer import Token, TokenType
 from onering.dsl.parser.rules.annotations import parse_annotations
 
+########################################################################
+##          Expression parsing
+##
+##  Expressions nest arbitrarily deep (eg in generated transformers) so
+##  instead of the rules calling each other recursively, each compound
+##  rule is a generator that yields:
+##
+##      EXPR            -   to have the next expression parsed and sent
+##                          back to it,
+##      a generator     -   to have a sub rule run and its value sent back,
+##      anything else   -   as its own (final) value.
+##
+##  and run_rule runs them with an explicit stack.  Which rule an
+##  expression starts with is picked by its first token (see PREFIX_RULES).
+########################################################################
+
+EXPR = object()
+
+def run_rule(parser, rule):
+    """ Runs a rule generator (and all the rules it yields) and returns its value. """
+    stack = [rule]
+    value = None
+    while True:
+        request = stack[-1].send(value)
+        if request is EXPR:
+            request = parse_prefix(parser)
+            if type(request) is not GeneratorType:
+                value = request
+                continue
+        if type(request) is GeneratorType:
+            stack.append(request)
+            value = None
+        else:
+            stack.pop()
+            if not stack:
+                return request
+            value = request
+
+def parse_prefix(parser):
+    """
+    Starts parsing an expression based on its first token and returns either the
+    parsed expression (for expressions that do not nest) or the rule generator to
+    parse the rest of it with.
+    """
+    # Move past any comments and directives first
+    parser.peeked_token_is(TokenType.EOS)
+    tok_type = parser.peek_token().tok_type
+    if tok_type == TokenType.IDENTIFIER and parser.peeked_token_is(TokenType.IDENTIFIER, "if"):
+        return iter_if_expr(parser)
+    prefix_rule = PREFIX_RULES.get(tok_type)
+    if prefix_rule is None:
+        raise errors.UnexpectedTokenException(parser.peek_token(),
+                                       TokenType.STRING, TokenType.NUMBER,
+                                       TokenType.OPEN_BRACE, TokenType.OPEN_SQUARE,
+                                       TokenType.LT)
+    return prefix_rule(parser)
+
+def parse_number(parser):
+    value = parser.next_token().value
+    if type(value) is int:
+        vtype = tcext.IntType
+    elif type(value) is long:
+        vtype = tcext.LongType
+    elif type(value) is float:
+        vtype = tcext.DoubleType
+    else:
+        assert False
+    return tccore.Literal(value, vtype)
+
+def parse_string(parser):
+    return tccore.Literal(parser.next_token().value, tcext.StringType)
+
+def parse_name_expr(parser):
+    """
+    Parses a variable or an index chain optionally followed by type args and/or
+    call args.  Returns the rule generator for the call args if there are any.
+
+        name_expr := index_expr ( "<" typeexpr ( "," typeexpr ) * ">" ) ? ( "(" expr * ")" ) ?
+    """
+    # See if we have a variable or an index chain expression
+    out = parse_index_expr(parser)
+
+    # check if we have a function call and also check if function call
+    # is a call to a function of a generic function type!
+    if parser.next_token_is(parser.GENERIC_OPEN_TOKEN):
+        func_param_exprs = [ ensure_typeexpr(parser) ]
+        while not parser.peeked_token_is(parser.GENERIC_CLOSE_TOKEN):
+            parser.ensure_token(TokenType.COMMA)
+            func_param_exprs.append(ensure_typeexpr(parser))
+        parser.ensure_token(parser.GENERIC_CLOSE_TOKEN)
+
+        # Yep we have a type func being instantiated so
+        # dont forget to return a func_app whose function is a type_app!
+        out = tccore.QuantApp(out, *func_param_exprs)
+
+    if parser.next_token_if(TokenType.OPEN_PAREN, consume = True):
+        return iter_fun_app(parser, out)
+    return out
+
+def iter_fun_app(parser, function):
+    """ Parses the args of a function call after the opening "(". """
+    func_args = []
+    while not parser.peeked_token_is(TokenType.CLOSE_PAREN):
+        # read another expr
+        expr = yield EXPR
+        func_args.append(expr)
+        if parser.next_token_is(TokenType.COMMA):
+            # TODO: ensure next val is an IDENTIFIER or a literal value
+            # Right now lack of this check wont break anything but
+            # will allow "," at the end which is a bit, well rough!
+            pass
+    parser.ensure_token(TokenType.CLOSE_PAREN)
+    yield tccore.FunApp(function, *func_args)
+
 def parse_expr_list(parser):
     """ Parses a statement block.
 
     expr_list := "{" expr * "}"
 
     """
+    return run_rule(parser, iter_expr_list(parser))
+
+def iter_expr_list(parser):
     out = tcext.ExprList()
     parser.ensure_token(TokenType.OPEN_BRACE)
     while not parser.peeked_token_is(TokenType.CLOSE_BRACE):
-        out.add(parse_statement(parser))
+        statement = yield iter_statement(parser)
+        out.add(statement)
     parser.ensure_token(TokenType.CLOSE_BRACE)
     parser.consume_tokens(TokenType.SEMI_COLON)
-    return out
+    yield out
 
 def parse_statement(parser):
     """
@@ -35,12 +153,15 @@ def parse_statement(parser):
 
         stream_expr := expr ( => expr ) * => expr
     """
+    return run_rule(parser, iter_statement(parser))
+
+def iter_statement(parser):
     annotations = parse_annotations(parser)
 
     is_temporary = parser.next_token_is(TokenType.IDENTIFIER, "let")
-    expr = parse_expr(parser)
+    expr = yield EXPR
     parser.ensure_token(TokenType.STREAM)
-    target = parse_expr(parser)
+    target = yield EXPR
 
     parser.consume_tokens(TokenType.SEMI_COLON)
 
@@ -49,9 +170,9 @@ def parse_statement(parser):
         raise errors.OneringException("Final target of an expr MUST be a variable or an index expression")
 
     if target.isa(tccore.Var) and target.name == '_':
-        return expr
+        yield expr
     else:
-        return tcext.Assignment(target, expr, is_temporary)
+        yield tcext.Assignment(target, expr, is_temporary)
 
 def parse_expr(parser):
     """ Parse a function call expr or a literal.
@@ -67,90 +188,40 @@ def parse_expr(parser):
                 func_fqn "(" ")"
                 func_fqn "(" expr ( "," expr ) * ")"
     """
-    out = None
-    if parser.peeked_token_is(TokenType.NUMBER):
-        value = parser.next_token().value
-        if type(value) is int:
-            vtype = tcext.IntType
-        elif type(value) is long:
-            vtype = tcext.LongType
-        elif type(value) is float:
-            vtype = tcext.DoubleType
-        else:
-            assert False
-        out = tccore.Literal(value, vtype)
-    elif parser.peeked_token_is(TokenType.STRING):
-        out = tccore.Literal(parser.next_token().value, tcext.StringType)
-    elif parser.peeked_token_is(TokenType.OPEN_SQUARE):
-        # Read a list
-        out = parse_list_expr(parser)
-    elif parser.peeked_token_is(TokenType.OPEN_BRACE):
-        out = parse_expr_list(parser)
-    elif parser.peeked_token_is(TokenType.OPEN_PAREN):
-        out = parse_tuple_expr(parser)
-    elif parser.peeked_token_is(TokenType.IDENTIFIER, "if"):
-        out = parse_if_expr(parser)
-    elif parser.peeked_token_is(TokenType.IDENTIFIER):
-        # See if we have a variable or an index chain expression
-        out = parse_index_expr(parser)
-
-        # check if we have a function call and also check if function call
-        # is a call to a function of a generic function type!
-        func_param_exprs = []
-        if parser.next_token_is(parser.GENERIC_OPEN_TOKEN):
-            func_param_exprs = [ ensure_typeexpr(parser) ]
-            while not parser.peeked_token_is(parser.GENERIC_CLOSE_TOKEN):
-                parser.ensure_token(TokenType.COMMA)
-                func_param_exprs.append(ensure_typeexpr(parser))
-            parser.ensure_token(parser.GENERIC_CLOSE_TOKEN)
-
-            # Yep we have a type func being instantiated so
-            # dont forget to return a func_app whose function is a type_app!
-            out = tccore.QuantApp(out, *func_param_exprs)
-
-        func_args = []
-        if parser.next_token_if(TokenType.OPEN_PAREN, consume = True):
-            while not parser.peeked_token_is(TokenType.CLOSE_PAREN):
-                # read another expr
-                expr = parse_expr(parser)
-                func_args.append(expr)
-                if parser.next_token_is(TokenType.COMMA):
-                    # TODO: ensure next val is an IDENTIFIER or a literal value
-                    # Right now lack of this check wont break anything but 
-                    # will allow "," at the end which is a bit, well rough!
-                    pass
-            parser.ensure_token(TokenType.CLOSE_PAREN)
-            out = tccore.FunApp(out, *func_args)
-    else:
-        raise errors.UnexpectedTokenException(parser.peek_token(),
-                                       TokenType.STRING, TokenType.NUMBER,
-                                       TokenType.OPEN_BRACE, TokenType.OPEN_SQUARE,
-                                       TokenType.LT)
+    out = parse_prefix(parser)
+    if type(out) is GeneratorType:
+        out = run_rule(parser, out)
     return out
 
 def parse_tuple_expr(parser):
+    return run_rule(parser, iter_tuple_expr(parser))
+
+def iter_tuple_expr(parser):
     parser.ensure_token(TokenType.OPEN_PAREN)
     exprs = []
     if not parser.next_token_is(TokenType.CLOSE_PAREN):
-        expr = parse_expr(parser)
+        expr = yield EXPR
         exprs = [expr]
         while parser.next_token_is(TokenType.COMMA):
-            expr = parse_expr(parser)
+            expr = yield EXPR
             exprs.append(expr)
         parser.ensure_token(TokenType.CLOSE_PAREN)
-    return tcext.TupleExpr(exprs)
+    yield tcext.TupleExpr(exprs)
 
 def parse_list_expr(parser):
+    return run_rule(parser, iter_list_expr(parser))
+
+def iter_list_expr(parser):
     parser.ensure_token(TokenType.OPEN_SQUARE)
     exprs = []
     if not parser.next_token_is(TokenType.CLOSE_PAREN):
-        expr = parse_expr(parser)
+        expr = yield EXPR
         exprs = [expr]
         while parser.next_token_is(TokenType.COMMA):
-            expr = parse_expr(parser)
+            expr = yield EXPR
             exprs.append(expr)
         parser.ensure_token(TokenType.CLOSE_SQUARE)
-    return tcext.ListExpr(exprs)
+    yield tcext.ListExpr(exprs)
 
 def parse_index_expr(parser):
     """ Parse a field chain indexing expression:
@@ -169,25 +240,40 @@ def parse_if_expr(parser):
         "if" condition statement_block
         ( "elif" condition statement_block ) *
         ( "else" statement_block ) ?
-    Parse an expr chain of the form 
+    Parse an expr chain of the form
 
         expr => expr => expr => expr
     """
+    return run_rule(parser, iter_if_expr(parser))
+
+def iter_if_expr(parser):
     parser.ensure_token(TokenType.IDENTIFIER, "if")
     conditions = []
-    condition = parse_expr(parser)
-    body = parse_expr_list(parser)
+    condition = yield EXPR
+    body = yield iter_expr_list(parser)
     conditions.append((condition, body))
     default_expr = None
 
     while True:
         if parser.next_token_is(TokenType.IDENTIFIER, "elif"):
-            condition = parse_expr(parser)
-            body = parse_expr_list(parser)
+            condition = yield EXPR
+            body = yield iter_expr_list(parser)
             conditions.append((condition, body))
         elif parser.next_token_is(TokenType.IDENTIFIER, "else"):
-            default_expr = parse_expr_list(parser)
+            default_expr = yield iter_expr_list(parser)
         else:
             break
 
-    return tcext.IfExpr(conditions, default_expr)
+    yield tcext.IfExpr(conditions, default_expr)
+
+"""
+The rule an expression is parsed with given the type of its first token.
+"""
+PREFIX_RULES = {
+    TokenType.NUMBER: parse_number,
+    TokenType.STRING: parse_string,
+    TokenType.OPEN_SQUARE: iter_list_expr,
+    TokenType.OPEN_BRACE: iter_expr_list,
+    TokenType.OPEN_PAREN: iter_tuple_expr,
+    TokenType.IDENTIFIER: parse_name_expr,
+}
@@ -34,17 +34,26 @@ def parse_function(parser, is_external, annotations, **kwargs):
     fun_type = tccore.make_fun_type(None, input_types, output_type)
     fun_expr = None
     if not is_external:
-        from onering.dsl.parser.rules.exprs import parse_expr
-        fun_expr = parse_expr(parser)
+        if parser.defer_function_bodies and hasattr(parser.lexer, "span_lexer") and \
+                parser.peeked_token_is(TokenType.OPEN_BRACE):
+            from onering.dsl.parser.deferred import skip_expr_list
+            fun_expr = skip_expr_list(parser)
+        else:
+            from onering.dsl.parser.rules.exprs import parse_expr
+            fun_expr = parse_expr(parser)
     function = tccore.Fun(input_params, fun_expr, func_fqn, fun_type).set_annotations(annotations).set_docs(docs)
     function.return_param = output_param
+    from onering.dsl.parser.deferred import DeferredExpr
+    if isinstance(fun_expr, DeferredExpr):
+        # A deferred body replaces itself with its parse in the function
+        fun_expr.function = function
 
     if type_params:
         function.fqn = None
         function = tccore.Quant(type_params, function, func_fqn).set_annotations(annotations).set_docs(docs)
 
     parser.add_entity(func_name, function)
-    parser.onering_context.fgraph.register(function)
+    parser.register_function(function)
     return function
 
 def parse_function_signature(parser, require_param_name = True):
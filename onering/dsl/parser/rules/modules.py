@@ -20,27 +20,54 @@ from onering.utils.misc import FQN
 
 def parse_module(parser, annotations, **kwargs):
     """ Parses a module definition and returns `Module` instance. """
+    for module in iter_module(parser, annotations):
+        pass
+    return module
+
+def iter_module(parser, annotations):
+    """
+    Parses a module definition as a generator that yields the module after each
+    declaration in it (see iter_module_body).
+    """
     parser.ensure_token(TokenType.IDENTIFIER, "module")
     last_module = parser.current_module.fqn or ""
     fqn = parser.ensure_fqn()
     if last_module: fqn = last_module + "." + fqn
     global_module = parser.onering_context.global_module
-    module = parser.current_module = global_module.ensure_module(fqn).set_annotations(annotations).set_docs(parser.last_docstring())
+    module = parser.current_module = parser.add_module(fqn, annotations, parser.last_docstring())
     parser.ensure_token(TokenType.OPEN_BRACE)
-    parse_module_body(parser, module)
+    for _ in iter_module_body(parser, module):
+        yield module
     parser.ensure_token(TokenType.CLOSE_BRACE)
     if last_module:
         parser.current_module = global_module.get(last_module)
     else:
         parser.current_module = global_module
-    return module
+    yield module
 
 def parse_module_body(parser, module):
     """ Parses the body of a module. """
-    while parse_declaration(parser, module):
+    for _ in iter_module_body(parser, module):
         pass
     return module
 
+def iter_module_body(parser, module):
+    """
+    Parses the body of a module as a generator that yields after each declaration
+    in it (including those in nested modules) has been parsed.
+    """
+    while True:
+        next = parser.peek_token()
+        if next.tok_type == TokenType.IDENTIFIER and next.value == "module" and \
+                parser.get_entity_parser("module") is parse_module:
+            # Step into nested modules instead of parsing them in one go
+            for _ in iter_module(parser, parse_annotations(parser)):
+                yield module
+            parser.consume_tokens(TokenType.SEMI_COLON)
+        elif not parse_declaration(parser, module):
+            break
+        yield module
+
 def parse_declaration(parser, module):
     """
     Parse the declarations for the current document:
@@ -72,5 +99,5 @@ def parse_import(parser):
     if parser.next_token_is(TokenType.IDENTIFIER, "as"):
         # we also have an alias for the import
         alias = parser.ensure_token(TokenType.IDENTIFIER)
-    parser.current_module.set_alias(alias, fqn)
+    parser.add_alias(alias, fqn)
     return fqn
@@ -62,22 +62,47 @@ def parse_type_initializer_or_name(parser, annotations):
     Parses a parametric type:
 
         type_name ( "<" args ">" ) ?
+
+    Type args that are type names or parametric types themselves are parsed with an 
+    explicit stack instead of recursively so arbitrarily nested types can be parsed.
     """
     if not parser.peeked_token_is(TokenType.IDENTIFIER):
         set_trace()
         return None
-    fqn = parser.ensure_fqn()
-
-    if parser.next_token_is(parser.GENERIC_OPEN_TOKEN):
-        child_typeexprs = [ ensure_typeexpr(parser) ]
-        while not parser.peeked_token_is(parser.GENERIC_CLOSE_TOKEN):
-            parser.ensure_token(TokenType.COMMA)
-            child_typeexprs.append(ensure_typeexpr(parser))
-        parser.ensure_token(parser.GENERIC_CLOSE_TOKEN)
-        return tccore.make_type_app(fqn, *child_typeexprs)
-
-    # Otherwise we just have a type reference
-    return tccore.make_type_var(fqn)
+
+    # The fqn and the type args parsed so far of each type application being parsed
+    stack = []
+    while True:
+        if stack and not is_type_name_next(parser):
+            # Inline or annotated types are parsed by their own rules
+            out = ensure_typeexpr(parser)
+        else:
+            fqn = parser.ensure_fqn()
+            if parser.next_token_is(parser.GENERIC_OPEN_TOKEN):
+                stack.append((fqn, []))
+                continue
+            # Otherwise we just have a type reference
+            out = tccore.make_type_var(fqn)
+
+        # Close all the type applications that this completes
+        while stack:
+            fqn, child_typeexprs = stack[-1]
+            child_typeexprs.append(out)
+            if not parser.peeked_token_is(parser.GENERIC_CLOSE_TOKEN):
+                parser.ensure_token(TokenType.COMMA)
+                break
+            parser.ensure_token(parser.GENERIC_CLOSE_TOKEN)
+            stack.pop()
+            out = tccore.make_type_app(fqn, *child_typeexprs)
+        if not stack:
+            return out
+
+def is_type_name_next(parser):
+    """ Tells if the next type expression is a plain (possibly parametric) type name. """
+    if not parser.peeked_token_is(TokenType.IDENTIFIER):
+        return False
+    keyword = parser.peek_token().value
+    return keyword != "extern" and not parser.get_entity_parser(keyword)
 
 def parse_typefunc_preamble(parser, name_required = False, allow_generics = True):
     name = None
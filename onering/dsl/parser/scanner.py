@@ -0,0 +1,76 @@
+
+from __future__ import absolute_import
+from onering.dsl.lexer import TokenType
+
+"""
+Tokens after which a declaration keyword is part of a type expression (eg "alias A = record B { ... }")
+and does not start a declaration.
+"""
+NON_DECLARATION_PRECEDERS = set([TokenType.EQUALS, TokenType.COLON, TokenType.COMMA, TokenType.LT,
+                                 TokenType.DOT, TokenType.ARROW, TokenType.STREAM])
+
+OPENING_TOKENS = set([TokenType.OPEN_BRACE, TokenType.OPEN_PAREN, TokenType.OPEN_SQUARE])
+CLOSING_TOKENS = set([TokenType.CLOSE_BRACE, TokenType.CLOSE_PAREN, TokenType.CLOSE_SQUARE])
+
+def scan_declarations(parser):
+    """
+    Finds the FQNs of the entities and the modules declared in a source by only matching
+    brackets and looking at declaration keywords (the keywords of the parser's entity
+    parsers) instead of parsing the source.  Nothing is registered with the context.
+
+    Returns the list of entity FQNs and the list of module FQNs (in declaration order).
+    """
+    keywords = set(keyword for keyword in parser._entity_parsers if keyword not in ("module", "funi"))
+    root_fqn = parser.root_module.fqn or ""
+    # Stack of (module fqn, bracket depth of the module's body)
+    modules = [(root_fqn, 0)]
+    entities, module_fqns = [], []
+    depth = 0
+    prev_type = None
+    # The keyword of the declaration whose name is expected next and the parts of a module name
+    pending_keyword, module_name = None, None
+    while True:
+        token = parser.next_token()
+        tok_type = token.tok_type
+        if tok_type == TokenType.EOS:
+            break
+        if tok_type in (TokenType.COMMENT, TokenType.HASH):
+            continue
+
+        if module_name is not None:
+            # Reading the name of a module upto its body
+            if tok_type == TokenType.IDENTIFIER or tok_type == TokenType.DOT:
+                if tok_type == TokenType.IDENTIFIER:
+                    module_name.append(token.value)
+                prev_type = tok_type
+                continue
+            if tok_type == TokenType.OPEN_BRACE and module_name:
+                fqn = ".".join(module_name)
+                if modules[-1][0]: fqn = modules[-1][0] + "." + fqn
+                depth += 1
+                modules.append((fqn, depth))
+                module_fqns.append(fqn)
+                module_name = None
+                prev_type = tok_type
+                continue
+            module_name = None
+        elif pending_keyword is not None:
+            if tok_type == TokenType.IDENTIFIER:
+                module_fqn = modules[-1][0]
+                entities.append(module_fqn + "." + token.value if module_fqn else token.value)
+            pending_keyword = None
+
+        if tok_type in OPENING_TOKENS:
+            depth += 1
+        elif tok_type in CLOSING_TOKENS:
+            depth -= 1
+            if tok_type == TokenType.CLOSE_BRACE and len(modules) > 1 and depth < modules[-1][1]:
+                modules.pop()
+        elif tok_type == TokenType.IDENTIFIER and depth == modules[-1][1] and \
+                prev_type not in NON_DECLARATION_PRECEDERS:
+            if token.value == "module":
+                module_name = []
+            elif token.value in keywords:
+                pending_keyword = token.value
+        prev_type = tok_type
+    return entities, module_fqns
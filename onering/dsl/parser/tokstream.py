@@ -1,5 +1,5 @@
 import ipdb
-from onering.dsl.lexer import Token, TokenType
+from onering.dsl.lexer import BaseToken, Token, TokenType
 from onering.dsl.errors import UnexpectedTokenException
 
 class TokenStream(object):
@@ -10,6 +10,8 @@ class TokenStream(object):
     def __init__(self, lexer):
         self.peeked_tokens = []
         self.lexer = lexer
+        # Number of tokens consumed (and not put back) so far
+        self.tokens_consumed = 0
 
     @property
     def line(self):
@@ -20,8 +22,9 @@ class TokenStream(object):
         return self.lexer.column
 
     def unget_token(self, token):
-        assert type(token) is Token
+        assert isinstance(token, BaseToken)
         self.peeked_tokens.append(token)
+        self.tokens_consumed -= 1
 
     def peek_token(self):
         return self.next_token(True)
@@ -33,6 +36,7 @@ class TokenStream(object):
             out = self.peeked_tokens[-1]
             if not peek:
                 self.peeked_tokens.pop()
+                self.tokens_consumed += 1
             return out
         except StopIteration, si:
             # we are done
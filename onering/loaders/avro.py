@@ -0,0 +1,285 @@
+from __future__ import absolute_import
+import os
+import json
+import collections
+import multiprocessing
+from typecube import core as tccore
+from typecube import ext as tcext
+from typecube import errors
+
+"""
+Types of the avro primitive types.
+"""
+PRIMITIVE_TYPES = {
+    "null": tccore.VoidType,
+    "boolean": tcext.BooleanType,
+    "int": tcext.IntType,
+    "long": tcext.LongType,
+    "float": tcext.FloatType,
+    "double": tcext.DoubleType,
+    "bytes": tcext.ByteType,
+    "string": tcext.StringType,
+}
+
+""" Kinds of schemas that are named (and can be referred to by name). """
+NAMED_KINDS = frozenset(["record", "error", "enum", "fixed"])
+
+def split_name(name, namespace = ""):
+    """ Returns the (name, namespace, fullname) of a name declared or referred to in a namespace. """
+    if "." in name:
+        namespace, _, name = name.rpartition(".")
+    fullname = namespace + "." + name if namespace else name
+    return name, namespace, fullname
+
+class Registry(object):
+    """
+    The named avro schemas (decoded but not necessarily loaded as types) known to a
+    context by their full names.  It is shared by all avro loaders of a context so each
+    schema is decoded once no matter how many schemas (or files) refer to it, and names
+    that are not known are resolved in batches (through the context's entity resolver).
+    """
+    def __init__(self, context):
+        self.context = context
+        # fullname -> (schema, namespace it was declared in)
+        self.schemas = {}
+        # fullname -> list of (name, namespace) of the named types its schema refers to
+        self.references = {}
+
+    @classmethod
+    def of(cls, context):
+        """ Returns the registry of a context (creating it if needed). """
+        if context.avro_registry is None:
+            context.avro_registry = cls(context)
+        return context.avro_registry
+
+    def __contains__(self, fullname):
+        return fullname in self.schemas
+
+    def get(self, fullname):
+        return self.schemas.get(fullname)
+
+    def add(self, schema_data, namespace = ""):
+        """
+        Adds all the named schemas declared in a schema (or a list of schemas, eg a schema
+        bundle) including the ones nested in it and returns their full names in the order
+        they are declared.
+        """
+        declared = []
+        # Each entry is (schema, namespace, fullname of the named schema it is in)
+        pending = [(schema_data, namespace, None)]
+        while pending:
+            data, namespace, owner = pending.pop()
+            if type(data) in (str, unicode):
+                if data not in PRIMITIVE_TYPES and owner is not None:
+                    self.references[owner].append((data, namespace))
+            elif isinstance(data, list):
+                pending.extend((item, namespace, owner) for item in reversed(data))
+            elif isinstance(data, dict):
+                kind = data.get("type")
+                if kind in NAMED_KINDS:
+                    name, namespace, owner = split_name(data["name"], data.get("namespace", namespace))
+                    self.schemas[owner] = (data, namespace)
+                    self.references[owner] = []
+                    declared.append(owner)
+                    children = [field.get("type") for field in data.get("fields", [])]
+                elif kind == "array":
+                    children = [data.get("items")]
+                elif kind == "map":
+                    children = [data.get("values")]
+                else:
+                    # A primitive type with attributes (eg logical types)
+                    children = [kind]
+                pending.extend((child, namespace, owner) for child in reversed(children))
+        return declared
+
+    def fullname(self, name, namespace = ""):
+        """
+        Returns the full name a name refers to in a namespace, ie the name in the namespace
+        if such a schema (or type) exists or else the name itself.
+        """
+        name, namespace, fullname = split_name(name, namespace)
+        if fullname in self.schemas or fullname == name:
+            return fullname
+        if name in self.schemas or self.context.global_module.find_fqn(name):
+            return name
+        return fullname
+
+    def resolve_missing(self, fullnames):
+        """
+        Resolves (through the context's entity resolver) the schemas that are referred to
+        by the schemas with the given full names (and by the schemas they refer to) but are
+        not known or loaded yet.  Returns the full names of the schemas that were added.
+        """
+        global_module = self.context.global_module
+        added = []
+        pending = list(fullnames)
+        while pending:
+            missing = set()
+            for owner in pending:
+                for name, namespace in self.references.get(owner, []):
+                    fullname = self.fullname(name, namespace)
+                    if fullname not in self.schemas and not global_module.find_fqn(fullname):
+                        missing.add(fullname)
+            resolved = self.context.entity_resolver.resolve_many(missing, "avsc") if missing else {}
+            pending = []
+            for fullname in sorted(resolved.keys()):
+                pending.extend(self.add(resolved[fullname], split_name(fullname)[1]))
+            added.extend(pending)
+        return added
+
+class Loader(object):
+    """ Takes care of loading avro schemas. """
+    def __init__(self, context, *args, **kwargs):
+        """ Instantiates a new avro schema loader.
+
+        Arguments:
+            List of entries (with the "dir" and the "files" wildcard) of schemas to be loaded.
+
+        Keyword Arguments:
+            workers     -   Number of processes schema files are read and decoded in
+                            (defaults to the context's parse_workers).
+        """
+        self.context = context
+        self.entries = list(args)
+        self.workers = kwargs.get("workers") or context.parse_workers or 1
+        self.registry = Registry.of(context)
+        self.found_entities = {}
+        # Full name -> path of the file each named type loaded from the files given to load_paths is declared in
+        self.entity_paths = {}
+        # Full names of the named types referred to that are still to be loaded
+        self._pending = collections.deque()
+
+    def load(self):
+        """
+        Loads all types in the files matching the entries.
+        """
+        paths = []
+        for entry in self.entries:
+            entry_dir = entry["dir"]
+            entry_files = entry["files"]
+            paths.extend(self.context.fs_index.match(os.path.join(self.context.curdir, entry_dir), entry_files))
+        return self.load_paths(paths)
+
+    def load_paths(self, paths):
+        """
+        Loads all types in the given files.  All files are decoded first (in self.workers
+        processes) and added to the registry, the names they refer to that are not in
+        them are resolved in batches and then all the named types are created in one go.
+        """
+        if self.workers > 1 and len(paths) > 1:
+            pool = multiprocessing.Pool(min(self.workers, len(paths)))
+            try:
+                decoded = pool.map(decode_file, paths)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            decoded = map(decode_file, paths)
+
+        declared = []
+        for path, schema_data in zip(paths, decoded):
+            print("Reading schemas from: %s" % path)
+            added = self.registry.add(schema_data)
+            for fullname in added:
+                self.entity_paths[fullname] = path
+            declared.extend(added)
+        self.registry.resolve_missing(declared)
+
+        self._pending.extend(declared)
+        while self._pending:
+            self.load_by_name(self._pending.popleft())
+        return self.found_entities
+
+    def load_by_name(self, fullname):
+        """ Returns the type with the given full name loading it (from the registry or a resolver) if needed. """
+        typeexpr = self.context.global_module.find_fqn(fullname)
+        if typeexpr:
+            return typeexpr
+        if fullname not in self.registry:
+            schema_data = self.context.entity_resolver.resolve_schema(fullname, "avsc")
+            if not schema_data:
+                raise errors.TypesNotFoundException(fullname)
+            self.registry.add(schema_data, split_name(fullname)[1])
+            if fullname not in self.registry:
+                raise errors.TypesNotFoundException(fullname)
+        schema_data, namespace = self.registry.get(fullname)
+        return self.create_named_type(schema_data, namespace)
+
+    def load_from_data(self, schema_data, namespace = ""):
+        """
+        Returns the type expression of a schema.  Named types are referred to (and loaded
+        later if they are not loaded yet) instead of being loaded here.
+        """
+        if type(schema_data) in (str, unicode):
+            if schema_data in PRIMITIVE_TYPES:
+                return tccore.make_ref(PRIMITIVE_TYPES[schema_data].fqn)
+            fullname = self.registry.fullname(schema_data, namespace)
+            if not self.context.global_module.find_fqn(fullname):
+                self._pending.append(fullname)
+            return tccore.make_ref(fullname)
+        elif isinstance(schema_data, list):
+            return self.union_type(schema_data, namespace)
+        elif not isinstance(schema_data, dict):
+            raise errors.TLException("schema_data can only be a string, list or a dictionary")
+
+        kind = schema_data.get("type")
+        if kind in NAMED_KINDS:
+            name, namespace, fullname = split_name(schema_data["name"], schema_data.get("namespace", namespace))
+            self._pending.append(fullname)
+            return tccore.make_ref(fullname)
+        elif kind == "array":
+            return tccore.make_type_app("list", self.load_from_data(schema_data["items"], namespace))
+        elif kind == "map":
+            return tccore.make_type_app("map", tccore.make_ref(tcext.StringType.fqn),
+                                        self.load_from_data(schema_data["values"], namespace))
+        else:
+            # Primitive types with attributes (eg logical types)
+            return self.load_from_data(kind, namespace)
+
+    def create_named_type(self, schema_data, namespace):
+        """ Creates a named type (record, error, enum or fixed) and registers it in its module. """
+        kind = schema_data["type"]
+        name, namespace, fullname = split_name(schema_data["name"], schema_data.get("namespace", namespace))
+        if kind in ("record", "error"):
+            newtype = self.record_type(fullname, schema_data, namespace)
+        elif kind == "enum":
+            symbols = [(symbol, index, None, "") for index, symbol in enumerate(schema_data["symbols"])]
+            newtype = tccore.make_enum_type(fullname, symbols, None, None, schema_data.get("doc", ""))
+        else:
+            # A fixed is a named alias of bytes (of the given size)
+            newtype = tccore.make_alias(fullname, tccore.make_ref(tcext.ByteType.fqn), None)
+            newtype.size = schema_data["size"]
+        newtype.docs = schema_data.get("doc", "")
+
+        module = self.context.global_module.ensure_module(namespace) if namespace else self.context.global_module
+        newtype.parent = module
+        module.add(name, newtype)
+        self.found_entities[fullname] = newtype
+        return newtype
+
+    def record_type(self, fullname, schema_data, namespace):
+        typeargs = []
+        for field_dict in schema_data.get("fields", []):
+            field_type = field_dict.get("type", None)
+            if field_type is None:
+                raise errors.TLException("Field must either have a type")
+            # Unions with null are optional fields
+            is_optional = isinstance(field_type, list) and "null" in field_type
+            if is_optional:
+                field_type = [t for t in field_type if t != "null"]
+                if len(field_type) == 1:
+                    field_type = field_type[0]
+            typeargs.append(tccore.TypeArg(field_dict["name"], self.load_from_data(field_type, namespace), is_optional,
+                                           field_dict.get("default", None), None, field_dict.get("doc", "")))
+        return tccore.make_product_type("record", fullname, typeargs, None)
+
+    def union_type(self, schema_data, namespace):
+        typeargs = [tccore.TypeArg(None, self.load_from_data(data, namespace)) for data in schema_data]
+        return tccore.make_sum_type("union", None, typeargs, None)
+
+def decode_file(path):
+    """ Reads and decodes an avro schema file. """
+    with open(path) as f:
+        schema_data = json.load(f)
+    assert schema_data is not None, "Contents ?"
+    return schema_data
@@ -0,0 +1,205 @@
+
+from __future__ import absolute_import
+import os
+import json
+import base64
+import Queue
+import socket
+import hashlib
+import httplib
+import urlparse
+import threading
+from multiprocessing.pool import ThreadPool
+from onering.loaders.resolver import SchemaResolver
+
+class ConnectionPool(object):
+    """ A pool of keep-alive HTTP connections to a single host. """
+    def __init__(self, url, size = 4, timeout = 10):
+        parts = urlparse.urlparse(url)
+        self.connection_class = httplib.HTTPSConnection if parts.scheme == "https" else httplib.HTTPConnection
+        self.host = parts.netloc
+        self.timeout = timeout
+        self._idle = Queue.LifoQueue(size)
+
+    def request(self, method, path, headers = None):
+        """ Makes a request (retrying once on a stale connection) and returns (status, headers, body). """
+        for attempt in (0, 1):
+            try:
+                conn = self._idle.get_nowait()
+                reused = True
+            except Queue.Empty:
+                conn = self.connection_class(self.host, timeout = self.timeout)
+                reused = False
+            try:
+                conn.request(method, path, headers = headers or {})
+                response = conn.getresponse()
+                body = response.read()
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                # Idle connections may have been closed by the server
+                if reused and attempt == 0:
+                    continue
+                raise
+            if response.getheader("connection", "").lower() == "close":
+                conn.close()
+            else:
+                try:
+                    self._idle.put_nowait(conn)
+                except Queue.Full:
+                    conn.close()
+            return response.status, dict(response.getheaders()), body
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Queue.Empty:
+                return
+
+class HttpEntityResolver(SchemaResolver):
+    """
+    Resolves schemas from an HTTP schema registry where the schema of type T for an FQN
+    is at <url>/<fqn>.<T> (a 404 meaning there is no such schema).
+
+    Requests are made over a pool of keep-alive connections and the schemas of several
+    FQNs are fetched concurrently (by up to workers threads).  If a cache_dir is given,
+    fetched schemas are saved there with their ETags so they are only downloaded again
+    when they change, and are used as they are when the registry cannot be reached (or
+    if offline is True).  Once the registry could not be reached no more requests are
+    made (till invalidate is called).
+    """
+    def __init__(self, url, cache_dir = None, workers = 4, timeout = 10, offline = False):
+        self.url = url.rstrip("/")
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.offline = offline
+        self.pool = ConnectionPool(self.url, workers, timeout)
+        self.base_path = urlparse.urlparse(self.url).path
+        # location -> (etag, body) of the schemas fetched (or read from the cache)
+        self._fetched = {}
+        self._lock = threading.Lock()
+        # Set when the registry could not be reached
+        self.unreachable = False
+        # Bumped by invalidate so schemas cached (in a SchemaCache) before are validated again
+        self.generation = 0
+
+    def __repr__(self):
+        return "Http<%s>" % self.url
+
+    def __eq__(self, another):
+        return type(another) == type(self) and self.url == another.url
+
+    def __str__(self):
+        return self.url
+
+    def locate(self, fully_qualified_name, *schema_types):
+        """ Returns the location (<fqn>.<type>) of the schema for a FQN or None if there is none. """
+        for schema_type in schema_types or ["pdsc"]:
+            location = fully_qualified_name + "." + schema_type
+            if self.fetch(location) is not None:
+                return location
+        return None
+
+    def locate_many(self, fqns, *schema_types):
+        """ Locates the schemas of several FQNs with concurrent requests. """
+        fqns = list(fqns)
+        if self.workers <= 1 or len(fqns) <= 1:
+            return SchemaResolver.locate_many(self, fqns, *schema_types)
+        threads = ThreadPool(min(self.workers, len(fqns)))
+        try:
+            locations = threads.map(lambda fqn: self.locate(fqn, *schema_types), fqns)
+        finally:
+            threads.close()
+            threads.join()
+        return dict((fqn, location) for fqn, location in zip(fqns, locations) if location is not None)
+
+    def load(self, location):
+        """ Returns the schema at a location returned by locate. """
+        fetched = self.fetch(location)
+        return json.loads(fetched[1]) if fetched is not None else None
+
+    def cache_key(self, location):
+        """
+        Schemas are cached by location (without a request) till invalidate is called and
+        are only validated against the registry (by their ETags) when they are loaded.
+        """
+        return (self.url, location, self.generation), None
+
+    def fetch(self, location):
+        """
+        Returns the (etag, body) of the schema at a location (or None if there is no such
+        schema) fetching it (once) unless it is cached and has not changed.
+        """
+        with self._lock:
+            if location in self._fetched:
+                return self._fetched[location]
+        cached = self._read_cache(location)
+        if self.offline or self.unreachable:
+            fetched = cached
+        else:
+            headers = {"Accept": "application/json"}
+            if cached and cached[0]:
+                headers["If-None-Match"] = cached[0]
+            try:
+                status, response_headers, body = self.pool.request("GET", "%s/%s" % (self.base_path, location), headers)
+            except (httplib.HTTPException, socket.error):
+                # Work offline from now on
+                self.unreachable = True
+                status = None
+            if status == 200:
+                fetched = response_headers.get("etag"), body
+                self._write_cache(location, fetched)
+            elif status == 404:
+                fetched = None
+                self._write_cache(location, None)
+            else:
+                # Not modified or the registry is not reachable
+                fetched = cached
+        with self._lock:
+            self._fetched[location] = fetched
+        return fetched
+
+    def invalidate(self):
+        """ Forgets the schemas fetched so they are validated against the registry again. """
+        with self._lock:
+            self._fetched = {}
+            self.unreachable = False
+            self.generation += 1
+
+    def path_for(self, location):
+        return os.path.join(self.cache_dir, hashlib.sha1(self.url).hexdigest(), location + ".json")
+
+    def _read_cache(self, location):
+        if not self.cache_dir:
+            return None
+        path = self.path_for(location)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except ValueError:
+            return None
+        # Bodies are saved base64 encoded as they need not be text (or UTF-8)
+        if saved.get("data") is None:
+            return None
+        return saved.get("etag"), base64.b64decode(saved["data"])
+
+    def _write_cache(self, location, fetched):
+        if not self.cache_dir:
+            return
+        path = self.path_for(location)
+        if fetched is None:
+            if os.path.isfile(path):
+                os.remove(path)
+            return
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                # Created by another thread
+                pass
+        temp_path = "%s.%d.%d.tmp" % (path, os.getpid(), threading.current_thread().ident)
+        with open(temp_path, "w") as f:
+            json.dump({"etag": fetched[0], "data": base64.b64encode(fetched[1])}, f)
+        os.rename(temp_path, path)
@@ -0,0 +1,146 @@
+
+import os
+import json
+import hashlib
+import zipfile
+from collections import OrderedDict
+
+class JarIndex(object):
+    """
+    An index of the entries in jar (zip) files so that entries can be looked up without
+    parsing a jar's central directory on every lookup.
+
+    The central directory of each jar is read once per process (or till refresh finds
+    that the jar has changed) and the (CRC, size) of its entries are kept so entries can
+    be looked up (and identified) without opening the jar.  Jars are only opened to read
+    entries and at most max_open jars (the ones read most recently) are kept open.  If a
+    cache_dir is set then the entries of each jar are also saved there, keyed by the
+    jar's path, size and modification time, so later runs do not read it again either.
+    """
+    def __init__(self, cache_dir = None, max_open = 8):
+        self.cache_dir = cache_dir
+        self.max_open = max_open
+        # jar -> name -> (CRC, size) of the entries in the jar
+        self._infos = {}
+        # name -> jars (in the order they were indexed) with an entry of that name
+        self._names = {}
+        # The jars kept open (least recently used first)
+        self._zipfiles = OrderedDict()
+        # jar -> (size, modified time) of the jar when it was indexed
+        self._stamps = {}
+
+    def infos(self, jar_file):
+        """ Returns a dictionary of name -> (CRC, size) of the entries in a jar. """
+        infos = self._infos.get(jar_file)
+        if infos is None:
+            stat = os.stat(jar_file)
+            stamp = [os.path.abspath(jar_file), stat.st_size, stat.st_mtime]
+            infos = self._load(stamp)
+            if infos is None:
+                infos = dict((info.filename, (info.CRC, info.file_size)) for info in self.open(jar_file).infolist())
+                self._save(stamp, infos)
+            self._infos[jar_file] = infos
+            self._stamps[jar_file] = stat.st_size, stat.st_mtime
+            for name in infos:
+                self._names.setdefault(name, []).append(jar_file)
+        return infos
+
+    def entries(self, jar_file):
+        """ Returns the set of the names of all entries in a jar. """
+        return frozenset(self.infos(jar_file))
+
+    def contains(self, jar_file, name):
+        return name in self.infos(jar_file)
+
+    def info(self, jar_file, name):
+        """ Returns the (CRC, size) of an entry in a jar. """
+        return self.infos(jar_file)[name]
+
+    def jars_with(self, name):
+        """ Returns the jars (of those indexed, in the order they were indexed) with an entry of the given name. """
+        return self._names.get(name, [])
+
+    def open(self, jar_file):
+        """ Returns the (open) ZipFile for a jar closing the least recently used jars over max_open. """
+        zf = self._zipfiles.pop(jar_file, None)
+        if zf is None:
+            if jar_file not in self._stamps:
+                stat = os.stat(jar_file)
+                self._stamps[jar_file] = stat.st_size, stat.st_mtime
+            zf = zipfile.ZipFile(jar_file, "r")
+            while self._zipfiles and len(self._zipfiles) >= self.max_open:
+                self._zipfiles.popitem(last = False)[1].close()
+        self._zipfiles[jar_file] = zf
+        return zf
+
+    def read(self, jar_file, name):
+        """ Returns the contents of an entry in a jar. """
+        return self.open(jar_file).read(name)
+
+    def read_many(self, jar_file, names):
+        """
+        Returns a dictionary of name -> contents for the given entries in a jar.  The
+        entries are read in the order they are stored in so the jar is read in one pass.
+        """
+        zf = self.open(jar_file)
+        infos = sorted((zf.getinfo(name) for name in set(names)), key = lambda info: info.header_offset)
+        return dict((info.filename, zf.read(info)) for info in infos)
+
+    def invalidate(self, jar_file = None):
+        """ Forgets the entries of a jar (or all jars) so they are read again on the next lookup. """
+        for path in [jar_file] if jar_file else set(self._infos.keys()) | set(self._zipfiles.keys()):
+            for name in self._infos.pop(path, ()):
+                jars = self._names[name]
+                jars.remove(path)
+                if not jars: del self._names[name]
+            self._stamps.pop(path, None)
+            zf = self._zipfiles.pop(path, None)
+            if zf: zf.close()
+
+    def refresh(self):
+        """ Forgets the jars that changed (in size or modification time) since they were indexed and returns them. """
+        changed = []
+        for jar_file, stamp in self._stamps.items():
+            try:
+                stat = os.stat(jar_file)
+                current = stat.st_size, stat.st_mtime
+            except OSError:
+                current = None
+            if current != stamp:
+                changed.append(jar_file)
+                self.invalidate(jar_file)
+        return changed
+
+    def path_for(self, jar_path):
+        return os.path.join(self.cache_dir, hashlib.sha1(jar_path).hexdigest() + ".json")
+
+    def _load(self, stamp):
+        if not self.cache_dir:
+            return None
+        path = self.path_for(stamp[0])
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except ValueError:
+            return None
+        if saved.get("stamp") != stamp or not isinstance(saved.get("entries"), dict):
+            return None
+        return dict((name, tuple(info)) for name, info in saved["entries"].iteritems())
+
+    def _save(self, stamp, infos):
+        if not self.cache_dir:
+            return
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        path = self.path_for(stamp[0])
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp_path, "w") as f:
+            json.dump({"stamp": stamp, "entries": infos}, f)
+        os.rename(temp_path, path)
+
+"""
+The index shared by all jar resolvers that are not given their own.
+"""
+default_index = JarIndex()
@@ -1,17 +1,23 @@
 
 from __future__ import absolute_import
 import fnmatch, pprint
+import collections
+import copy
 import os
 from ipdb import set_trace
 import json
+import multiprocessing
 from typecube import core as tccore
 from typecube import utils
 from typecube import errors
-from onering.utils.misc import collect_files
 from onering.utils import dirutils
 
 class Loader(object):
     """ Takes care of loading pegasus schemas. """
+
+    # If True, the fields of included records are shared (see IncludedTypeArg) instead of copied
+    share_included_fields = True
+
     def __init__(self, context, *args, **kwargs):
         """ Instantiates a new Espresso schema loader.
 
@@ -19,11 +25,15 @@ class Loader(object):
             List of files (or wildcards of files) to be loaded.
 
         Keyword Arguments:
-            None
+            workers     -   Number of processes schema files are read and scanned in
+                            (defaults to the context's parse_workers).
         """
         self.context = context
         self.entries = list(args)
+        self.workers = kwargs.get("workers") or context.parse_workers or 1
         self.found_entities = {}
+        # Schemas fetched ahead of being loaded by name (see prefetch)
+        self.prefetched = {}
         self.schema_initializers = {
             "fixed": self.fixed_schema_initializer,
             "bytes": self.bytes_schema_initializer,
@@ -38,16 +48,95 @@ class Loader(object):
 
     def load(self):
         """
-        Loads a type given its fqn or all types at a particular path.
+        Loads all types in the files matching the entries.
+
+        This is done in two phases.  The files are first read and scanned (in parallel)
+        for the types they declare and refer to, and the referred types that are not
+        declared in them are resolved (in batches) until every schema needed is known
+        (see scan).  The schemas are then loaded in dependency order so that each type
+        is created after the types it refers to without anything being resolved.
         """
+        paths = []
         for entry in self.entries:
             entry_dir = entry["dir"]
             entry_files = entry["files"]
-            for f in collect_files(os.path.join(self.context.curdir, entry_dir)):
-                if fnmatch.fnmatch(f, entry_files):
-                    self.load_from_path(f)
+            paths.extend(self.context.fs_index.match(os.path.join(self.context.curdir, entry_dir), entry_files))
+
+        schemas, deps = self.scan(paths)
+        files = set(paths)
+        try:
+            for node in dependency_order(schemas.keys(), deps, roots = paths):
+                if node in files:
+                    print("Reading schemas from: %s" % node)
+                    self.load_from_data(schemas[node])
+                else:
+                    self.load_by_name(node)
+        finally:
+            # Schemas prefetched but never loaded by name are not kept around
+            self.prefetched.clear()
         return self.found_entities
 
+    def scan(self, paths):
+        """
+        Reads the schemas in the given files (in self.workers processes) along with all
+        the schemas they refer to (transitively) that are not already loaded.
+
+        Returns the schemas as a dictionary of node -> schema and their dependency graph
+        as a dictionary of node -> nodes it refers to, where the nodes are the paths of
+        the files and the FQNs of the resolved schemas.  Resolved schemas are also added
+        to self.prefetched so they are not resolved again when loaded by name.
+        """
+        paths = list(collections.OrderedDict.fromkeys(paths))
+        if self.workers > 1 and len(paths) > 1:
+            pool = multiprocessing.Pool(min(self.workers, len(paths)))
+            try:
+                scanned = pool.map(scan_file, paths)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            scanned = map(scan_file, paths)
+
+        schemas, references, declared_by = {}, {}, {}
+        def add_node(node, schema_data, declared, referenced):
+            schemas[node] = schema_data
+            references[node] = referenced
+            for fqn in declared:
+                declared_by.setdefault(fqn, node)
+
+        for path, (schema_data, declared, referenced) in zip(paths, scanned):
+            add_node(path, schema_data, declared, referenced)
+
+        pending = paths
+        while pending:
+            missing = set()
+            for node in pending:
+                for name, fqn in references[node]:
+                    if fqn not in declared_by and name not in declared_by and not self.find_loaded(name, fqn):
+                        missing.add(fqn)
+            resolved = self.context.entity_resolver.resolve_many(missing, "pdsc", "st") if missing else {}
+            pending = sorted(resolved.keys())
+            for fqn in pending:
+                schema_data = self.prefetched[fqn] = resolved[fqn]
+                namespace = utils.normalize_name_and_ns(fqn, "", ensure_namespaces_are_equal = False)[1]
+                declared, referenced = scan_schema(schema_data, namespace)
+                declared_by.setdefault(fqn, fqn)
+                add_node(fqn, schema_data, declared, referenced)
+
+        deps = {}
+        for node, referenced in references.iteritems():
+            found = (declared_by.get(fqn) or declared_by.get(name) for name, fqn in referenced)
+            deps[node] = [dep for dep in found if dep is not None and dep != node]
+        return schemas, deps
+
+    def find_loaded(self, name, fqn):
+        """ Returns the already loaded type referred to by a name (normalized to the given fqn) if any. """
+        global_module = self.context.global_module
+        typeexpr = global_module.find_fqn(fqn)
+        if not typeexpr and name != fqn:
+            typeexpr = global_module.find_fqn(name)
+        return typeexpr
+
     def load_from_path(self, file_path):
         """
         Reads one or more schemas from the given the absolute path and registers it into the schema registry.
@@ -61,18 +150,13 @@ class Loader(object):
         name,namespace,fqn = utils.normalize_name_and_ns(name, namespace, ensure_namespaces_are_equal = False)
         # Search for this type if it doesnt exist so we can resolve from file
         # If the type exists then just return a reference to it
-        typeexpr = self.context.global_module.find_fqn(fqn)
+        typeexpr = self.find_loaded(name, fqn)
         if typeexpr:
             # return tccore.make_ref(fqn)
             return typeexpr
-        else:
-            typeexpr = self.context.global_module.find_fqn(name)
-            if typeexpr:
-                return typeexpr
-                # return tccore.make_ref(name)
 
         # otherwise load it from where it is
-        contents = self.context.entity_resolver.resolve_schema(fqn, "pdsc", "st")
+        contents = self.prefetched.pop(fqn, None) or self.context.entity_resolver.resolve_schema(fqn, "pdsc", "st")
         if not contents:
             raise errors.TypesNotFoundException(fqn)
         # Now we have a schema dictionary that we can process for its fields etc
@@ -87,6 +171,24 @@ class Loader(object):
         """
         return schema
 
+    def prefetch(self, schema_data, current_namespace = ""):
+        """
+        Resolves all the (not yet loaded) named types referred to by a schema together
+        so they need not be resolved one at a time as the schema is loaded.  Names are
+        normalized to the namespace of the (possibly nested) type they are referred to in
+        and the types the schema declares itself are not resolved.
+
+        Returns the FQNs of the schemas added to self.prefetched.
+        """
+        declared, referenced = scan_schema(schema_data, current_namespace)
+        fqns = set()
+        for name, fqn in referenced:
+            if fqn not in declared and fqn not in self.prefetched and not self.find_loaded(name, fqn):
+                fqns.add(fqn)
+        resolved = self.context.entity_resolver.resolve_many(fqns, "pdsc", "st") if fqns else {}
+        self.prefetched.update(resolved)
+        return list(resolved)
+
     def load_from_data(self, schema_data, current_namespace = ""):
         if type(schema_data) in (str, unicode):
             name,namespace,fqn = utils.normalize_name_and_ns(schema_data, current_namespace, ensure_namespaces_are_equal = False)
@@ -138,6 +240,7 @@ class Loader(object):
 
     def record_schema_initializer(self, fqn, schema_data, type_namespace):
         name,namespace,fqn = utils.normalize_name_and_ns(schema_data["name"], schema_data.get("namespace", ""))
+        prefetched = self.prefetch(schema_data, type_namespace)
         typeargs = []
         for field_dict in schema_data.get("fields", []):
             field_name = field_dict["name"]
@@ -163,8 +266,15 @@ class Loader(object):
 
             # add all fields to this record
             for typearg in included_record.args:
-                # copy the field and set the record to ourselves!
-                typeargs.append(typearg.deepcopy(None))
+                # share (or copy) the field and set the record to ourselves!
+                if self.share_included_fields and IncludedTypeArg.can_share(typearg):
+                    typeargs.append(IncludedTypeArg(typearg))
+                else:
+                    typeargs.append(typearg.deepcopy(None))
+
+        # Prefetched schemas are popped as they are loaded so these were not needed
+        for prefetched_fqn in prefetched:
+            self.prefetched.pop(prefetched_fqn, None)
         return tccore.make_product_type("record", fqn, typeargs, None)
 
     def array_schema_initializer(self, fqn, schema_data, type_namespace):
@@ -192,3 +302,129 @@ class Loader(object):
         fqn = ".".join([type_namespace, schema_data["name"]])
         alias = tccore.make_alias(fqn, out, current_module, None, schema_data.get("docs", ""))
         return alias
+
+class IncludedTypeArg(tccore.TypeArg):
+    """
+    A field of a record that was included from another record.  Instead of being a
+    deep copy of the included field it only has its own parent (and its own reference
+    to the field's type, whose parent is also set) and reads everything else from the
+    included field.  Setting anything else first copies the included field's attributes
+    (copy on write) and mutable attributes (eg annotations) are copied the first time they
+    are read so the included field is never changed through it.
+    """
+    def __init__(self, source):
+        # Fields included through other records all refer to the original field
+        while type(source) is IncludedTypeArg and "_source" in source.__dict__:
+            source = source._source
+        tccore.Expr.__init__(self, None)
+        self.__dict__["_source"] = source
+        self.__dict__["type_expr"] = tccore.make_ref(source.type_expr.fqn)
+
+    @classmethod
+    def can_share(cls, typearg):
+        """ Tells if a field can be shared, ie its type is a reference that can be recreated by FQN. """
+        return typearg.type_expr is not None and typearg.type_expr.is_typeref and bool(typearg.type_expr.fqn)
+
+    @property
+    def is_shared(self):
+        return "_source" in self.__dict__
+
+    def __getattr__(self, name):
+        source = self.__dict__.get("_source")
+        if source is None or name.startswith("__"):
+            raise AttributeError(name)
+        value = getattr(source, name)
+        if name in source.__dict__ and not isinstance(value, IMMUTABLE_TYPES):
+            value = self.__dict__[name] = self.copy_value(value)
+        return value
+
+    def __setattr__(self, name, value):
+        if name not in ("_parent", "parent", "type_expr") and self.is_shared:
+            source = self.__dict__["_source"]
+            for key, val in source.__dict__.iteritems():
+                if key not in self.__dict__:
+                    self.__dict__[key] = val if isinstance(val, IMMUTABLE_TYPES) else self.copy_value(val)
+            del self.__dict__["_source"]
+        tccore.TypeArg.__setattr__(self, name, value)
+
+    def copy_value(self, value):
+        """
+        Deep copies a value of the included field.  References to the included field are
+        replaced by this field and the record (and modules) above it are not copied.
+        """
+        source = self.__dict__["_source"]
+        memo = {id(source): self}
+        parent = source.parent
+        while parent is not None and id(parent) not in memo:
+            memo[id(parent)] = parent
+            parent = getattr(parent, "parent", None)
+        return copy.deepcopy(value, memo)
+
+""" Types of the values that are shared (and not copied) by IncludedTypeArgs. """
+IMMUTABLE_TYPES = (basestring, int, long, float, bool, type(None))
+
+"""
+The values of "type" that denote the kind of a schema (and not a type it refers to).
+"""
+SCHEMA_KINDS = frozenset(["fixed", "bytes", "record", "array", "set", "map", "union", "enum", "typeref"])
+
+def scan_schema(schema_data, namespace = ""):
+    """
+    Returns the FQNs of the named types a schema declares and the (name, fqn) of the
+    named types (including includes) it refers to, where fqn is the name normalized
+    to the namespace it is referred to in.
+    """
+    declared, referenced = [], []
+    pending = [(schema_data, namespace)]
+    while pending:
+        data, namespace = pending.pop()
+        if type(data) in (str, unicode):
+            name,_,fqn = utils.normalize_name_and_ns(data, namespace, ensure_namespaces_are_equal = False)
+            referenced.append((name, fqn))
+        elif isinstance(data, list):
+            pending.extend((item, namespace) for item in data)
+        elif isinstance(data, dict):
+            schema_type = data.get("type")
+            if isinstance(schema_type, (list, dict)) or schema_type not in SCHEMA_KINDS:
+                pending.append((schema_type, namespace))
+            elif data.get("name"):
+                _,namespace,fqn = utils.normalize_name_and_ns(data["name"], data.get("namespace", namespace),
+                                                              ensure_namespaces_are_equal = False)
+                declared.append(fqn)
+            for key in ("items", "keys", "values", "ref"):
+                if key in data:
+                    pending.append((data[key], namespace))
+            # Only the types of fields are followed (fields are named but are not types)
+            pending.extend((field.get("type"), namespace) for field in data.get("fields", []))
+            pending.extend((include, namespace) for include in data.get("include", []))
+    return declared, referenced
+
+def scan_file(path):
+    """ Reads a schema file and returns its schema along with the types it declares and refers to (see scan_schema). """
+    with open(path) as f:
+        schema_data = json.load(f)
+    assert schema_data is not None, "Contents ?"
+    return (schema_data,) + scan_schema(schema_data)
+
+def dependency_order(nodes, deps, roots = ()):
+    """
+    Returns the nodes ordered so that every node comes after the nodes it depends on
+    (except where they depend on each other through a cycle).  Nodes reachable from
+    the roots are ordered first (in the order of the roots).
+    """
+    out, seen = [], set()
+    for root in list(roots) + list(nodes):
+        if root in seen: continue
+        seen.add(root)
+        stack = [(root, iter(deps.get(root, ())))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if child not in seen:
+                    seen.add(child)
+                    stack.append((child, iter(deps.get(child, ()))))
+                    break
+            else:
+                stack.pop()
+                out.append(node)
+    return out
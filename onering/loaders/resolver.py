@@ -1,31 +1,182 @@
-
+from __future__ import absolute_import
 import json, os
 import ipdb
-import zipfile
+from onering.loaders import jarindex
 
 class EntityResolver(object):
+    """
+    Resolves schemas by FQN from a list of resolvers (the first resolver with a schema wins).
+
+    The resolver and location each FQN was found at are remembered, as are FQNs that
+    were not found by any resolver, so repeated lookups of a FQN (whether it exists or
+    not) do not ask the resolvers again.  Adding a resolver forgets the FQNs that were
+    not found and removing one forgets the FQNs that were found by it.  If the schemas
+    behind the resolvers change, invalidate must be called.
+
+    If a schema_cache (a SchemaCache, usually the one shared by all resolvers in a
+    OneringContext) is set, loaded schemas are kept in it so they are only decoded once.
+    """
     def __init__(self, *extensions):
         self.extensions = extensions or ["pdsc", "onering", "schema", "avsc"]
         self.resolvers = []
+        self.schema_cache = None
+        # (fqn, schema_types) -> (resolver, location) or None if not found
+        self._locations = {}
 
     def add_resolver(self, resolver):
         if resolver not in self.resolvers:
             self.resolvers.append(resolver)
+            # Only FQNs that were not found can be found in a new resolver
+            for key, location in self._locations.items():
+                if location is None:
+                    del self._locations[key]
 
     def remove_resolver(self, resolver):
         for index,l in enumerate(self.resolvers):
             if resolver == l:
                 del self.resolvers[index]
+                for key, location in self._locations.items():
+                    if location is not None and location[0] == resolver:
+                        del self._locations[key]
                 return
 
-    def resolve_schema(self, fqn, *schema_types):
+    def invalidate(self):
+        """ Forgets where all FQNs were (or were not) found. """
+        self._locations = {}
+
+    def source_paths(self):
+        """ Returns the paths of the files (eg schema files and jars) the schemas found so far are read from. """
+        located = {}
+        for found in self._locations.itervalues():
+            if found is not None:
+                located.setdefault(id(found[0]), []).append(found[1])
+        out = set()
+        for resolver in self.resolvers:
+            out.update(resolver.source_paths(located.get(id(resolver), [])))
+        return out
+
+    def sources_by_fqn(self):
+        """ Returns FQN -> paths of the files (eg schema files and jars) the schemas found so far are read from. """
+        out = {}
+        for (fqn, schema_types), found in self._locations.iteritems():
+            if found is not None:
+                out.setdefault(fqn, set()).update(found[0].source_paths([found[1]]))
+        return out
+
+    def locate(self, fqn, *schema_types):
+        """ Returns the (resolver, location) of the schema with the given FQN or None if it does not exist. """
+        key = (fqn, schema_types)
+        if key in self._locations:
+            return self._locations[key]
+        out = None
         for resolver in self.resolvers:
-            schema_contents = resolver.resolve_schema(fqn, *schema_types)
-            if schema_contents: 
+            location = resolver.locate(fqn, *schema_types)
+            if location is not None:
                 print "Found Entity '%s' in Resolver: %s" % (fqn, resolver)
-                return schema_contents
+                out = resolver, location
+                break
+        self._locations[key] = out
+        return out
+
+    def resolve_schema(self, fqn, *schema_types):
+        found = self.locate(fqn, *schema_types)
+        if found is not None:
+            resolver, location = found
+            if self.schema_cache is not None:
+                return self.schema_cache.load(resolver, location)
+            return resolver.load(location)
+
+    def resolve_many(self, fqns, *schema_types):
+        """
+        Resolves several schemas at once and returns a dictionary of FQN -> schema for
+        the FQNs that were found.  The resolvers are asked for all the FQNs (not already
+        located) together and each resolver loads all the schemas found by it in one go.
+        """
+        by_resolver = {}
+        pending = []
+        for fqn in set(fqns):
+            key = (fqn, schema_types)
+            if key not in self._locations:
+                pending.append(fqn)
+            elif self._locations[key] is not None:
+                resolver, location = self._locations[key]
+                by_resolver.setdefault(id(resolver), (resolver, {}))[1][fqn] = location
+
+        for resolver in self.resolvers:
+            if not pending: break
+            located = resolver.locate_many(pending, *schema_types)
+            if located:
+                print "Found Entities %s in Resolver: %s" % (", ".join(sorted(located.keys())), resolver)
+                by_resolver.setdefault(id(resolver), (resolver, {}))[1].update(located)
+                for fqn, location in located.iteritems():
+                    self._locations[(fqn, schema_types)] = resolver, location
+                pending = [fqn for fqn in pending if fqn not in located]
+        for fqn in pending:
+            self._locations[(fqn, schema_types)] = None
+
+        out = {}
+        for resolver, locations in by_resolver.itervalues():
+            if self.schema_cache is not None:
+                schemas = self.schema_cache.load_many(resolver, locations.values())
+            else:
+                schemas = resolver.load_many(locations.values())
+            for fqn, location in locations.iteritems():
+                out[fqn] = schemas[location]
+        return out
+
+class SchemaResolver(object):
+    """
+    Base of resolvers that find schemas by FQN in a particular location.  Resolvers
+    implement locate (to find where the schema for a FQN is), load (to read the
+    schema from where it was found) and cache_key (to identify the schema at a location
+    in a SchemaCache).
+    """
+    def locate(self, fully_qualified_name, *schema_types):
+        """ Returns where the schema for a FQN is (or None if there is no such schema). """
+        return None
 
-class FilePathEntityResolver(object):
+    def load(self, location):
+        """ Returns the schema at a location returned by locate. """
+        return None
+
+    def cache_key(self, location):
+        """
+        Returns the key the schema at a location is cached by (which changes when the
+        schema does) and the size of the schema in bytes (or None if it is not known
+        till the schema is loaded).
+        """
+        return (str(self), location), None
+
+    def source_paths(self, locations):
+        """ Returns the paths of the files the schemas at the given locations are read from (if they are files). """
+        return []
+
+    def resolve_schema(self, fully_qualified_name, *schema_types):
+        location = self.locate(fully_qualified_name, *schema_types)
+        if location is not None:
+            return self.load(location)
+        return None
+
+    def locate_many(self, fqns, *schema_types):
+        """ Returns a dictionary of FQN -> location for the given FQNs that exist. """
+        out = {}
+        for fqn in fqns:
+            location = self.locate(fqn, *schema_types)
+            if location is not None:
+                out[fqn] = location
+        return out
+
+    def load_many(self, locations):
+        """ Returns a dictionary of location -> schema for the given locations. """
+        return dict((location, self.load(location)) for location in locations)
+
+    def resolve_many(self, fqns, *schema_types):
+        """ Returns a dictionary of FQN -> schema for the given FQNs that exist. """
+        located = self.locate_many(fqns, *schema_types)
+        schemas = self.load_many(located.values())
+        return dict((fqn, schemas[location]) for fqn, location in located.iteritems())
+
+class FilePathEntityResolver(SchemaResolver):
     """
     Interface to return a file corresponding to a particular entry in a given (optional) namespace.
     """
@@ -41,7 +192,8 @@ class FilePathEntityResolver(object):
     def __str__(self):
         return self.path
 
-    def resolve_schema(self, fully_qualified_name, *schema_types):
+    def locate(self, fully_qualified_name, *schema_types):
+        """ Returns the path of the schema file for a FQN or None if there is none. """
         path = self.path
         full_path = path if path.endswith(os.sep) else path + os.sep
         full_path += fully_qualified_name.replace(".", os.sep)
@@ -49,16 +201,33 @@ class FilePathEntityResolver(object):
         for schema_type in schema_types:
             final_path = full_path + "." + schema_type
             if os.path.isfile(final_path):
-                return json.load(open(final_path))
+                return final_path
         return None
 
-class ZipFilePathEntityResolver(object):
+    def load(self, location):
+        """ Returns the schema at a location returned by locate. """
+        with open(location) as f:
+            return json.load(f)
+
+    def cache_key(self, location):
+        stat = os.stat(location)
+        return (self.path, location, stat.st_mtime, stat.st_size), stat.st_size
+
+    def source_paths(self, locations):
+        return list(locations)
+
+class ZipFilePathEntityResolver(SchemaResolver):
     """
     Interface to return a file corresponding to a particular entry in a given (optional) namespace.
     """
-    def __init__(self, jar_file, prefix = ""):
-        self.prefix = prefix.strip()
+    def __init__(self, jar_file, prefix = "", index = None):
+        """
+        Creates a resolver for the schemas in a jar under the given prefix.  The jar's
+        entries are looked up in the given JarIndex (or the shared jarindex.default_index).
+        """
+        self.prefix = (prefix or "").strip()
         self.jar_file = jar_file
+        self.index = index or jarindex.default_index
 
     def __repr__(self):
         return "Jar<%s:%s>" % (self.jar_file, self.prefix)
@@ -69,8 +238,10 @@ class ZipFilePathEntityResolver(object):
     def __str__(self):
         return self.jar_file
 
-    def resolve_schema(self, fully_qualified_name, *schema_types):
+    def locate(self, fully_qualified_name, *schema_types):
+        """ Returns the name of the jar entry of the schema for a FQN or None if there is none. """
         schema_types = schema_types or ["pdsc"]
+        entries = self.index.infos(self.jar_file)
         for schema_type in schema_types:
             full_path = fully_qualified_name.replace(".", os.sep) + "." + schema_type
             if self.prefix.endswith(os.sep):
@@ -78,8 +249,27 @@ class ZipFilePathEntityResolver(object):
             elif self.prefix:
                 full_path = self.prefix + os.sep + full_path
 
-            jar_file = self.jar_file
-            zf = zipfile.ZipFile(jar_file, "r")
-            if len(filter(lambda x: x == full_path, zf.namelist())) > 0:
-                return json.loads(zf.read(full_path))
+            if full_path in entries:
+                return full_path
         return None
+
+    def load(self, location):
+        """ Returns the schema at a location returned by locate. """
+        return json.loads(self.index.read(self.jar_file, location))
+
+    def cache_key(self, location):
+        crc, size = self.index.info(self.jar_file, location)
+        return (self.jar_file, location, crc), size
+
+    def source_paths(self, locations):
+        # Any schema in the jar can be found (or change) so the jar is always a source
+        return [self.jar_file]
+
+    def load_many(self, locations):
+        """
+        Returns a dictionary of location -> schema for the given locations.  The entries
+        are read in the order they are stored in the jar so the jar is read in one pass.
+        """
+        contents = self.index.read_many(self.jar_file, locations)
+        return dict((location, json.loads(data)) for location, data in contents.iteritems())
+
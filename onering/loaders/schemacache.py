@@ -0,0 +1,92 @@
+
+import json
+from collections import OrderedDict
+
+class SchemaCache(object):
+    """
+    A cache of decoded schemas (as loaded by resolvers) that evicts the least recently
+    used schemas once the (undecoded) size of the cached schemas exceeds max_bytes.
+
+    Schemas are keyed by where they were loaded from and a stamp (eg a modification
+    time or a CRC) of their source so changed sources are not served from the cache.
+    Cached schemas are shared so they must not be modified.
+    """
+    def __init__(self, max_bytes = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """ Returns the schema with the given key or None if it is not cached. """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries[key] = entry
+        return entry[0]
+
+    def put(self, key, schema, size):
+        """
+        Caches a schema whose source is size bytes long.  If size is None the size of the
+        schema (as JSON) is used instead and schemas that cannot be sized are not cached.
+        """
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.num_bytes -= old[1]
+        if size is None:
+            size = schema_size(schema)
+        if size is None or size > self.max_bytes:
+            return
+        self._entries[key] = (schema, size)
+        self.num_bytes += size
+        while self.num_bytes > self.max_bytes:
+            key, (schema, size) = self._entries.popitem(last = False)
+            self.num_bytes -= size
+            self.evictions += 1
+
+    def load(self, resolver, location):
+        """ Returns the schema at a location of a resolver loading it only if it is not cached. """
+        key, size = resolver.cache_key(location)
+        schema = self.get(key)
+        if schema is None:
+            schema = resolver.load(location)
+            self.put(key, schema, size)
+        return schema
+
+    def load_many(self, resolver, locations):
+        """ Returns a dictionary of location -> schema loading the schemas that are not cached together. """
+        out, missing = {}, {}
+        for location in locations:
+            key, size = resolver.cache_key(location)
+            schema = self.get(key)
+            if schema is None:
+                missing[location] = key, size
+            else:
+                out[location] = schema
+        if missing:
+            loaded = resolver.load_many(missing.keys())
+            for location, (key, size) in missing.iteritems():
+                self.put(key, loaded[location], size)
+            out.update(loaded)
+        return out
+
+    def clear(self):
+        self._entries = OrderedDict()
+        self.num_bytes = 0
+
+    @property
+    def stats(self):
+        return {"entries": len(self._entries), "bytes": self.num_bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+def schema_size(schema):
+    """ Returns the size of a decoded schema as JSON (or None if it cannot be encoded). """
+    try:
+        return len(json.dumps(schema))
+    except (TypeError, ValueError):
+        return None
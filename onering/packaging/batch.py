@@ -0,0 +1,141 @@
+
+from __future__ import absolute_import
+import os
+import time
+import traceback
+import multiprocessing
+from onering.loaders.pegasus import dependency_order
+from onering.packaging.packages import Package
+
+""" The batch being built (inherited by the worker processes it forks). """
+_current_batch = None
+
+class BatchBuild(object):
+    """
+    Builds several packages (and the packages they depend on) in one go.
+
+    The specs of all packages are read first to find the package dependency graph.  The
+    packages that other packages depend on are loaded once, in dependency order, into a
+    shared context and the packages to be generated are then loaded (if they are not
+    shared) and generated in worker processes (forked with the shared context already
+    loaded) one level of the graph at a time ie a package is only generated after all
+    the packages it depends on.
+    """
+    def __init__(self, context, spec_paths, output_dir, platform, workers = 1, incremental = False, render_cache_dir = None):
+        self.context = context
+        self.output_dir = output_dir
+        self.platform = platform
+        self.workers = workers
+        self.incremental = incremental
+        self.render_cache_dir = render_cache_dir
+        # name -> Package (with only its spec read) of the packages given and their dependencies
+        self.specs = {}
+        self.targets = []
+        for spec_path in spec_paths:
+            self.targets.append(self.read_spec(spec_path).name)
+        # name -> timings (and results) of the packages loaded and built
+        self.timings = {}
+
+    def read_spec(self, spec_path):
+        """ Reads the spec of a package and (recursively) of the packages it depends on. """
+        package = Package(spec_path)
+        if package.name in self.specs:
+            return self.specs[package.name]
+        self.specs[package.name] = package
+        for dep_name, dep_path in package.dependencies.iteritems():
+            if dep_name not in self.specs:
+                self.read_spec(os.path.abspath(os.path.join(package.package_dir, dep_path)))
+        return package
+
+    @property
+    def dependencies(self):
+        """ name -> names of the packages it depends on. """
+        return dict((name, [dep for dep in spec.dependencies if dep in self.specs]) for name, spec in self.specs.iteritems())
+
+    @property
+    def shared(self):
+        """ Names of the packages (in dependency order) that other packages depend on. """
+        deps = self.dependencies
+        shared = set(dep for names in deps.itervalues() for dep in names)
+        return [name for name in dependency_order(sorted(self.specs), deps) if name in shared]
+
+    def levels(self):
+        """ Returns the packages to be generated grouped into levels that only depend on earlier levels. """
+        deps = self.dependencies
+        level_of = {}
+        for name in dependency_order(sorted(self.specs), deps):
+            level_of[name] = 1 + max([level_of[dep] for dep in deps[name] if dep in level_of] or [-1])
+        levels = [[] for i in xrange(1 + max(level_of.values() or [-1]))]
+        for name in self.targets:
+            if name not in levels[level_of[name]]:
+                levels[level_of[name]].append(name)
+        return [level for level in levels if level]
+
+    def run(self):
+        """ Loads the shared packages, generates the packages and returns their timings. """
+        global _current_batch
+        for name in self.shared:
+            start_time = time.time()
+            self.context.load_package(self.specs[name].spec_path)
+            self.timings[name] = {"package": name, "load_seconds": time.time() - start_time, "shared": True}
+
+        _current_batch = self
+        pool = None
+        if self.workers > 1 and len(self.targets) > 1:
+            pool = multiprocessing.Pool(min(self.workers, len(self.targets)))
+        try:
+            for level in self.levels():
+                results = pool.map(_build_in_worker, level) if pool else map(_build_in_worker, level)
+                for result in results:
+                    timings = self.timings.setdefault(result["package"], {"package": result["package"], "load_seconds": 0})
+                    timings["load_seconds"] += result.pop("load_seconds")
+                    timings.update(result)
+        finally:
+            _current_batch = None
+            if pool:
+                pool.close()
+                pool.join()
+        return self.timings
+
+    def build(self, name):
+        """ Loads (if it is not a shared package) and generates a package. """
+        result = {"package": name, "pid": os.getpid()}
+        start_time = time.time()
+        try:
+            package = self.context.load_package(self.specs[name].spec_path)
+            result["load_seconds"] = time.time() - start_time
+            start_time = time.time()
+            result["outputs"] = self.generate(package)
+            result["generate_seconds"] = time.time() - start_time
+        except Exception:
+            result.setdefault("load_seconds", time.time() - start_time)
+            result["error"] = traceback.format_exc()
+        return result
+
+    def generate(self, package):
+        """ Generates a (loaded) package and returns the number of outputs generated. """
+        render_cache = None
+        if self.render_cache_dir:
+            from onering.targets.rendercache import RenderCache
+            render_cache = RenderCache(self.render_cache_dir)
+        generator = package.build_generator(self.context, self.output_dir, self.platform,
+                                            incremental = self.incremental, render_cache = render_cache)
+        generator.generate()
+        return len(generator.file_entities)
+
+    def format_timings(self):
+        """ Returns a report of the time taken to load and generate each package. """
+        lines = ["%-40s %10s %10s %10s" % ("Package", "Load (s)", "Gen (s)", "Outputs")]
+        for name in dependency_order(sorted(self.timings), self.dependencies):
+            timings = self.timings[name]
+            generated = "generate_seconds" in timings
+            lines.append("%-40s %10.3f %10s %10s%s" % (name, timings["load_seconds"],
+                         "%.3f" % timings["generate_seconds"] if generated else "-",
+                         timings["outputs"] if generated else "-",
+                         " (shared)" if timings.get("shared") else ""))
+            if "error" in timings:
+                lines.append(timings["error"])
+        return "\n".join(lines)
+
+def _build_in_worker(name):
+    return _current_batch.build(name)
@@ -0,0 +1,306 @@
+
+from __future__ import absolute_import
+import os
+import json
+import time
+import socket
+import traceback
+import SocketServer
+from onering.core.fingerprints import Fingerprints
+from onering.loaders import jarindex
+from onering.targets.rendercache import RenderCache
+
+class PackageState(object):
+    """ A package loaded into the daemon's context and the files it was loaded from. """
+    def __init__(self, package, snapshot):
+        self.package = package
+        self.snapshot = snapshot
+        self.fingerprints = None
+
+class Daemon(object):
+    """
+    Builds packages in a long lived (warm) context so that imports, the default types and
+    dependency packages are loaded once and not for every build.
+
+    Before each build the files a package was loaded from are checked (by modified time
+    and size) and only the sources that changed (or were added or deleted) are loaded
+    again.  If the package spec or a dependency package changed the context is created
+    again.  Outputs are generated incrementally (with a BuildManifest in the output
+    folder) and with a render cache shared by all builds.
+    """
+    def __init__(self, cache_dir = None, configure = None):
+        self.cache_dir = cache_dir
+        # Called with each context created (eg to set parse workers or caches)
+        self.configure = configure
+        self.render_caches = {}
+        self.reset()
+
+    def reset(self):
+        """ Starts again with a new context (and no packages loaded). """
+        from onering.core import context as orcontext
+        self.context = orcontext.OneringContext()
+        if self.cache_dir:
+            from onering.dsl.parser.cache import ParseCache
+            self.context.parse_cache = ParseCache(os.path.join(self.cache_dir, "parse"))
+            self.context.fs_index.cache_dir = os.path.join(self.cache_dir, "files")
+        if self.configure:
+            self.configure(self.context)
+        self.states = {}
+
+    def build(self, package_path, output_dir, platform):
+        """
+        Builds a package (loading or reloading it as needed) and returns a summary of the
+        build (as a dict).
+        """
+        start_time = time.time()
+        state, reloaded = self.ensure_package(spec_path(package_path))
+        package = state.package
+        generator = package.build_generator(self.context, output_dir, platform, incremental = True,
+                                            render_cache = self.render_cache(platform))
+        generator.fingerprints = state.fingerprints
+        generator.generate()
+        return {"package": package.name,
+                "reloaded": reloaded,
+                "generated": sorted(generator.file_entities.keys()),
+                "up_to_date": len(generator.skipped_files),
+                "seconds": time.time() - start_time}
+
+    def render_cache(self, platform):
+        if platform not in self.render_caches:
+            cache_dir = os.path.join(self.cache_dir, "render", platform) if self.cache_dir else None
+            self.render_caches[platform] = RenderCache(cache_dir)
+        cache = self.render_caches[platform]
+        # Templates (and the targets) may have changed since the last build
+        cache.new_build()
+        return cache
+
+    def ensure_package(self, package_path):
+        """
+        Returns the state of a package (and the paths of the sources that were loaded)
+        loading the package if it is not loaded or reloading its changed sources.
+        """
+        state = self.states.get(package_path)
+        if state is not None:
+            self.context.fs_index.invalidate()
+            jarindex.default_index.refresh()
+            snapshot = self.snapshot(state.package)
+            changed = self.changed_paths(state.snapshot, snapshot)
+            if not changed:
+                # Schemas resolved since are watched from now on
+                state.snapshot = snapshot
+                return state, []
+            if package_path in changed or any(self.is_dependency_path(state.package, path) for path in changed) or \
+                    changed & state.snapshot["resolved"]:
+                # The package spec, a dependency or a resolved schema (or jar) changed so start afresh
+                self.reset()
+            else:
+                reloaded = self.reload_sources(state, changed, snapshot)
+                if reloaded is not None:
+                    return state, reloaded
+                # Entities removed from the sources are still visible in their modules so start afresh
+                self.reset()
+
+        package = self.context.load_package(package_path)
+        state = self.states[package_path] = PackageState(package, self.snapshot(package))
+        state.fingerprints = Fingerprints.for_package(self.context, package)
+        return state, package.source_paths(self.context)
+
+    def reload_sources(self, state, changed, snapshot):
+        """
+        Loads the changed (and added) sources of a package again and returns their paths
+        or None if entities that are no longer in the sources could not be removed from
+        their modules (ie the package has to be loaded afresh).
+        """
+        package, context = state.package, self.context
+        sources = set(package.source_paths(context))
+        reloaded = []
+        unloaded, loaded = set(), set()
+        for path in sorted(changed):
+            if path in state.snapshot["templates"] or path in snapshot["templates"]:
+                # Template changes are picked up by the manifest and the render cache
+                continue
+            for fqn in package.unload_source(context, path):
+                state.fingerprints.invalidate(fqn)
+                unloaded.add(fqn)
+            if path in sources:
+                for fqn in package.load_source(context, path):
+                    state.fingerprints.invalidate(fqn)
+                    loaded.add(fqn)
+                reloaded.append(path)
+        if any(context.global_module.find_fqn(fqn) is not None for fqn in unloaded - loaded):
+            return None
+        state.snapshot = snapshot
+        return reloaded
+
+    def snapshot(self, package):
+        """
+        Returns the (modified time, size) of the files a package depends on: its spec,
+        its sources, its templates, the specs and sources of its dependencies and the
+        schema files (and jars) their resolvers have resolved schemas from.
+        """
+        out = {"files": {}, "templates": set(), "resolved": set()}
+        files = out["files"]
+        for dep in self.related_packages(package):
+            for path in [dep.spec_path] + dep.source_paths(self.context):
+                files[path] = file_stat(path)
+            entity_resolver = getattr(dep, "entity_resolver", None)
+            if entity_resolver is not None:
+                for path in entity_resolver.source_paths():
+                    files[path] = file_stat(path)
+                    out["resolved"].add(path)
+        for template_dir in package.template_dirs:
+            for dirpath, dirnames, filenames in os.walk(template_dir):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    files[path] = file_stat(path)
+                    out["templates"].add(path)
+        return out
+
+    def changed_paths(self, before, after):
+        # Schemas resolved since the first snapshot have not changed but are new to it
+        newly_resolved = after["resolved"] - before["resolved"]
+        before, after = before["files"], after["files"]
+        return set(path for path in set(before) | set(after)
+                        if path not in newly_resolved and before.get(path) != after.get(path))
+
+    def related_packages(self, package):
+        """ Returns a package and all the packages it (transitively) depends on. """
+        out = [package]
+        for current in out:
+            for name in current.dependencies:
+                dep = self.context.packages.get(name)
+                if dep is not None and dep not in out:
+                    out.append(dep)
+        return out
+
+    def is_dependency_path(self, package, path):
+        """ Tells if a path belongs to (the spec or sources of) a dependency of a package. """
+        for dep in self.related_packages(package)[1:]:
+            if path == dep.spec_path or path.startswith(dep.package_dir + os.sep):
+                return True
+        return False
+
+    def changed_packages(self):
+        """ Returns the spec paths of the loaded packages whose files changed since they were built. """
+        self.context.fs_index.invalidate()
+        return [path for path, state in self.states.iteritems()
+                    if self.changed_paths(state.snapshot, self.snapshot(state.package))]
+
+    def watch(self, builds, interval = 1.0, on_build = None):
+        """
+        Builds the given (package path, output dir, platform) tuples and builds them again
+        whenever the files they depend on change (polling every interval seconds).
+
+        A build that fails is reported (with status "error") and the context is created
+        again.  Packages that are not loaded (eg ones that failed to build) are watched
+        through the files in their folders and built again once those change.
+        """
+        builds = [(os.path.abspath(path), output_dir, platform) for path, output_dir, platform in builds]
+        pending = list(builds)
+        # build -> files (see folder_snapshot) of the builds whose packages are not loaded
+        unloaded = {}
+        while True:
+            for path, output_dir, platform in pending:
+                try:
+                    result = self.build(path, output_dir, platform)
+                except Exception:
+                    result = {"package": path, "status": "error", "error": traceback.format_exc()}
+                    # The context may be left half loaded
+                    self.reset()
+                if on_build: on_build(result)
+            for build in builds:
+                if spec_path(build[0]) in self.states:
+                    unloaded.pop(build, None)
+                elif build in pending or build not in unloaded:
+                    unloaded[build] = folder_snapshot(build[0])
+            time.sleep(interval)
+            changed = set(self.changed_packages())
+            pending = [build for build in builds if spec_path(build[0]) in changed or
+                        (build in unloaded and folder_snapshot(build[0]) != unloaded[build])]
+
+def spec_path(package_path):
+    """ Returns the absolute path of a package spec given it or the package folder. """
+    package_path = os.path.abspath(package_path)
+    if os.path.isdir(package_path):
+        package_path = os.path.join(package_path, "package.spec")
+    return package_path
+
+def folder_snapshot(package_path):
+    """ Returns the (modified time, size) of the files in the folder of a package. """
+    out = {}
+    for dirpath, dirnames, filenames in os.walk(os.path.dirname(spec_path(package_path))):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            out[path] = file_stat(path)
+    return out
+
+def file_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+    """
+    Handles a request (a JSON object on one line) and writes back a response (also a
+    JSON object on one line).  Requests are:
+
+        {"command": "build", "package": <path>, "output_dir": <path>, "platform": <name>}
+        {"command": "ping"}
+        {"command": "stop"}
+    """
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            response = self.server.handle_request_data(request)
+        except Exception, e:
+            response = {"status": "error", "error": "%s: %s" % (e.__class__.__name__, e)}
+        self.wfile.write(json.dumps(response) + "\n")
+
+class DaemonServer(SocketServer.UnixStreamServer):
+    """ Serves build requests (one at a time) to a Daemon over a unix domain socket. """
+    def __init__(self, address, daemon):
+        if os.path.exists(address):
+            os.remove(address)
+        SocketServer.UnixStreamServer.__init__(self, address, RequestHandler)
+        self.daemon = daemon
+        self.stopping = False
+
+    def handle_request_data(self, request):
+        command = request.get("command")
+        if command == "build":
+            result = self.daemon.build(request["package"], request["output_dir"], request.get("platform", "es6"))
+            result["status"] = "ok"
+            return result
+        elif command == "ping":
+            return {"status": "ok", "packages": sorted(self.daemon.states.keys())}
+        elif command == "stop":
+            self.stopping = True
+            return {"status": "ok"}
+        return {"status": "error", "error": "Invalid command: %s" % command}
+
+    def serve_until_stopped(self):
+        try:
+            while not self.stopping:
+                self.handle_request()
+        finally:
+            self.server_close()
+            if os.path.exists(self.server_address):
+                os.remove(self.server_address)
+
+def send_request(address, request, timeout = None):
+    """ Sends a request to a daemon listening at address and returns its response. """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(address)
+        client.sendall(json.dumps(request) + "\n")
+        response = ""
+        while not response.endswith("\n"):
+            data = client.recv(65536)
+            if not data: break
+            response += data
+    finally:
+        client.close()
+    return json.loads(response)
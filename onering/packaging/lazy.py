@@ -0,0 +1,128 @@
+
+from __future__ import absolute_import
+import sys
+from typecube import errors as tcerrors
+from onering import dsl
+from onering.dsl.parser.scanner import scan_declarations
+
+class LazyEntities(object):
+    """
+    An index of the entities and modules declared in the onering sources of (dependency)
+    packages so that a source is only loaded when one of the entities or modules declared
+    in it is first looked up in the global module (with find_fqn, get or resolve_name).
+
+    Sources are indexed by scanning them for declarations (see scanner.scan_declarations)
+    and not by parsing them.  Module lookups made while a source is being loaded (eg when
+    its modules are created) do not load other sources.
+
+    Names that are not found are looked up in the index as FQNs and as names relative to
+    a module (eg B referred to in module a.b reaches the global module as B) so the
+    sources declaring any entity (or module) whose FQN ends with the name are loaded.
+    """
+    LOOKUPS = ("find_fqn", "get", "resolve_name")
+
+    """ Exceptions the lookups raise when a name is not found. """
+    NOT_FOUND = (tcerrors.TLException, KeyError)
+
+    def __init__(self, context):
+        self.context = context
+        # fqn -> list of (package, path) of the sources declaring the entity or module
+        self.entity_sources = {}
+        self.module_sources = {}
+        # last part of a FQN -> FQNs (of entities and modules) in the index ending with it
+        self.names = {}
+        self.loaded = set()
+        self._loading = 0
+        self._originals = None
+
+    def add_source(self, package, path):
+        """ Indexes a onering source of a package so it is loaded when first needed. """
+        from onering.actions.loaders import LoaderActions
+        loader = LoaderActions(self.context)
+        engine = loader.source_engine
+        source = loader.read_source(path, engine)
+        try:
+            parser = dsl.parser.Parser(dsl.lexer.make_lexer(source, path, engine = engine), self.context)
+            entities, modules = scan_declarations(parser)
+        finally:
+            dsl.lexer.close_source(source)
+        for fqn in entities:
+            self.entity_sources.setdefault(fqn, []).append((package, path))
+        for fqn in modules:
+            self.module_sources.setdefault(fqn, []).append((package, path))
+        for fqn in list(entities) + list(modules):
+            self.names.setdefault(fqn.rpartition(".")[2], set()).add(fqn)
+        self.install()
+
+    @property
+    def num_pending(self):
+        """ Number of indexed sources that have not been loaded yet. """
+        sources = set(path for srcs in self.entity_sources.values() + self.module_sources.values() for _, path in srcs)
+        return len(sources - self.loaded)
+
+    def candidates(self, name):
+        """ Returns the FQNs in the index a (possibly relative) name can refer to, the name itself first. """
+        suffix = "." + name
+        fqns = self.names.get(name.rpartition(".")[2], ())
+        return ([name] if name in fqns else []) + sorted(fqn for fqn in fqns if fqn.endswith(suffix))
+
+    def load_name(self, name):
+        """ Loads the sources declaring the entities or modules a name can refer to and returns True if any were loaded. """
+        loaded = False
+        for fqn in self.candidates(name):
+            loaded = self.load(fqn) or loaded
+        return loaded
+
+    def load(self, fqn):
+        """
+        Loads the sources (not already loaded) declaring the entity or module with the
+        given FQN and returns True if any were loaded.
+        """
+        sources = self.entity_sources.get(fqn, [])
+        if not self._loading:
+            sources = sources + self.module_sources.get(fqn, [])
+        pending = [(package, path) for package, path in sources if path not in self.loaded]
+        for package, path in pending:
+            if path in self.loaded: continue
+            self.loaded.add(path)
+            self._loading += 1
+            try:
+                package.load_source(self.context, path)
+            finally:
+                self._loading -= 1
+        return len(pending) > 0
+
+    def install(self):
+        """ Hooks the lookups of the global module so that they load sources on misses. """
+        if self._originals is not None: return
+        global_module = self.context.global_module
+        self._originals = {}
+        for name in self.LOOKUPS:
+            original = getattr(global_module, name, None)
+            if original is not None:
+                self._originals[name] = original
+                setattr(global_module, name, self._lookup(original))
+
+    def uninstall(self):
+        """ Restores the lookups of the global module. """
+        global_module = self.context.global_module
+        for name in self._originals or {}:
+            delattr(global_module, name)
+        self._originals = None
+
+    def _lookup(self, original):
+        index = self
+        def lookup(fqn, *args, **kwargs):
+            if not isinstance(fqn, basestring):
+                return original(fqn, *args, **kwargs)
+            try:
+                out = original(fqn, *args, **kwargs)
+            except index.NOT_FOUND:
+                exc_info = sys.exc_info()
+                if not index.load_name(fqn):
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                return original(fqn, *args, **kwargs)
+            if not out and index.load_name(fqn):
+                out = original(fqn, *args, **kwargs)
+            return out
+        return lookup
@@ -0,0 +1,97 @@
+
+from __future__ import absolute_import
+import os
+import json
+import hashlib
+
+def content_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+def file_hash(path):
+    """ Returns the hash of the contents of a file (or None if there is no such file). """
+    if not path or not os.path.isfile(path):
+        return None
+    with open(path, "rb") as f:
+        return content_hash(f.read())
+
+class BuildManifest(object):
+    """
+    Records what each generated output file depended on so that the next build only
+    regenerates the outputs whose dependencies changed:
+
+        entities    -   FQNs of the entities written to the output.
+        inputs      -   Hashes of the source files of those entities and of the entities
+                        they (transitively) refer to.
+        templates   -   Hashes of the templates (including imported macros) rendered into it.
+        settings    -   Hash of the package spec and the platform the output was generated for.
+        output      -   Hash of the output as written (so outputs changed since are regenerated).
+
+    Hashes of files are computed once per manifest (ie per build).
+    """
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.outputs = {}
+        self._file_hashes = {}
+        self._template_hashes = {}
+        self.load()
+
+    def load(self):
+        self.outputs = {}
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except ValueError:
+            return
+        if saved.get("version") == self.VERSION:
+            self.outputs = saved.get("outputs", {})
+
+    def save(self):
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        temp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(temp_path, "w") as f:
+            json.dump({"version": self.VERSION, "outputs": self.outputs}, f, indent = 1, sort_keys = True)
+        os.rename(temp_path, self.path)
+
+    def file_hash(self, path):
+        if path not in self._file_hashes:
+            self._file_hashes[path] = file_hash(path)
+        return self._file_hashes[path]
+
+    def template_hash(self, template_loader, template_name):
+        if template_name not in self._template_hashes:
+            self._template_hashes[template_name] = template_loader.source_hash(template_name)
+        return self._template_hashes[template_name]
+
+    def is_stale(self, filename, output_path, fqns, settings, template_loader):
+        """ Tells if an output (with the given entities) has to be regenerated. """
+        record = self.outputs.get(filename)
+        if record is None or record["settings"] != settings or sorted(fqns) != record["entities"]:
+            return True
+        if file_hash(output_path) != record["output"]:
+            return True
+        for path, saved in record["inputs"].iteritems():
+            if self.file_hash(path) != saved:
+                return True
+        for name, saved in record["templates"].iteritems():
+            if self.template_hash(template_loader, name) != saved:
+                return True
+        return False
+
+    def record(self, filename, output_path, fqns, input_paths, templates, settings):
+        """ Records the dependencies of an output that has just been generated. """
+        self.outputs[filename] = {
+            "entities": sorted(fqns),
+            "inputs": dict((path, self.file_hash(path)) for path in input_paths),
+            "templates": dict(templates),
+            "settings": settings,
+            "output": file_hash(output_path),
+        }
+
+    def forget(self, filename):
+        self.outputs.pop(filename, None)
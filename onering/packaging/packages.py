@@ -5,8 +5,15 @@ import glob, fnmatch
 import importlib
 from onering.utils import dirutils, misc
 from onering.actions import LoaderActions
+from onering.actions.loaders import is_onering_source
+from onering.packaging.pipeline import EntityPipeline
 from onering.core import templates as tplloader
 
+def analyze_entities(context, entities):
+    """ Runs the semantic analyzer on the given (fqn -> entity) entities to fix any holes. """
+    from typecube.analyzer import Analyzer
+    Analyzer(context.global_module, entities).analyze()
+
 class PlatformConfig(object):
     """ Platform specific configs.  """
 
@@ -70,8 +77,16 @@ class Package(object):
     """
     dependencies = {}
 
+    """ Where the schemas referred to (but not loaded) are resolved from, each being a dict with either:
+
+        "entries" and "dir" (or "jardir" and an optional "prefix")  -   folders (or jars) of schema files
+        "url" and optionally "cache_dir", "workers", "timeout" and "offline"  -   an HTTP schema registry
+    """
     resolvers = []
 
+    """ Number of processes in which inputs are parsed. """
+    parse_workers = 1
+
     """ Root folder of the output.  
     
     Files will be generated into:
@@ -82,6 +97,7 @@ class Package(object):
 
     def __init__(self, package_spec_path = None):
         self.package_dir = None
+        self.spec_path = None
         if package_spec_path:
             self.load_from_path(package_spec_path)
 
@@ -96,6 +112,7 @@ class Package(object):
         exec pkgcode in pkgdata
 
         self.package_dir = os.path.abspath(os.path.dirname(package_spec_path))
+        self.spec_path = package_spec_path
         self.load(**pkgdata)
 
     def load(self, **kwargs):
@@ -105,6 +122,7 @@ class Package(object):
         self.inputs = kwargs["inputs"]
         self.dependencies = kwargs.get("dependencies", {})
         self.resolvers = kwargs.get("resolvers", [])
+        self.parse_workers = kwargs.get("parse_workers", 1)
         self.found_entities = {}
         self.platform_configs = {}
         self.current_platform = None
@@ -119,7 +137,22 @@ class Package(object):
 
     def load_entities(self, context):
         """ Loads the package spec from a package.spec file. """
+        for fqn, entity in self.iter_entities(context):
+            pass
+        return self
 
+    def iter_entities(self, context):
+        """
+        Loads the entities of the package (as load_entities does) but as a generator that
+        yields the (fqn, entity) of each entity in the package's inputs as soon as it is
+        ready so consumers (eg a generator) can work on it while later inputs are still
+        being loaded.
+
+        An entity is ready once the entities it refers to are loaded and it has been
+        analyzed (see onering.packaging.pipeline.EntityPipeline).  Entities referring to
+        entities that are not loaded by then (eg forward references) are analyzed and
+        yielded after all inputs are loaded.
+        """
         context.pushdir()
 
         context.curdir = self.package_dir
@@ -129,40 +162,132 @@ class Package(object):
         context.entity_resolver = self._load_entity_resolver(context)
 
         # Load dependencies so resolutions will succeed
-        for dep_pkg_name,dep_pkg_path in self.dependencies.iteritems():
-            abs_dep_pkg_path = os.path.abspath(os.path.join(self.package_dir, dep_pkg_path))
-            context.ensure_package(dep_pkg_name, abs_dep_pkg_path)
+        self._load_dependencies(context)
 
         # Load the necessary things common to all platforms
         # Each entry in the inputs list can be:
         # A file or a wildcard that is either an absolute path or
         # a path relative to the folder where the package_spec exists
-        self.found_entities = LoaderActions(context).load_entries(self.inputs)
-
-        context.popdir()
-        context.entity_resolver = old_entity_resolver
-
-        # Kick off the semantic analyzer on the parsed entites
+        workers = context.parse_workers or self.parse_workers
+        self.found_entities = {}
+        pipeline = EntityPipeline(context.global_module.find_fqn, lambda entities: analyze_entities(context, entities))
+        try:
+            for batch in LoaderActions(context, workers = workers).iter_batches(self.inputs):
+                self.found_entities.update(batch)
+                for ready in pipeline.add(batch):
+                    yield ready
+        finally:
+            context.popdir()
+            context.entity_resolver = old_entity_resolver
+
+        # Kick off the semantic analyzer on the entities left
         # to fix any holes.
-        from typecube.analyzer import Analyzer
-        analyzer = Analyzer(context.global_module, self.found_entities)
-        analyzer.analyze()
+        for ready in pipeline.finish():
+            yield ready
+
+    def index_entities(self, context):
+        """
+        Prepares the package to be loaded lazily instead of loading all its entities (as
+        load_entities does).  The onering sources in the package's inputs are only indexed
+        (see onering.packaging.lazy.LazyEntities) and each is loaded (with load_source) when
+        an entity or module declared in it is first looked up.  Other inputs are loaded.
+        """
+        context.pushdir()
+        context.curdir = self.package_dir
+        old_entity_resolver = context.entity_resolver
+        context.entity_resolver = self._load_entity_resolver(context)
+        self._load_dependencies(context)
+
+        self.found_entities = {}
+        try:
+            actions = LoaderActions(context, workers = context.parse_workers or self.parse_workers)
+            others = []
+            for source in actions.collect_sources(self.inputs):
+                if type(source) is not dict and is_onering_source(source):
+                    context.lazy_entities.add_source(self, context.abspath(source))
+                else:
+                    others.append(source)
+            if others:
+                self.found_entities.update(actions.iter_entries(others))
+        finally:
+            context.popdir()
+            context.entity_resolver = old_entity_resolver
+
+        if self.found_entities:
+            analyze_entities(context, self.found_entities)
         return self
 
+    def load_source(self, context, path):
+        """ Loads a single (indexed) onering source of the package and returns the entities loaded from it. """
+        context.pushdir()
+        context.curdir = self.package_dir
+        old_entity_resolver = context.entity_resolver
+        context.entity_resolver = self.entity_resolver
+        try:
+            entities = LoaderActions(context).load_file(path)
+        finally:
+            context.popdir()
+            context.entity_resolver = old_entity_resolver
+        self.found_entities.update(entities)
+        analyze_entities(context, entities)
+        return entities
+
+    def unload_source(self, context, path):
+        """
+        Removes the entities loaded from a source (eg one that has changed or has been
+        deleted) from the package and from their modules.  Returns their FQNs.
+        """
+        fqns = [fqn for fqn, source in context.entity_sources.iteritems() if source == path and fqn in self.found_entities]
+        for fqn in fqns:
+            del self.found_entities[fqn]
+            del context.entity_sources[fqn]
+            module_fqn, _, name = fqn.rpartition(".")
+            module = context.global_module.find_fqn(module_fqn) if module_fqn else context.global_module
+            # Modules without a remove have the entity replaced when the source is loaded again
+            remove = getattr(module, "remove", None)
+            if remove: remove(name)
+        return fqns
+
+    def source_paths(self, context):
+        """ Returns the absolute paths of the source files matching the package's inputs. """
+        context.pushdir()
+        context.curdir = self.package_dir
+        try:
+            sources = LoaderActions(context).collect_sources(self.inputs)
+            return [context.abspath(source) for source in sources if type(source) is not dict]
+        finally:
+            context.popdir()
+
+    def _load_dependencies(self, context):
+        for dep_pkg_name,dep_pkg_path in self.dependencies.iteritems():
+            abs_dep_pkg_path = os.path.abspath(os.path.join(self.package_dir, dep_pkg_path))
+            context.ensure_package(dep_pkg_name, abs_dep_pkg_path)
+
     def _load_entity_resolver(self, context):
         from onering.loaders import resolver as orresolver
         self.entity_resolver = orresolver.EntityResolver()
+        self.entity_resolver.schema_cache = context.schema_cache
         for resolver in self.resolvers:
+            if "url" in resolver:
+                # Schemas in an HTTP schema registry
+                from onering.loaders.httpresolver import HttpEntityResolver
+                cache_dir = resolver.get("cache_dir")
+                if cache_dir:
+                    cache_dir = os.path.abspath(os.path.join(context.curdir, cache_dir))
+                self.entity_resolver.add_resolver(HttpEntityResolver(resolver["url"], cache_dir,
+                                                                     workers = resolver.get("workers", 4),
+                                                                     timeout = resolver.get("timeout", 10),
+                                                                     offline = resolver.get("offline", False)))
+                continue
             entries_wc = resolver.get("entries")
             entry_dir = resolver.get("dir", resolver.get("jardir", None))
             edir = os.path.abspath(os.path.join(context.curdir, entry_dir))
             eprefix = resolver.get("prefix", None)
-            for f in misc.collect_files(edir):
-                if fnmatch.fnmatch(f, entries_wc):
-                    if "jardir" in resolver:
-                        self.entity_resolver.add_resolver(orresolver.ZipFilePathEntityResolver(f, eprefix))
-                    else:
-                        self.entity_resolver.add_resolver(orresolver.FilePathEntityResolver(f))
+            for f in context.fs_index.match(edir, entries_wc):
+                if "jardir" in resolver:
+                    self.entity_resolver.add_resolver(orresolver.ZipFilePathEntityResolver(f, eprefix))
+                else:
+                    self.entity_resolver.add_resolver(orresolver.FilePathEntityResolver(f))
         return self.entity_resolver
 
     def select_platform(self, platname):
@@ -189,3 +314,20 @@ class Package(object):
         generator_class = platform.get_generator_class()
         generator = generator_class(context, self, output_dir)
         return generator
+
+    def build_generator(self, context, output_root, platform_name, incremental = False, render_cache = None):
+        """
+        Selects a platform, copies its resources and returns the generator of the package
+        into its folder under output_root.  If incremental the generator gets the build
+        manifest kept in that folder for the platform (saved as the generator closes its
+        files) and render_cache (a RenderCache) is set as its render cache.
+        """
+        self.select_platform(platform_name)
+        pkgdir = os.path.abspath(os.path.join(output_root, self.name))
+        self.copy_resources(context, pkgdir)
+        generator = self.get_generator(context, pkgdir)
+        if incremental:
+            from onering.packaging.manifest import BuildManifest
+            generator.manifest = BuildManifest(os.path.join(pkgdir, ".onering-manifest.%s.json" % platform_name))
+        generator.render_cache = render_cache
+        return generator
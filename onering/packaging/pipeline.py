@@ -0,0 +1,115 @@
+
+from __future__ import absolute_import
+from onering.core.fingerprints import entity_references
+
+class EntityPipeline(object):
+    """
+    Hands entities on (analyzed) as soon as they are fully resolved ie once every
+    entity they (transitively) refer to has been loaded so that later stages (eg
+    generation) can work on them while later sources are still being loaded.
+
+    Entities are added (with add) in the batches they were registered in their modules
+    (see LoaderActions.iter_batches).  An entity is ready when each entity it refers to
+    is either ready itself or was loaded before the pipeline (eg by a dependency
+    package).  Ready entities are analyzed and returned by the add that made them ready
+    while the others wait.  Entities still waiting once all entities are added (eg ones
+    in reference cycles or with forward references only the analyzer can resolve) are
+    analyzed in one go by finish.
+
+    The entities analyzed together are closed over their references: each entity they
+    refer to is either analyzed with them, was analyzed by an earlier add or was loaded
+    before the pipeline.  As a batch is added as a whole before any of it is checked, the
+    entities found with find_fqn (but not added) are never ones still to be added.
+
+    References are looked up in the module of the referring entity and in the modules
+    above it (see candidates) and entities wait on the FQNs their references resolve to.
+    """
+    def __init__(self, find_fqn, analyze):
+        """
+        Params:
+
+            find_fqn    -   Function returning the (already loaded) entity with a FQN or None.
+            analyze     -   Function called with a dict of fqn -> entity to analyze.
+        """
+        self.find_fqn = find_fqn
+        self.analyze = analyze
+        self.loaded = {}
+        self.ready = set()
+        # fqn -> (entity, references not resolved yet) of the entities waiting
+        self.waiting = {}
+        # fqn -> FQNs of the entities waiting on a reference that resolves (or may resolve) to it
+        self.waiters = {}
+
+    def add(self, entities):
+        """
+        Adds a batch of (fqn, entity) that have been loaded together and returns the
+        (fqn, entity) of the entities now ready.
+        """
+        pending = []
+        for fqn, entity in entities:
+            self.loaded[fqn] = entity
+            self.waiting[fqn] = entity, set(entity_references(entity))
+            pending.append(fqn)
+        # Entities waiting on a reference to one of these may now wait on it (or be ready)
+        for fqn, entity in entities:
+            pending.extend(sorted(self.waiters.pop(fqn, ())))
+
+        ready = []
+        while pending:
+            current = pending.pop(0)
+            if current not in self.waiting: continue
+            current_entity, refs = self.waiting[current]
+            missing, blockers = set(), set()
+            for ref in refs:
+                fqns = self.blockers(ref, current)
+                if fqns:
+                    missing.add(ref)
+                    blockers.update(fqns)
+            if missing:
+                self.waiting[current] = current_entity, missing
+                for fqn in blockers:
+                    self.waiters.setdefault(fqn, set()).add(current)
+                continue
+            del self.waiting[current]
+            self.ready.add(current)
+            ready.append((current, current_entity))
+            # Entities waiting on this one may be ready now
+            pending.extend(sorted(self.waiters.pop(current, ())))
+
+        if ready:
+            self.analyze(dict(ready))
+        return ready
+
+    def finish(self):
+        """ Analyzes the entities still waiting (once all are added) and returns their (fqn, entity). """
+        ready = sorted((fqn, entity) for fqn, (entity, missing) in self.waiting.iteritems())
+        self.waiting = {}
+        self.waiters = {}
+        self.ready.update(fqn for fqn, entity in ready)
+        if ready:
+            self.analyze(dict(ready))
+        return ready
+
+    def candidates(self, ref, fqn):
+        """ FQNs a reference (in the entity with the given FQN) can refer to, innermost module first. """
+        out = []
+        module = fqn.rpartition(".")[0]
+        while module:
+            out.append(module + "." + ref)
+            module = module.rpartition(".")[0]
+        out.append(ref)
+        return out
+
+    def blockers(self, ref, fqn):
+        """
+        Returns the FQNs a reference (in the entity with the given FQN) waits on ie none if
+        the entity it refers to is ready, the FQN of the entity it refers to if that is
+        added but not ready or else all the FQNs it may refer to (see candidates).
+        """
+        candidates = self.candidates(ref, fqn)
+        for candidate in candidates:
+            if candidate in self.loaded:
+                return [] if candidate == fqn or candidate in self.ready else [candidate]
+            if self.find_fqn(candidate) is not None:
+                return []
+        return candidates
@@ -1,10 +1,13 @@
 
 import os
+import hashlib
+from StringIO import StringIO
 from ipdb import set_trace
 from typecube import core as tccore
 from typecube import ext as tcext
 from onering.utils.misc import FQN
-from onering.utils.dirutils import open_file_for_writing
+from onering.core.fingerprints import Fingerprints
+from onering.utils.dirutils import write_if_changed
 
 class Generator(object):
     def __init__(self, context, package, output_dir):
@@ -14,11 +17,102 @@ class Generator(object):
         self._allfiles = {}
         self._openfiles = set()
 
+        # If set (a BuildManifest) only the outputs whose dependencies changed are generated
+        self.manifest = None
+        # If set (a RenderCache) the text rendered by view models is reused when their entities are unchanged
+        self.render_cache = None
+        # Outputs that were up to date (and not generated) and the FQNs of the entities in the others
+        self.skipped_files = set()
+        self.file_entities = {}
+        # FQN -> paths of the files the schemas of resolved entities were read from (see resolved_sources)
+        self._resolved_sources = None
+        # If set (eg to Package.iter_entities) the (fqn, entity) of the package's entities as they
+        # are loaded so entities are generated while the package is still being loaded
+        self.entity_stream = None
+
+        # Fingerprints of the package's entities (and of the entities they refer to)
+        self.fingerprints = Fingerprints.for_package(context, package)
+
     def generate(self, context):
         """ Generates all artifacts for a particular platform. """
         # Close all the files we have open
         pass
 
+    def filename_for_entity(self, fqn, entity):
+        """ Returns the path (relative to the output_dir) of the file an entity is generated into. """
+        assert False, "Not yet implemented"
+
+    def entities_to_generate(self):
+        """
+        Yields the (fqn, entity) of the package's entities that are to be generated ie all of
+        them unless there is a manifest in which case the entities in outputs that are up to
+        date are skipped (and the outputs are left untouched).
+
+        With an entity_stream entities are yielded as they come off the stream unless
+        there is a manifest (as outputs can only be checked once all their entities are known).
+        """
+        if self.entity_stream is not None:
+            entities, self.entity_stream = self.entity_stream, None
+            if not self.manifest:
+                for fqn, entity in entities:
+                    self.file_entities.setdefault(self.filename_for_entity(fqn, entity), []).append(fqn)
+                    yield fqn, entity
+                return
+            for fqn, entity in entities:
+                pass
+
+        outputs = {}
+        for fqn, entity in self.package.found_entities.iteritems():
+            outputs.setdefault(self.filename_for_entity(fqn, entity), []).append((fqn, entity))
+        settings = self.settings_hash()
+        for filename, entities in outputs.iteritems():
+            fqns = [fqn for fqn, entity in entities]
+            if self.manifest and not self.manifest.is_stale(filename, self.output_path(filename), fqns,
+                                                            settings, self.package.template_loader):
+                self.skipped_files.add(filename)
+                continue
+            self.file_entities[filename] = fqns
+            for fqn, entity in entities:
+                yield fqn, entity
+
+    def output_path(self, filename):
+        return os.path.abspath(os.path.join(self.output_dir, filename))
+
+    def settings_hash(self):
+        """ Hash of the package and platform settings all outputs depend on. """
+        from onering.packaging.manifest import file_hash
+        platform = self.package.current_platform
+        settings = [file_hash(self.package.spec_path), platform.name, platform.generator_class, self.__class__.__module__]
+        return hashlib.sha1(repr(settings)).hexdigest()
+
+    def input_paths(self, fqns):
+        """
+        Returns the source files of the given entities and of all the entities they refer to
+        ie the files they were loaded from or, for entities resolved by FQN, the schema
+        files (or jars) they were resolved from.
+        """
+        sources = self.context.entity_sources
+        resolved = self.resolved_sources()
+        out = set()
+        for fqn in self.fingerprints.closure(fqns):
+            if sources.get(fqn):
+                out.add(sources[fqn])
+            else:
+                out.update(resolved.get(fqn, ()))
+        return out
+
+    def resolved_sources(self):
+        """ FQN -> paths of the files the schemas resolved by the package (and its dependencies) were read from. """
+        if self._resolved_sources is None:
+            self._resolved_sources = {}
+            packages = [self.package] + getattr(self.context, "packages", {}).values()
+            for package in packages:
+                entity_resolver = getattr(package, "entity_resolver", None)
+                if entity_resolver is None: continue
+                for fqn, paths in entity_resolver.sources_by_fqn().iteritems():
+                    self._resolved_sources.setdefault(fqn, set()).update(paths)
+        return self._resolved_sources
+
     def finalise(self):
         """ Calls just before closing of all files that are being written to. """
         pass
@@ -45,6 +139,21 @@ class Generator(object):
 
     def close_files(self):
         [f.close() for f in self._allfiles.itervalues()]
+        if self.manifest:
+            settings = self.settings_hash()
+            for filename, f in self._allfiles.iteritems():
+                if filename in self.file_entities:
+                    fqns = self.file_entities[filename]
+                    self.manifest.record(filename, f.output_path, fqns, self.input_paths(fqns), f.templates, settings)
+            # Outputs of entities that are no longer in the package are removed
+            produced = set(self.file_entities) | self.skipped_files
+            for filename in self.manifest.outputs.keys():
+                if filename not in produced:
+                    path = self.output_path(filename)
+                    if os.path.isfile(path):
+                        os.remove(path)
+                    self.manifest.forget(filename)
+            self.manifest.save()
         self._allfiles = {}
 
 class File(object):
@@ -52,7 +161,11 @@ class File(object):
     def __init__(self, generator, fname):
         self.generator = generator
         self.filename = fname
-        self.output_file = open_file_for_writing(self.output_dir, self.filename)
+        # Contents are written out on close and only if they changed
+        self.output_file = StringIO()
+        # name -> hash of the templates rendered into this file (and the dicts they are recorded into)
+        self.templates = {}
+        self.recorders = [self.templates]
 
     @property
     def output_dir(self):
@@ -67,17 +180,28 @@ class File(object):
         return self.output_file.closed
 
     def load_template(self, template_name, **extra_globals):
+        self.generator.package.template_loader.recorders = self.recorders
         templ = self.generator.package.template_loader.load_from_file(template_name)
         templ.globals.update(extra_globals)
         self.template_loaded(templ)
         return templ
 
     def load_template_from_string(self, template_string, **extra_globals):
+        self.generator.package.template_loader.recorders = self.recorders
         templ = self.generator.package.template_loader.load_from_string(template_string)
         templ.globals.update(extra_globals)
         self.template_loaded(templ)
         return templ
 
+    def cached_render(self, view, entity, render, *key_parts):
+        """
+        Returns the text rendered (by render()) for a view model of an entity, reusing the
+        text rendered for it before if the generator has a render cache.
+        """
+        if self.generator.render_cache is None:
+            return render()
+        return self.generator.render_cache.render(self, view, entity, render, *key_parts)
+
     def template_loaded(self, templ):
         """ Called after a template has been loaded. """
         templ.globals["breakpoint"] = breakpoint
@@ -100,6 +224,8 @@ class File(object):
 
     def close(self):
         """ Close the output file. """
+        if not self.closed:
+            write_if_changed(self.output_path, self.output_file.getvalue())
         self.output_file.close()
 
     def write(self, value, flush = False):
@@ -8,6 +8,7 @@ from typecube import ext as tlext
 from onering.utils.misc import FQN
 from onering.utils.dirutils import open_file_for_writing
 from onering.codegen import symtable, ir
+from onering.dsl.parser.deferred import ensure_body
 from onering.packaging.utils import is_type_entity, is_typeop_entity, is_fun_entity
 from onering.targets import base
 from onering.targets import common as orgencommon
@@ -31,7 +32,7 @@ class Generator(base.Generator):
         self._generate_preamble()
 
         aliases = []
-        for fqn,entity in self.package.found_entities.iteritems():
+        for fqn,entity in self.entities_to_generate():
             # send this to a particular file based on its fqn
             filename = self.filename_for_entity(fqn, entity)
             outfile, just_opened = self.ensure_file(filename)
@@ -61,7 +62,7 @@ class Generator(base.Generator):
 
     def _generate_main(self):
         gen_files = []
-        for f in self._allfiles.iterkeys():
+        for f in sorted(set(self._allfiles.keys()) | self.skipped_files):
             if not f.endswith(".js"): continue
             if not f.startswith("lib/"): continue
             if f == "lib/index.js": continue
@@ -209,6 +210,9 @@ class TypeViewModel(object):
         self.fqn = fqn = FQN(fqn, None)
 
     def render(self):
+        return self.outfile.cached_render(self, self.thetype, self.render_template, self.fqn.fqn)
+
+    def render_template(self):
         print "Generating %s model" % self.fqn.fqn
         templ = self.outfile.load_template("es6/%s.tpl" % self.thetype.tag)
         return templ.render(**{self.thetype.tag: self})
@@ -220,6 +224,9 @@ class TypeOpViewModel(object):
         self.child_view = TypeViewModel("", self.typeop.expr, outfile)
 
     def render(self):
+        return self.outfile.cached_render(self, self.typeop, self.render_template)
+
+    def render_template(self):
         print "Generating Fun: %s" % self.typeop.fqn
         templ = self.outfile.load_template("es6/typeop.tpl")
         return templ.render(view = self, typeop = self.typeop)
@@ -229,10 +236,14 @@ class FunViewModel(object):
     def __init__(self, function, outfile):
         print "Fun Value: ", function
         self.function = function
+        ensure_body(self.function)
         self.outfile = outfile
         if self.function.isa(tccore.TypeOp): set_trace()
 
     def render(self):
+        return self.outfile.cached_render(self, self.function, self.render_template)
+
+    def render_template(self):
         print "Generating Fun: %s" % self.function.fqn
         templ = self.outfile.load_template("es6/function.tpl")
         return templ.render(view = self, function = self.function)
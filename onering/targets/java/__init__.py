@@ -8,6 +8,7 @@ from typecube import ext as tlext
 from onering.utils.misc import FQN
 from onering.utils.dirutils import open_file_for_writing
 from onering.codegen import symtable, ir
+from onering.dsl.parser.deferred import ensure_body
 from onering.packaging.utils import is_type_entity, is_typefun_entity, is_fun_entity
 from onering.targets import base
 from onering.targets import common as orgencommon
@@ -27,7 +28,7 @@ class Generator(base.Generator):
 
     def generate(self):
         aliases = []
-        for fqn,entity in self.package.found_entities.iteritems():
+        for fqn,entity in self.entities_to_generate():
             # send this to a particular file based on its fqn
             filename = self.filename_for_entity(fqn, entity)
             outfile, just_opened = self.ensure_file(filename)
@@ -163,6 +164,9 @@ class TypeViewModel(object):
         self.fqn = fqn = FQN(fqn, None)
 
     def render(self):
+        return self.outfile.cached_render(self, self.thetype, self.render_template, self.fqn.fqn)
+
+    def render_template(self):
         print "Generating %s model" % self.fqn.fqn
         templ = self.outfile.load_template("java/%s.tpl" % self.thetype.tag)
         return templ.render(**{self.thetype.tag: self})
@@ -174,6 +178,9 @@ class TypeFunViewModel(object):
         self.child_view = TypeViewModel("", self.typefun.expr, outfile)
 
     def render(self):
+        return self.outfile.cached_render(self, self.typefun, self.render_template)
+
+    def render_template(self):
         print "Generating Fun: %s" % self.typefun.fqn
         templ = self.outfile.load_template("java/typefun.tpl")
         return templ.render(view = self, typefun = self.typefun)
@@ -183,6 +190,7 @@ class FunViewModel(object):
     def __init__(self, function, fun_type, outfile):
         print "Fun Value: ", function
         self.function = function
+        ensure_body(self.function)
         self.outfile = outfile
         self._symtable = None
         self.real_fun_type = self.function.fun_type
@@ -193,6 +201,9 @@ class FunViewModel(object):
             self.return_typearg = None
 
     def render(self):
+        return self.outfile.cached_render(self, self.function, self.render_template)
+
+    def render_template(self):
         print "Generating Fun: %s" % self.function.fqn
         templ = self.outfile.load_template("java/function.tpl")
         return templ.render(view = self, function = self.function)
@@ -0,0 +1,121 @@
+
+from __future__ import absolute_import
+import os
+import sys
+import json
+import hashlib
+from onering.packaging.manifest import file_hash
+
+class RenderCache(object):
+    """
+    A content addressed cache of the text rendered by view models (see File.cached_render)
+    so that entities whose structure has not changed are not rendered again.
+
+    An entry is keyed by the view model, the (deep) fingerprint of the entity ie of its
+    structure and of all the entities it refers to, the platform config and the code of the view
+    model's module.  Each entry holds the text, the hashes of the templates (and imported
+    macros) that were rendered and the imports ensured while rendering.  An entry is only
+    used if its templates are unchanged and if its imports resolve to the same names in
+    the file it is spliced into.
+
+    Template hashes are computed once per build (see new_build) and fingerprints once per
+    generator (see Generator.fingerprints).
+    """
+    def __init__(self, cache_dir = None):
+        self.cache_dir = cache_dir
+        self.entries = {}
+        self.hits = self.misses = 0
+        self._template_hashes = {}
+        self._module_hashes = {}
+
+    def new_build(self):
+        """ Forgets the hashes of templates and modules (that may have changed since the last build). """
+        self._template_hashes = {}
+        self._module_hashes = {}
+
+    @property
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+    def render(self, outfile, view, entity, render, *key_parts):
+        """ Returns the text rendered by render() for a view of an entity (from the cache if possible). """
+        key = self.key_for(outfile.generator, view, entity, key_parts)
+        entry = self.get(key)
+        loader = outfile.generator.package.template_loader
+        if entry is not None and self.templates_match(loader, entry["templates"]) and \
+                all(outfile.importer.ensure(fqn) == name for fqn, name in entry["imports"]):
+            self.hits += 1
+            for recorder in outfile.recorders:
+                recorder.update(entry["templates"])
+            return entry["text"]
+
+        self.misses += 1
+        templates, imports = {}, []
+        importer = outfile.importer
+        previous = importer.__dict__.get("ensure")
+        ensure = importer.ensure
+        def recording_ensure(fqn):
+            name = ensure(fqn)
+            imports.append((fqn, name))
+            return name
+        importer.ensure = recording_ensure
+        outfile.recorders.append(templates)
+        try:
+            text = render()
+        finally:
+            outfile.recorders.remove(templates)
+            if previous is None:
+                del importer.ensure
+            else:
+                importer.ensure = previous
+        self.put(key, {"text": text, "templates": templates, "imports": imports})
+        return text
+
+    def key_for(self, generator, view, entity, key_parts = ()):
+        platform = generator.package.current_platform
+        parts = [view.__class__.__module__, view.__class__.__name__, self.module_hash(view.__class__.__module__),
+                 generator.fingerprints.of_entity(entity), platform.name, platform.generator_class,
+                 platform.imports, platform.exports, generator.package.name, list(key_parts)]
+        return hashlib.sha1(repr(parts)).hexdigest()
+
+    def module_hash(self, module_name):
+        if module_name not in self._module_hashes:
+            path = getattr(sys.modules.get(module_name), "__file__", None)
+            if path and path.endswith(".pyc"):
+                path = path[:-1]
+            self._module_hashes[module_name] = file_hash(path)
+        return self._module_hashes[module_name]
+
+    def templates_match(self, loader, templates):
+        for name, saved in templates.iteritems():
+            if name not in self._template_hashes:
+                self._template_hashes[name] = loader.source_hash(name)
+            if self._template_hashes[name] != saved:
+                return False
+        return True
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, key):
+        if key not in self.entries and self.cache_dir:
+            path = self.path_for(key)
+            if os.path.isfile(path):
+                try:
+                    with open(path) as f:
+                        self.entries[key] = json.load(f)
+                except ValueError:
+                    pass
+        return self.entries.get(key)
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        if not self.cache_dir:
+            return
+        path = self.path_for(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp_path, "w") as f:
+            json.dump(entry, f)
+        os.rename(temp_path, path)
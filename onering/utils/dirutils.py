@@ -13,6 +13,22 @@ def open_file_for_writing(folder, fname):
         os.makedirs(outdir)
     return open(outfile, "w")
 
+def write_if_changed(path, contents):
+    """
+    Writes contents to a file unless the file already has the same contents (so its
+    modified time is left untouched).  Returns True if the file was written.
+    """
+    if os.path.isfile(path) and os.path.getsize(path) == len(contents):
+        with open(path, "rb") as f:
+            if f.read() == contents:
+                return False
+    outdir = os.path.dirname(path)
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    with open(path, "wb") as f:
+        f.write(contents)
+    return True
+
 class DirPointer(object):
     """
     A class to manage a pointer to a current directory and move around.
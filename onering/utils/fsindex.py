@@ -0,0 +1,131 @@
+
+import os
+import json
+import fnmatch
+import hashlib
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+def list_dir(path):
+    """
+    Returns the names of the files and of the (non symlinked) sub directories in a
+    directory.  Like os.walk, symlinks to directories are neither files nor walked into.
+    """
+    files, subdirs = [], []
+    if scandir is not None:
+        for entry in scandir(path):
+            if not entry.is_dir():
+                files.append(entry.name)
+            elif not entry.is_symlink():
+                subdirs.append(entry.name)
+    else:
+        for name in os.listdir(path):
+            full_path = os.path.join(path, name)
+            if not os.path.isdir(full_path):
+                files.append(name)
+            elif not os.path.islink(full_path):
+                subdirs.append(name)
+    return files, subdirs
+
+class FileIndex(object):
+    """
+    An index of the files under root directories so that a tree is walked once and
+    can then be queried (eg with fnmatch wildcards) any number of times from memory.
+
+    If a cache_dir is set then the listing of every directory in a tree is also saved
+    there along with the directory's modification time.  Later runs only list the
+    directories whose modification times have changed (ie that had entries added or
+    removed) instead of walking the whole tree again.
+
+    Changes made to a tree after it was walked are not seen until it is invalidated.
+    """
+    def __init__(self, cache_dir = None):
+        self.cache_dir = cache_dir
+        # root -> list of the paths of all files under it
+        self._files = {}
+
+    def files(self, root_dir):
+        """
+        Returns the paths of all files under a directory in the order os.walk(topdown = False)
+        would find them.
+        """
+        root_dir = os.path.abspath(root_dir)
+        files = self._files.get(root_dir)
+        if files is None:
+            files = self._files[root_dir] = self._walk(root_dir)
+        return files
+
+    def match(self, root_dir, wildcard):
+        """ Returns the paths of all files under a directory that match a fnmatch wildcard. """
+        return fnmatch.filter(self.files(root_dir), wildcard)
+
+    def invalidate(self, root_dir = None):
+        """ Forgets the files under a directory (or all directories) so it is walked again. """
+        if root_dir is None:
+            self._files = {}
+        else:
+            self._files.pop(os.path.abspath(root_dir), None)
+
+    def _walk(self, root_dir):
+        saved = self._load(root_dir) or {}
+        listings = {}
+        out = []
+        # Each entry is (dir path, whether its sub directories have been visited)
+        stack = [(root_dir, False)]
+        while stack:
+            path, visited = stack.pop()
+            if visited:
+                out.extend(os.path.join(path, name) for name in listings[path][1])
+                continue
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            listing = saved.get(path)
+            if listing is None or listing[0] != mtime:
+                try:
+                    files, subdirs = list_dir(path)
+                except OSError:
+                    continue
+                listing = [mtime, files, subdirs]
+            listings[path] = listing
+            stack.append((path, True))
+            stack.extend((os.path.join(path, name), False) for name in reversed(listing[2]))
+        if listings != saved:
+            self._save(root_dir, listings)
+        return out
+
+    def path_for(self, root_dir):
+        return os.path.join(self.cache_dir, hashlib.sha1(root_dir).hexdigest() + ".json")
+
+    def _load(self, root_dir):
+        if not self.cache_dir:
+            return None
+        path = self.path_for(root_dir)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except ValueError:
+            return None
+        if saved.get("root") != root_dir:
+            return None
+        return saved["dirs"]
+
+    def _save(self, root_dir, listings):
+        if not self.cache_dir:
+            return
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        path = self.path_for(root_dir)
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp_path, "w") as f:
+            json.dump({"root": root_dir, "dirs": listings}, f)
+        os.rename(temp_path, path)
@@ -45,19 +45,19 @@ def split_list_at(predicate, input_list):
     else:
         return input_list[:index], (index, input[index]), input_list[index + 1:]
 
-def collect_files(root_dir):
-    for root, dirs, files in os.walk(root_dir, topdown=False):
-        for name in files:
-            full_path = os.path.join(root, name)
-            yield full_path
+def collect_files(root_dir, fs_index = None):
+    """ Returns all files under a directory (from a FileIndex if one is given instead of walking the directory). """
+    if fs_index is not None:
+        return iter(fs_index.files(root_dir))
+    return (os.path.join(root, name) for root, dirs, files in os.walk(root_dir, topdown=False) for name in files)
 
-def collect_files_by_extension(root_dir, ext):
-    return ifilter(lambda path: path.endswith("." + ext) and os.path.isfile(path), collect_files(root_dir))
+def collect_files_by_extension(root_dir, ext, fs_index = None):
+    return ifilter(lambda path: path.endswith("." + ext) and os.path.isfile(path), collect_files(root_dir, fs_index))
 
-def collect_jars(root_dir):
+def collect_jars(root_dir, fs_index = None):
     def is_model_jar(name):
         return name.find("data-template") > 0 and name.find("SNAPSHOT") < 0 and name.endswith(".jar")
-    return ifilter(is_model_jar, collect_files(root_dir))
+    return ifilter(is_model_jar, collect_files(root_dir, fs_index))
 
 from optparse import Option
 class ListOption(Option):
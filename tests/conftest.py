@@ -0,0 +1,112 @@
+
+from __future__ import absolute_import
+import os
+from onering.loaders.resolver import EntityResolver
+
+# Fakes of the onering (and typecube) objects shared by the tests
+
+class Stub(object):
+    """ An object with the given attributes. """
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+class Record(object):
+    """ A record with the given fields (or type expressions) and docs. """
+    def __init__(self, fqn, *fields, **kwargs):
+        self.fqn = fqn
+        self.fields = list(fields)
+        self.docs = kwargs.get("docs", "")
+        self.parent = None
+
+class Field(object):
+    def __init__(self, name, type_expr, is_optional = False, default = None):
+        self.name = name
+        self.type_expr = type_expr
+        self.is_optional = is_optional
+        self.default = default
+
+class Module(object):
+    """ A module (with a FQN) or the global module (without one) of the given fqn -> entity entities. """
+    def __init__(self, entities = None, fqn = None):
+        self.entities = {} if entities is None else entities
+        self.fqn = fqn
+    def find_fqn(self, fqn): return self.entities.get(fqn)
+    def get(self, fqn): return self.entities[fqn]
+    def ensure_module(self, fqn): pass
+
+class Context(object):
+    """ A context whose global module has the given entities and whose entity resolver has the given resolvers. """
+    def __init__(self, entities = None, resolvers = ()):
+        self.global_module = Module(entities)
+        self.entity_resolver = EntityResolver()
+        for resolver in resolvers:
+            self.entity_resolver.add_resolver(resolver)
+        self.entity_sources = {}
+        self.packages = {}
+
+class Package(object):
+    """
+    A package of sources (path -> FQNs of the entities in it) whose entities are loaded
+    into the global module of a context (with their paths as the entities).
+    """
+    def __init__(self, sources):
+        self.sources = sources
+        self.loaded = []
+    def source_paths(self, context): return sorted(self.sources)
+    def load_source(self, context, path):
+        self.loaded.append(path)
+        context.global_module.entities.update((fqn, path) for fqn in self.sources[path])
+        return self.sources[path]
+    def unload_source(self, context, path):
+        # The module has no remove so the entities stay visible
+        return sorted(fqn for fqn, source in context.global_module.entities.iteritems() if source == path)
+
+class TemplateLoader(object):
+    """ A template loader with the given template name -> source hash. """
+    def __init__(self, hashes):
+        self.hashes = hashes
+    def source_hash(self, template_name):
+        return self.hashes.get(template_name)
+
+# Packages written to and built from folders
+
+""" Platforms packages written by write_package are generated for. """
+PLATFORMS = {
+    "platform_es6": {"exports": [("*", "models.js")]},
+    "platform_java": {},
+}
+
+def write_package(root, name, files, inputs, **settings):
+    """
+    Writes a package into the folder name under root (a py.path.local) and returns the
+    path of its package.spec.  files is a dict of path (relative to the package folder)
+    -> contents and settings (eg dependencies or resolvers) are written into the spec.
+    """
+    pkgdir = root.ensure_dir(name)
+    for path, contents in files.iteritems():
+        pkgdir.join(path).write(contents, ensure = True)
+    spec = dict(PLATFORMS, name = name, version = "0.0.1", description = "", inputs = inputs)
+    spec.update(settings)
+    pkgdir.join("package.spec").write("".join("%s = %r\n" % item for item in sorted(spec.iteritems())))
+    return str(pkgdir.join("package.spec"))
+
+def read_outputs(output_dir):
+    """ Returns the relative path -> contents of the files generated into a folder (but not manifests). """
+    out = {}
+    for dirpath, dirnames, filenames in os.walk(output_dir):
+        for filename in filenames:
+            if filename.startswith(".onering-manifest"): continue
+            path = os.path.join(dirpath, filename)
+            with open(path) as f:
+                out[os.path.relpath(path, output_dir)] = f.read()
+    return out
+
+def build_package(spec_path, output_dir, platform, context = None, render_cache = None):
+    """ Loads a package (into a new context unless one is given), generates it and returns its outputs. """
+    from onering.core.context import OneringContext
+    if context is None:
+        context = OneringContext()
+    package = context.load_package(spec_path)
+    generator = package.build_generator(context, output_dir, platform, render_cache = render_cache)
+    generator.generate()
+    return read_outputs(generator.output_dir)
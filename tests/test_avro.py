@@ -0,0 +1,54 @@
+
+import json
+from typecube import core as tccore
+from onering.loaders.avro import Registry, Loader
+from onering.loaders.resolver import FilePathEntityResolver
+from tests.conftest import Context
+
+def test_registry_resolves_missing_names(tmpdir):
+    schema_dir = tmpdir.mkdir("schemas")
+    schema_dir.mkdir("com").mkdir("b").join("Other.avsc").write(json.dumps(
+            {"type": "record", "name": "Other", "namespace": "com.b", "fields": [{"name": "s", "type": "string"}]}))
+    registry = Registry(Context(resolvers = [FilePathEntityResolver(str(schema_dir))]))
+    bundle = [{"type": "enum", "name": "Color", "namespace": "com.a", "symbols": ["RED"]},
+              {"type": "record", "name": "com.a.Shape", "fields": [
+                    {"name": "color", "type": "Color"},
+                    {"name": "points", "type": {"type": "array", "items": {"type": "record", "name": "Point", "fields": []}}},
+                    {"name": "other", "type": ["null", "com.b.Other"]}]}]
+    assert registry.add(bundle) == ["com.a.Color", "com.a.Shape", "com.a.Point"]
+    assert registry.references["com.a.Shape"] == [("Color", "com.a"), ("com.b.Other", "com.a")]
+    assert registry.fullname("Color", "com.a") == "com.a.Color"
+    assert registry.fullname("com.b.Other", "com.a") == "com.b.Other"
+    assert registry.resolve_missing(["com.a.Shape"]) == ["com.b.Other"]
+    assert registry.get("com.b.Other")[1] == "com.b"
+
+def test_loader_creates_named_types(tmpdir):
+    from onering.core.context import OneringContext
+    path = tmpdir.join("node.avsc")
+    path.write(json.dumps([
+        {"type": "enum", "name": "Color", "namespace": "com.a", "symbols": ["RED", "GREEN"]},
+        {"type": "fixed", "name": "Hash", "namespace": "com.a", "size": 16, "doc": "A digest"},
+        {"type": "record", "name": "Node", "namespace": "com.a", "fields": [
+            {"name": "color", "type": "Color"},
+            {"name": "hash", "type": "Hash"},
+            {"name": "value", "type": ["int", "string"]},
+            {"name": "next", "type": ["null", "Node"]},
+            {"name": "children", "type": {"type": "array", "items": "com.a.Node"}}]}]))
+    context = OneringContext()
+    loader = Loader(context)
+    entities = loader.load_paths([str(path)])
+    assert sorted(entities.keys()) == ["com.a.Color", "com.a.Hash", "com.a.Node"]
+    assert all(entities[fqn].fqn == fqn for fqn in entities)
+    assert all(context.global_module.find_fqn(fqn) is entities[fqn] for fqn in entities)
+    assert set(loader.entity_paths.values()) == set([str(path)])
+
+    fixed = entities["com.a.Hash"]
+    assert fixed.is_alias_type and fixed.size == 16 and fixed.docs == "A digest"
+    assert [symbol.name for symbol in entities["com.a.Color"].args] == ["RED", "GREEN"]
+
+    fields = dict((field.name, field) for field in entities["com.a.Node"].args)
+    assert fields["color"].type_expr.fqn == "com.a.Color"
+    assert fields["hash"].type_expr.fqn == "com.a.Hash"
+    assert isinstance(fields["value"].type_expr, tccore.SumType) and not fields["value"].is_optional
+    # The recursive reference is to the record itself
+    assert fields["next"].is_optional and fields["next"].type_expr.fqn == "com.a.Node"
@@ -0,0 +1,35 @@
+from __future__ import absolute_import
+
+from onering.packaging.batch import BatchBuild
+from tests.conftest import write_package, read_outputs, build_package
+
+def write_spec(root, name, dependencies):
+    spec = root.mkdir(name).join("package.spec")
+    spec.write("name = %r\nversion = '0.0.1'\ndescription = ''\ninputs = []\ndependencies = %r\n" % (name, dependencies))
+    return str(spec)
+
+def test_batch_levels(tmpdir):
+    write_spec(tmpdir, "base", {})
+    lib = write_spec(tmpdir, "lib", {"base": "../base"})
+    apps = [write_spec(tmpdir, "app%d" % i, {"lib": "../lib", "base": "../base"}) for i in xrange(2)]
+    batch = BatchBuild(None, apps + [lib], str(tmpdir.join("out")), "es6")
+    assert sorted(batch.specs.keys()) == ["app0", "app1", "base", "lib"]
+    assert batch.shared == ["base", "lib"]
+    assert batch.levels() == [["lib"], ["app0", "app1"]]
+
+BASE_SOURCE = "module base { record Id { value : long } }"
+
+def test_batch_builds_the_same_outputs_as_single_builds(tmpdir):
+    from onering.core.context import OneringContext
+    write_package(tmpdir, "base", {"base.onering": BASE_SOURCE}, ["./*.onering"])
+    apps = [write_package(tmpdir, "app%d" % i, {"app.onering": "module app%d { record App { id : base.Id } }" % i},
+                          ["./*.onering"], dependencies = {"base": "../base"}) for i in xrange(2)]
+    out = tmpdir.join("out")
+    batch = BatchBuild(OneringContext(), apps, str(out), "es6", incremental = True)
+    timings = batch.run()
+    assert not any("error" in result for result in timings.itervalues())
+    for i, app in enumerate(apps):
+        name = "app%d" % i
+        assert timings[name]["outputs"] > 0
+        assert out.join(name, ".onering-manifest.es6.json").exists()
+        assert read_outputs(str(out.join(name))) == build_package(app, str(tmpdir.join("single")), "es6")
@@ -0,0 +1,122 @@
+
+from __future__ import absolute_import
+import os
+import pytest
+import threading
+from onering.packaging import daemon as ordaemon
+from onering.packaging.daemon import DaemonServer, PackageState, send_request, file_stat
+from tests.conftest import Context, Package, write_package, read_outputs, build_package
+
+class Daemon(object):
+    def __init__(self):
+        self.states = {}
+
+    def build(self, package_path, output_dir, platform):
+        if not package_path:
+            raise ValueError("Package path required")
+        self.states[package_path] = platform
+        return {"package": package_path, "generated": [], "reloaded": [], "up_to_date": 0, "seconds": 0}
+
+def test_daemon_server(tmpdir):
+    address = str(tmpdir.join("daemon.sock"))
+    server = DaemonServer(address, Daemon())
+    thread = threading.Thread(target = server.serve_until_stopped)
+    thread.daemon = True
+    thread.start()
+
+    response = send_request(address, {"command": "build", "package": "/a", "output_dir": "/out", "platform": "java"}, 5)
+    assert (response["status"], response["package"]) == ("ok", "/a")
+    assert send_request(address, {"command": "ping"}, 5) == {"status": "ok", "packages": ["/a"]}
+    response = send_request(address, {"command": "build", "package": "", "output_dir": "/out"}, 5)
+    assert response == {"status": "error", "error": "ValueError: Package path required"}
+    assert send_request(address, {"command": "stop"}, 5) == {"status": "ok"}
+    thread.join(5)
+    assert not thread.is_alive() and not tmpdir.join("daemon.sock").exists()
+
+class Fingerprints(object):
+    def invalidate(self, fqn): pass
+
+def reload_sources(context, sources, changed):
+    daemon = ordaemon.Daemon.__new__(ordaemon.Daemon)
+    daemon.context = context
+    state = PackageState(Package(sources), {"templates": set()})
+    state.fingerprints = Fingerprints()
+    return daemon.reload_sources(state, changed, {"templates": set()})
+
+def test_reload_sources():
+    context = Context({"a.A": "/a", "a.B": "/a"})
+    assert reload_sources(context, {"/a": ["a.A", "a.B"]}, ["/a"]) == ["/a"]
+    # a.B was removed from /a but its module could not remove it
+    assert reload_sources(context, {"/a": ["a.A"]}, ["/a"]) is None
+    # /b was deleted and its entity could not be removed
+    context = Context({"a.A": "/a", "b.B": "/b"})
+    assert reload_sources(context, {"/a": ["a.A"]}, ["/b"]) is None
+
+class WatchedDaemon(ordaemon.Daemon):
+    def __init__(self):
+        self.states = {}
+        self.failures = 1
+        self.resets = 0
+
+    def reset(self):
+        self.states = {}
+        self.resets += 1
+
+    def build(self, package_path, output_dir, platform):
+        if self.failures:
+            self.failures -= 1
+            raise ValueError("Bad source")
+        self.states[ordaemon.spec_path(package_path)] = platform
+        return {"package": package_path, "status": "ok"}
+
+    def changed_packages(self):
+        return []
+
+def test_watch_reports_failed_builds(tmpdir, monkeypatch):
+    tmpdir.join("package.spec").write("{}")
+    source = tmpdir.join("a.onering")
+    source.write("record A {")
+    polls = []
+    def sleep(interval):
+        polls.append(interval)
+        if len(polls) == 2:
+            # The failed build is only retried once its files change
+            source.write("record A { }")
+        elif len(polls) == 4:
+            raise KeyboardInterrupt
+    monkeypatch.setattr(ordaemon.time, "sleep", sleep)
+
+    daemon = WatchedDaemon()
+    results = []
+    with pytest.raises(KeyboardInterrupt):
+        daemon.watch([(str(tmpdir), "/out", "java")], 0, results.append)
+    assert [result["status"] for result in results] == ["error", "ok"]
+    assert "ValueError: Bad source" in results[0]["error"]
+    assert daemon.resets == 1 and len(polls) == 4
+
+def test_file_stat(tmpdir):
+    path = tmpdir.join("a.onering")
+    assert file_stat(str(path)) is None
+    path.write("record A { }")
+    assert file_stat(str(path))[1] == 12
+
+def test_daemon_builds_packages_incrementally(tmpdir):
+    spec = write_package(tmpdir, "p", {"a.onering": "module a { record A { x : int } }",
+                                       "b.onering": "module b { record B { y : string } }"}, ["./*.onering"])
+    out = str(tmpdir.join("out"))
+    daemon = ordaemon.Daemon(str(tmpdir.join("cache")))
+    result = daemon.build(spec, out, "java")
+    assert result["generated"] and result["up_to_date"] == 0
+    assert read_outputs(os.path.join(out, "p")) == build_package(spec, str(tmpdir.join("single")), "java")
+    assert os.path.isfile(os.path.join(out, "p", ".onering-manifest.java.json"))
+
+    # Unchanged outputs are not generated again
+    result = daemon.build(spec, out, "java")
+    assert (result["generated"], result["reloaded"], result["up_to_date"]) == ([], [], 2)
+
+    # And changed sources are reloaded and their outputs generated again
+    tmpdir.join("p", "a.onering").write("module a { record A { x : int  z : long } }")
+    result = daemon.build(spec, out, "java")
+    assert result["reloaded"] == [str(tmpdir.join("p", "a.onering"))]
+    assert len(result["generated"]) == 1 and result["up_to_date"] == 1
+    assert read_outputs(os.path.join(out, "p")) == build_package(spec, str(tmpdir.join("changed")), "java")
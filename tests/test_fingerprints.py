@@ -0,0 +1,82 @@
+from __future__ import absolute_import
+
+from typecube import core as tccore
+from onering.core.fingerprints import Fingerprints, fingerprint, entity_references, changed
+from tests.conftest import Record, Field, Module, Context
+
+def test_fingerprint_structure():
+    record = Record("a.A", Field("x", tccore.make_ref("int")), docs = "Some docs")
+    same = Record("a.A", Field("x", tccore.make_ref("int")), docs = "Some docs")
+    same.parent = object()
+    assert fingerprint(record) == fingerprint(same)
+    for other in (Record("a.A", Field("x", tccore.make_ref("int"), True), docs = "Some docs"),
+                  Record("a.A", Field("x", tccore.make_ref("int"), False, 1), docs = "Some docs"),
+                  Record("a.A", Field("x", tccore.make_ref("long")), docs = "Some docs"),
+                  Record("a.A", Field("x", tccore.make_ref("int")))):
+        assert fingerprint(other) != fingerprint(record)
+    assert fingerprint(Record("a.A", *record.fields), False) == fingerprint(record, False)
+
+def test_deep_fingerprints_are_recomputed_incrementally():
+    entities = {"a.A": Record("a.A", Field("b", tccore.make_ref("a.B"))),
+                "a.B": Record("a.B", Field("c", tccore.make_ref("a.C"))),
+                "a.C": Record("a.C"),
+                "a.D": Record("a.D")}
+    lookups = []
+    def find_entity(fqn):
+        lookups.append(fqn)
+        return entities.get(fqn)
+    fingerprints = Fingerprints(find_entity)
+    before = fingerprints.dump(entities.keys())
+    assert before["a.A"]["references"] == ["a.B"]
+
+    entities["a.C"].fields.append(Field("x", tccore.make_ref("int")))
+    fingerprints.invalidate("a.C")
+    del lookups[:]
+    after = fingerprints.dump(entities.keys())
+    assert changed(before, after) == ["a.A", "a.B", "a.C"]
+    assert set(lookups) == set(["a.C", "int"])
+    assert fingerprints.of_module("a", ["a.C", "a.D"]) != fingerprints.of_module("a", ["a.D"])
+
+class SourceParser(object):
+    def __init__(self, source, context):
+        from onering.dsl.lexer import RegexLexer
+        self.lexer = RegexLexer(source, "a.onering")
+        self.onering_context = context
+        self.current_module = Module(fqn = "a")
+        self._entity_parsers = {}
+
+def make_function(source, context):
+    from onering.dsl.parser.deferred import DeferredExpr
+    start = source.index("{")
+    body = DeferredExpr(SourceParser(source, context), start, source.rindex("}") + 1)
+    fun_type = tccore.make_fun_type(None, [tccore.TypeArg("x", tccore.make_ref("a.A"))], tccore.TypeArg(None, tccore.make_ref("a.B")))
+    return tccore.Fun("a.f", fun_type, body, None)
+
+def test_fingerprint_tccore_entities():
+    record = tccore.make_product_type("record", "a.A", [tccore.TypeArg("b", tccore.make_ref("a.B")),
+                                                          tccore.TypeArg("n", tccore.make_ref("int"), True)])
+    same = tccore.make_product_type("record", "a.A", [tccore.TypeArg("b", tccore.make_ref("a.B")),
+                                                        tccore.TypeArg("n", tccore.make_ref("int"), True)])
+    other = tccore.make_product_type("record", "a.A", [tccore.TypeArg("b", tccore.make_ref("a.B"))])
+    assert fingerprint(record) == fingerprint(same) != fingerprint(other)
+    assert entity_references(record) == set(["a.B", "int"])
+
+def test_fingerprint_deferred_function_body():
+    source = "fun f(x : A) -> B { x => y }"
+    context = Context()
+    function = make_function(source, context)
+    # The body (and the parser state it holds on to) is not walked
+    assert entity_references(function) == set(["a.A", "a.B"])
+    before = fingerprint(function)
+    # Parser state that changes as entities are loaded
+    context.entity_sources["a.X"] = "/x"
+    assert fingerprint(function) == before == fingerprint(make_function(source, Context()))
+    assert fingerprint(make_function("fun f(x : A) -> B { x => z }", context)) != before
+
+    # Parsed bodies keep the fingerprint of their text
+    parsed = tccore.Expr()
+    parsed.deferred_source = function.expr.source_parts
+    parsed.children = [tccore.make_ref("a.C")]
+    function.expr = parsed
+    assert fingerprint(function) == before
+    assert entity_references(function) == set(["a.A", "a.B"])
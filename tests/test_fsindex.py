@@ -0,0 +1,36 @@
+
+import os
+from onering.utils import misc
+from onering.utils.fsindex import FileIndex
+
+def make_tree(tmpdir):
+    root = tmpdir.mkdir("root")
+    root.join("a.pdsc").write("")
+    root.mkdir("b").join("c.pdsc").write("")
+    root.join("b").join("d.txt").write("")
+    root.join("b").mkdir("e").join("f.pdsc").write("")
+    return str(root)
+
+def test_index_matches_walk(tmpdir):
+    root = make_tree(tmpdir)
+    index = FileIndex()
+    assert index.files(root) == list(misc.collect_files(root))
+    assert sorted(index.match(root, "*.pdsc")) == sorted(os.path.join(root, p) for p in ["a.pdsc", "b/c.pdsc", "b/e/f.pdsc"])
+
+    # Trees are only walked again once invalidated
+    open(os.path.join(root, "g.pdsc"), "w").close()
+    assert os.path.join(root, "g.pdsc") not in index.files(root)
+    index.invalidate(root)
+    assert os.path.join(root, "g.pdsc") in index.files(root)
+
+def test_persisted_index(tmpdir):
+    root = make_tree(tmpdir)
+    cache_dir = str(tmpdir.join("cache"))
+    files = FileIndex(cache_dir).files(root)
+    assert os.path.isfile(FileIndex(cache_dir).path_for(root))
+    assert FileIndex(cache_dir).files(root) == files
+
+    # Only directories whose mtimes changed are listed again
+    os.remove(os.path.join(root, "b", "e", "f.pdsc"))
+    os.utime(os.path.join(root, "b", "e"), (1, 1))
+    assert FileIndex(cache_dir).files(root) == list(misc.collect_files(root))
@@ -0,0 +1,116 @@
+
+import json
+import threading
+import SocketServer
+import BaseHTTPServer
+from onering.loaders.resolver import EntityResolver
+from onering.loaders.httpresolver import HttpEntityResolver
+
+class RegistryHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Serves the schemas of the server at /schemas/<fqn>.<type> with ETags. """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.path)
+        location = self.path[len("/schemas/"):]
+        if location not in server.schemas:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps(server.schemas[location])
+        etag = '"%d"' % hash(body)
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class RegistryServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+def start_registry(schemas):
+    server = RegistryServer(("127.0.0.1", 0), RegistryHandler)
+    server.schemas = schemas
+    server.requests = []
+    thread = threading.Thread(target = server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, "http://127.0.0.1:%d/schemas" % server.server_address[1]
+
+def make_resolver(url, cache_dir):
+    resolver = EntityResolver()
+    resolver.add_resolver(HttpEntityResolver(url, cache_dir, workers = 2, timeout = 5))
+    return resolver
+
+def test_http_resolver(tmpdir):
+    cache_dir = str(tmpdir.join("cache"))
+    server, url = start_registry({"a.B.pdsc": {"name": "B"}, "c.D.pdsc": {"name": "D"}})
+    try:
+        resolver = make_resolver(url, cache_dir)
+        assert resolver.resolve_many(["a.B", "c.D", "x.Y"]) == {"a.B": {"name": "B"}, "c.D": {"name": "D"}}
+        assert resolver.resolve_schema("a.B") == {"name": "B"}
+        assert len(server.requests) == 3
+
+        # Cached schemas are validated and downloaded again only when changed
+        server.schemas["c.D.pdsc"] = {"name": "D", "doc": "changed"}
+        resolver = make_resolver(url, cache_dir)
+        assert resolver.resolve_many(["a.B", "c.D"]) == {"a.B": {"name": "B"}, "c.D": {"name": "D", "doc": "changed"}}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # And are used as they are when the registry cannot be reached
+    resolver = make_resolver(url, cache_dir)
+    http_resolver = resolver.resolvers[0]
+    requests = []
+    request = http_resolver.pool.request
+    def counting_request(*args):
+        requests.append(args)
+        return request(*args)
+    http_resolver.pool.request = counting_request
+    assert resolver.resolve_many(["a.B", "c.D", "x.Y"]) == {"a.B": {"name": "B"}, "c.D": {"name": "D", "doc": "changed"}}
+    # Without trying the registry again after the first failure
+    assert http_resolver.unreachable
+    assert len(requests) <= http_resolver.workers
+
+def test_http_resolver_cache_keys(tmpdir):
+    from onering.loaders.schemacache import SchemaCache
+    server, url = start_registry({"a.B.pdsc": {"name": "B"}})
+    try:
+        resolver = HttpEntityResolver(url, str(tmpdir.join("cache")), workers = 1, timeout = 5)
+        # Keys are known without asking the registry
+        assert resolver.cache_key("a.B.pdsc") == ((url, "a.B.pdsc", 0), None)
+        assert server.requests == []
+
+        cache = SchemaCache()
+        assert cache.load(resolver, "a.B.pdsc") == {"name": "B"}
+        assert cache.load(resolver, "a.B.pdsc") == {"name": "B"}
+        assert len(server.requests) == 1 and cache.hits == 1
+
+        # Once invalidated schemas are validated against the registry (by their ETags) again
+        server.schemas["a.B.pdsc"] = {"name": "B", "doc": "changed"}
+        resolver.invalidate()
+        assert cache.load(resolver, "a.B.pdsc") == {"name": "B", "doc": "changed"}
+        assert len(server.requests) == 2
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_http_resolver_caches_any_body(tmpdir):
+    resolver = HttpEntityResolver("http://127.0.0.1:1/schemas", str(tmpdir.join("cache")), workers = 1, timeout = 5)
+    # Latin-1 (so not UTF-8) encoded body
+    body = '{"name": "B", "doc": "caf\xe9"}'
+    resolver._write_cache("a.B.pdsc", ('"1"', body))
+    assert resolver._read_cache("a.B.pdsc") == ('"1"', body)
+    resolver._write_cache("a.B.pdsc", None)
+    assert resolver._read_cache("a.B.pdsc") is None
@@ -0,0 +1,61 @@
+
+from __future__ import absolute_import
+import pytest
+from onering.packaging.lazy import LazyEntities
+from tests.conftest import Context, Package, write_package
+
+class BrokenEntities(dict):
+    def __getitem__(self, fqn):
+        raise ValueError("Broken module")
+
+def make_index(sources):
+    context = Context()
+    package = Package(sources)
+    index = LazyEntities(context)
+    for path, fqns in sorted(sources.iteritems()):
+        for fqn in fqns:
+            index.entity_sources.setdefault(fqn, []).append((package, path))
+            index.names.setdefault(fqn.rpartition(".")[2], set()).add(fqn)
+    index.install()
+    return context, package, index
+
+def test_lookups_load_sources_of_relative_names():
+    context, package, index = make_index({"/b": ["a.b.B"], "/c": ["a.c.B", "a.c.C"], "/d": ["d.D"]})
+    assert index.candidates("B") == ["a.b.B", "a.c.B"]
+    assert index.candidates("b.B") == ["a.b.B"]
+    assert index.candidates("a.c.C") == ["a.c.C"]
+
+    # A name relative to a module (as it reaches the global module) loads the sources it can refer to
+    assert context.global_module.find_fqn("b.B") is None
+    assert package.loaded == ["/b"]
+    assert context.global_module.find_fqn("a.b.B") == "/b"
+    assert package.loaded == ["/b"]
+    assert context.global_module.get("d.D") == "/d"
+    assert package.loaded == ["/b", "/d"]
+    with pytest.raises(KeyError):
+        context.global_module.get("x.Y")
+
+def test_lookups_only_load_sources_when_not_found():
+    context, package, index = make_index({"/b": ["a.b.B"]})
+    # Other errors are raised without loading anything
+    context.global_module.entities = BrokenEntities()
+    with pytest.raises(ValueError):
+        context.global_module.get("a.b.B")
+    assert package.loaded == []
+
+def test_relative_references_across_dependency_sources(tmpdir):
+    from onering.core.context import OneringContext
+    write_package(tmpdir, "dep", {
+        "b.onering": "module a.b { record B { x : int } }",
+        "c.onering": "module a.b { record C { b : B } }",
+        "d.onering": "module d { record D { y : int } }",
+    }, ["./*.onering"])
+    spec = write_package(tmpdir, "app", {"app.onering": "module app { record App { c : a.b.C } }"},
+                         ["./*.onering"], dependencies = {"dep": "../dep"})
+    context = OneringContext()
+    context.lazy_dependencies = True
+    context.load_package(spec)
+    # B is referred to (relative to a.b) in the source of C so is loaded along with it
+    assert context.global_module.find_fqn("a.b.C") is not None
+    assert context.global_module.find_fqn("a.b.B") is not None
+    assert context.lazy_entities.num_pending == 1
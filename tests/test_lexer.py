@@ -0,0 +1,143 @@
+from __future__ import absolute_import
+
+import os
+import sys
+import pytest
+import glob
+from onering.dsl.lexer import make_lexer, map_source, close_source, LineIndex, Lexer, RegexLexer, BaseToken, Token, SourceToken, TokenType
+from onering.dsl.parser.tokstream import TokenStream
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "samples")
+
+def token_tuples(content, engine):
+    return [(t.tok_type, t.value, t.position, t.length, t.line, t.col)
+                for t in make_lexer(content, None, engine = engine)]
+
+def sample_sources():
+    for path in sorted(glob.glob(os.path.join(SAMPLES_DIR, "*", "*.onering")) +
+                       glob.glob(os.path.join(SAMPLES_DIR, "dsl", "*", "*", "*.onering"))):
+        yield path, open(path).read()
+
+def test_engines_match_on_samples():
+    sources = list(sample_sources())
+    assert sources
+    for path, content in sources:
+        assert token_tuples(content, "regex") == token_tuples(content, "classic"), path
+
+def test_engines_match_on_operators():
+    content = """
+    a...b..c.d -> e => f = $g $ : ; - * / ? @h #inject A with B
+    x < y > z [ ] ( ) { } , 12 3.5 7.
+    /* multi
+       line */ 'single' "double" // trailing
+    end
+    """
+    assert token_tuples(content, "regex") == token_tuples(content, "classic")
+
+def test_token_values():
+    tokens = list(make_lexer("""fun f(x : int) -> "str" 42""", None, engine = "regex"))
+    assert [t.tok_type for t in tokens] == [TokenType.IDENTIFIER, TokenType.IDENTIFIER, TokenType.OPEN_PAREN,
+                                            TokenType.IDENTIFIER, TokenType.COLON, TokenType.IDENTIFIER,
+                                            TokenType.CLOSE_PAREN, TokenType.ARROW, TokenType.STRING,
+                                            TokenType.NUMBER]
+    assert tokens[8].value == "str"
+    assert tokens[9].value == 42
+
+def test_comments_disabled():
+    lexer = make_lexer("a // b", None, engine = "regex")
+    lexer.comments_enabled = False
+    assert [t.tok_type for t in lexer] == [TokenType.IDENTIFIER, TokenType.SLASH, TokenType.SLASH, TokenType.IDENTIFIER]
+
+def test_mmap_source_matches_string():
+    for path, content in sample_sources():
+        source = map_source(path)
+        lexer = make_lexer(source, path, engine = "regex")
+        tokens = list(lexer)
+        assert any(isinstance(t, SourceToken) for t in tokens)
+        assert all(t.tok_type in (TokenType.IDENTIFIER, TokenType.NUMBER, TokenType.STRING,
+                                  TokenType.COMMENT, TokenType.HASH, TokenType.DOLLAR_LITERAL)
+                        for t in tokens if isinstance(t, SourceToken))
+        assert [(t.tok_type, t.value, t.position, t.length, t.line, t.col) for t in tokens] == \
+                token_tuples(content, "regex"), path
+        close_source(source)
+        with pytest.raises(ValueError):
+            source[0:1]
+
+def test_mmap_empty_source():
+    assert map_source(os.devnull) == ""
+    close_source("")
+
+def test_table_engine_matches_regex():
+    for path, content in sample_sources():
+        assert token_tuples(content, "table") == token_tuples(content, "regex"), path
+
+def test_token_table_interns_values():
+    table = RegexLexer("a b a 1 1. 'a' $y #x", None).tokenize()
+    assert len(table) == 8
+    assert [table[i].value for i in range(len(table))] == ["a", "b", "a", 1, 1.0, "a", "y", "x"]
+    assert type(table[4].value) is float
+    assert table.value_ids[0] == table.value_ids[2] == table.value_ids[5]
+    assert [table[i].position for i in (6, 7)] == [15, 18]
+
+def test_token_views_are_smaller_than_tokens():
+    view = make_lexer("a b", None, engine = "table").next()
+    token = make_lexer("a b", None, engine = "regex").next()
+    assert isinstance(view, BaseToken) and not isinstance(view, Token)
+    assert not hasattr(view, "__dict__")
+    assert sys.getsizeof(view) < sys.getsizeof(token)
+
+def test_token_stream_over_table_engine():
+    stream = TokenStream(make_lexer("a b", None, engine = "table"))
+    token = stream.next_token()
+    stream.unget_token(token)
+    assert [stream.next_token().value, stream.next_token().value] == ["a", "b"]
+    assert stream.next_token().tok_type == TokenType.EOS
+
+def test_lines_and_columns():
+    content = "a\n b\n\nc /* x\ny */ d"
+    expected = [("a", 1, 1), ("b", 2, 1), ("c", 4, 0), ("/* x\ny */", 4, 2), ("d", 5, 5)]
+    for engine in ("classic", "regex", "table"):
+        lexer = make_lexer(content, None, engine = engine)
+        assert [(t.value, t.line, t.col) for t in lexer] == expected, engine
+        assert (lexer.line, lexer.column) == (5, 6)
+
+def test_span_lexer():
+    content = "fun f() { a { b } } c"
+    for engine in ("classic", "regex", "table"):
+        lexer = make_lexer(content, None, engine = engine)
+        # Spans are lexed once the lexer has read past them
+        list(lexer)
+        span = lexer.span_lexer(8, 19)
+        tokens = [(t.value, t.position, t.line, t.col) for t in span]
+        assert tokens == [("{", 8, 1, 9), ("a", 10, 1, 11), ("{", 12, 1, 13),
+                          ("b", 14, 1, 15), ("}", 16, 1, 17), ("}", 18, 1, 19)], engine
+
+def test_line_index_of_span():
+    content = "module a {\n  fun f() {\n    x => y\n  }\n}\n"
+    start, end = content.index("{", 12), content.index("}") + 1
+    expected = [(t.value, t.line, t.col) for t in make_lexer(content, None, engine = "regex").span_lexer(start, end)]
+    line, col = LineIndex(content).line_col(start)
+    text = content[start:end]
+    for lexer_class in (Lexer, RegexLexer):
+        lexer = lexer_class(text, None, line_index = LineIndex(text, first_line = line, first_col = col))
+        assert [(t.value, t.line, t.col) for t in lexer] == expected
+
+class Parser(object):
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.onering_context = None
+        self.current_module = None
+        self._entity_parsers = {}
+
+def test_deferred_bodies_are_lexed_by_the_source_engine():
+    from onering.dsl.parser.deferred import DeferredExpr
+    content = "module a {\n  fun f() {\n    x => y // copy\n  }\n}\n"
+    start, end = content.index("{", 12), content.index("}") + 1
+    for engine in ("classic", "regex", "table"):
+        lexer = make_lexer(content, "a.onering", engine = engine)
+        list(lexer)
+        body = DeferredExpr(Parser(lexer), start, end).make_lexer()
+        # Bodies of classic sources are not lexed by the regex engine (whose strings and comments differ)
+        assert type(body) is (Lexer if engine == "classic" else RegexLexer)
+        expected = [(t.value, t.line, t.col) for t in lexer.span_lexer(start, end)]
+        assert [(t.value, t.line, t.col) for t in body] == expected, engine
@@ -0,0 +1,95 @@
+
+import os
+from onering.packaging.manifest import BuildManifest
+from onering.utils.dirutils import write_if_changed
+from tests.conftest import Stub, Record, Context, TemplateLoader
+
+def test_manifest_staleness(tmpdir):
+    source = tmpdir.join("a.onering")
+    source.write("record A { }")
+    output = str(tmpdir.join("out", "a.js"))
+    assert write_if_changed(output, "A")
+    loader = TemplateLoader({"es6/record.tpl": "1"})
+
+    manifest_path = str(tmpdir.join("manifest.json"))
+    manifest = BuildManifest(manifest_path)
+    assert manifest.is_stale("a.js", output, ["a.A"], "s", loader)
+    manifest.record("a.js", output, ["a.A"], [str(source)], {"es6/record.tpl": "1"}, "s")
+    manifest.save()
+
+    def is_stale(fqns = ["a.A"], settings = "s"):
+        return BuildManifest(manifest_path).is_stale("a.js", output, fqns, settings, loader)
+    assert not is_stale()
+    assert is_stale(["a.A", "a.B"]) and is_stale(settings = "t")
+
+    loader.hashes["es6/record.tpl"] = "2"
+    assert is_stale()
+    loader.hashes["es6/record.tpl"] = "1"
+
+    source.write("record A { x : int }")
+    assert is_stale()
+    source.write("record A { }")
+    assert not is_stale()
+
+    # Unchanged outputs are not rewritten and changed outputs are regenerated
+    os.utime(output, (0, 0))
+    assert not write_if_changed(output, "A") and os.path.getmtime(output) == 0
+    assert write_if_changed(output, "B")
+    assert is_stale()
+
+def make_generator(tmpdir, entities, entity_sources, entity_resolver):
+    from onering.targets import base
+    class Generator(base.Generator):
+        def filename_for_entity(self, fqn, entity):
+            return fqn + ".txt"
+        def open_file(self, filename):
+            return base.File(self, filename)
+        def generate(self):
+            for fqn, entity in self.entities_to_generate():
+                self.ensure_file(self.filename_for_entity(fqn, entity))[0].write(fqn)
+            self.close_files()
+    spec = tmpdir.join("package.spec")
+    spec.ensure()
+    platform = Stub(name = "test", generator_class = "test.Generator")
+    package = Stub(name = "p", spec_path = str(spec), current_platform = platform, found_entities = dict(entities),
+                   template_loader = TemplateLoader({}), entity_resolver = entity_resolver)
+    context = Context()
+    context.entity_sources = entity_sources
+    generator = Generator(context, package, str(tmpdir.join("out")))
+    generator.manifest = BuildManifest(str(tmpdir.join("out", "manifest.json")))
+    return generator
+
+def test_generator_manifest_inputs_and_removed_outputs(tmpdir):
+    import json
+    from typecube import core as tccore
+    from onering.loaders.resolver import EntityResolver, FilePathEntityResolver
+    source = tmpdir.join("a.onering")
+    source.write("record A { b : B } record C { }")
+    schema = tmpdir.mkdir("schemas").mkdir("a").join("B.pdsc")
+    schema.write(json.dumps({"name": "B"}))
+    entity_resolver = EntityResolver()
+    entity_resolver.add_resolver(FilePathEntityResolver(str(tmpdir.join("schemas"))))
+    assert entity_resolver.resolve_schema("a.B") == {"name": "B"}
+
+    entities = {"a.A": Record("a.A", tccore.make_ref("a.B")), "a.C": Record("a.C"), "a.B": Record("a.B")}
+    sources = {"a.A": str(source), "a.C": str(source)}
+    def build(entities):
+        generator = make_generator(tmpdir, entities, sources, entity_resolver)
+        generator.generate()
+        return generator
+    generator = build(entities)
+    assert sorted(generator.file_entities) == ["a.A.txt", "a.B.txt", "a.C.txt"]
+    # The manifest is saved as the generator closes its files
+    assert BuildManifest(generator.manifest.path).outputs == generator.manifest.outputs
+    # Resolved schemas are inputs of the outputs of the entities referring to them
+    assert sorted(generator.manifest.outputs["a.A.txt"]["inputs"]) == sorted([str(source), str(schema)])
+    assert sorted(build(entities).skipped_files) == ["a.A.txt", "a.B.txt", "a.C.txt"]
+
+    schema.write(json.dumps({"name": "B", "doc": "changed"}))
+    assert sorted(build(entities).file_entities) == ["a.A.txt", "a.B.txt"]
+
+    # Outputs of entities no longer in the package are deleted and forgotten
+    del entities["a.C"]
+    generator = build(entities)
+    assert not tmpdir.join("out", "a.C.txt").exists() and tmpdir.join("out", "a.A.txt").exists()
+    assert sorted(generator.manifest.outputs) == ["a.A.txt", "a.B.txt"]
@@ -7,9 +7,12 @@ from onering.core.context import OneringContext
 from onering.dsl.parser.rules.annotations import parse_annotation
 from onering.dsl.parser.rules.modules import parse_module
 
-def new_parser(content, context = None):
+def new_parser(content, context = None, engine = None):
     if context is None:
         context = OneringContext()
+    if engine:
+        from onering.dsl.lexer import make_lexer
+        content = make_lexer(content, None, engine = engine)
     return Parser(content, context)
 
 def test_parse_annotation_leaf():
@@ -111,3 +114,218 @@ def test_record_parsing():
     assert entity.args[2].type_expr.constructor == "record"
     assert entity.args[2].type_expr.name == None
 
+
+def test_parse_cache_replay(tmpdir):
+    from onering.dsl.parser.cache import ParseCache
+    content = """
+    module a.b {
+        import x.y.Z as W
+        record Record {
+            a : int
+        }
+    }
+    """
+
+    cache = ParseCache(str(tmpdir))
+    parser = new_parser(content)
+    key = cache.key_for(content, parser.root_module.fqn, parser._entity_parsers)
+    assert not cache.load(key, parser)
+    parser.parse()
+    assert cache.save(key, parser)
+
+    # Replay into a fresh context without parsing
+    parser = new_parser(content)
+    assert cache.key_for(content, parser.root_module.fqn, parser._entity_parsers) == key
+    # Parses with deferred function bodies are cached apart
+    assert cache.key_for(content, parser.root_module.fqn, parser._entity_parsers, True) != key
+    assert cache.load(key, parser)
+    context = parser.onering_context
+    entity = context.global_module.get("a.b").get("Record")
+    assert entity.constructor == "record"
+    assert entity.args[0].name == "a"
+    assert parser.found_entities == {"a.b.Record": entity}
+
+def test_deferred_function_body():
+    from onering.dsl.parser.deferred import DeferredExpr, ensure_body
+    from onering.dsl.parser.cache import dump_parse, load_parse
+    content = """
+    module a {
+        fun f(x : int) -> int {
+            // a comment with a } in it
+            g(x, "}") => dest
+        }
+        fun h(x : int) -> int { x => dest }
+    }
+    """
+    parser = new_parser(content, engine = "regex")
+    parser.defer_function_bodies = True
+    parser.parse()
+    function = parser.found_entities["a.f"]
+    assert isinstance(function.expr, DeferredExpr)
+    assert not function.expr.is_parsed
+
+    # Deferred bodies are pickled unparsed
+    replayed = new_parser("")
+    load_parse(dump_parse(parser), replayed)
+    deferred = replayed.found_entities["a.f"].expr
+    assert isinstance(deferred, DeferredExpr) and not deferred.is_parsed
+    assert deferred.onering_context is replayed.onering_context
+    assert not function.expr.is_parsed
+
+    # Resolving a deferred body parses it and swaps it into its function
+    body = function.expr.parse()
+    assert function.expr is body
+    assert len(body.children) == 1
+    assert ensure_body(parser.found_entities["a.h"]) is parser.found_entities["a.h"].expr
+
+def iter_file(path, use_mmap, lazy_function_bodies = False):
+    from onering.actions.loaders import LoaderActions
+    context = OneringContext()
+    context.lazy_function_bodies = lazy_function_bodies
+    return list(LoaderActions(context, use_mmap = use_mmap).iter_file(str(path)))
+
+def test_iter_file_with_and_without_mmap(tmpdir):
+    from onering.core.fingerprints import fingerprint
+    path = tmpdir.join("a.onering")
+    path.write("""
+    module a {
+        // Docs of A
+        record A {
+            x : int
+            y : list<string>
+        }
+        enum E { P, Q }
+        fun f(x : int) -> int { x => dest }
+    }
+    """)
+    for lazy in (False, True):
+        mapped, read = iter_file(path, True, lazy), iter_file(path, False, lazy)
+        assert [fqn for fqn, entity in mapped] == [fqn for fqn, entity in read] == ["a.A", "a.E", "a.f"]
+        assert [fingerprint(entity) for fqn, entity in mapped] == [fingerprint(entity) for fqn, entity in read]
+
+def test_iter_entities_streams_declarations():
+    content = """
+    module a {
+        record A { x : int }
+        module b {
+            record B { y : int }
+        }
+        record C { z : int }
+    }
+    """
+    parser = new_parser(content)
+    entities = parser.iter_entities()
+    fqn, entity = entities.next()
+    assert fqn == "a.A"
+    # Later declarations have not been parsed yet
+    assert parser.found_entities.keys() == ["a.A"]
+    assert [fqn for fqn, entity in entities] == ["a.b.B", "a.C"]
+
+def test_rule_profiler():
+    from onering.dsl.parser.profiler import RuleProfiler
+    from onering.dsl.parser.rules import exprs
+    content = """
+    module a {
+        record A { x : int }
+        record B { y : A }
+    }
+    """
+    parse_expr = exprs.parse_expr
+    with RuleProfiler() as profiler:
+        new_parser(content).parse()
+    assert exprs.parse_expr is parse_expr
+    report = dict((entry["rule"], entry) for entry in profiler.report(by_source = False))
+    assert report["parse_module"]["calls"] == 1
+    assert report["parse_record_or_union"]["calls"] == 2
+    assert report["parse_module"]["tokens"] > report["parse_record_or_union"]["tokens"]
+    assert report["parse_module"]["inclusive"] >= report["parse_module"]["exclusive"]
+
+def test_rule_profiler_expression_rules():
+    from onering.dsl.parser.profiler import RuleProfiler
+    from onering.dsl.parser.rules import exprs
+    content = """
+    module a {
+        fun f(x : int) -> int {
+            g(x, h(x)) => dest
+        }
+    }
+    """
+    prefix_rules = dict(exprs.PREFIX_RULES)
+    with RuleProfiler() as profiler:
+        new_parser(content).parse()
+    assert exprs.PREFIX_RULES == prefix_rules
+    report = dict((entry["rule"], entry) for entry in profiler.report(by_source = False))
+    assert report["iter_expr_list"]["calls"] == 1
+    assert report["iter_statement"]["calls"] == 1
+    assert report["iter_fun_app"]["calls"] == 2
+    assert report["iter_expr_list"]["tokens"] > report["iter_fun_app"]["tokens"]
+
+def test_parse_deeply_nested_exprs():
+    from onering.dsl.parser.rules.exprs import parse_expr
+    from onering.dsl.parser.rules.types import ensure_typeexpr
+    depth = 3000
+    expr = parse_expr(new_parser("f(" * depth + "x" + ")" * depth))
+    for i in xrange(depth):
+        assert type(expr) is tlcore.FunApp
+        expr = expr.args[0]
+    assert expr.name == "x"
+
+    typeexpr = ensure_typeexpr(new_parser("list<" * depth + "int" + ">" * depth))
+    assert typeexpr is not None
+
+def test_scan_declarations():
+    from onering.dsl.parser.scanner import scan_declarations
+    content = """
+    module a.b {
+        @doc = "A record"
+        record R { x : int; y : record Inner { z : string } }
+        alias A = record B { q : int }
+        enum E { X, Y }
+        module c {
+            fun f(x : int) -> int { { x => y } }
+            extern fun g(x : int) -> int
+        }
+    }
+    record Top { }
+    """
+    entities, modules = scan_declarations(new_parser(content))
+    assert entities == ["a.b.R", "a.b.A", "a.b.E", "a.b.c.f", "a.b.c.g", "Top"]
+    assert modules == ["a.b", "a.b.c"]
+
+PARALLEL_SOURCES = {
+    "a.onering": "module a { record A { x : int } record B { a : A } }",
+    "b.onering": "module b { record C { b : a.B } enum E { P, Q } }",
+    "c.onering": "module c { record D { c : b.C  e : b.E } }",
+}
+
+def load_batches(tmpdir, workers):
+    from onering.actions.loaders import LoaderActions
+    from onering.core.fingerprints import fingerprint
+    for name, content in PARALLEL_SOURCES.iteritems():
+        tmpdir.join(name).write(content)
+    context = OneringContext()
+    context.curdir = str(tmpdir)
+    batches = list(LoaderActions(context, workers = workers).iter_batches(["./*.onering"]))
+    return ([[fqn for fqn, entity in batch] for batch in batches],
+            dict((fqn, fingerprint(entity)) for batch in batches for fqn, entity in batch),
+            context.entity_sources)
+
+def test_parallel_parse_matches_serial(tmpdir):
+    serial = load_batches(tmpdir, 1)
+    assert [fqn for batch in serial[0] for fqn in batch] == ["a.A", "a.B", "b.C", "b.E", "c.D"]
+    assert sorted(serial[2].values()) == sorted([str(tmpdir.join(n)) for n in ("a.onering", "a.onering", "b.onering",
+                                                                                "b.onering", "c.onering")])
+    assert load_batches(tmpdir, 3) == serial
+
+def test_parallel_parse_falls_back_when_parse_cannot_be_sent(tmpdir, monkeypatch):
+    from cPickle import PicklingError
+    from onering.actions import loaders
+    def dump_parse(parser):
+        raise PicklingError("Cannot pickle")
+    monkeypatch.setattr(loaders, "dump_parse", dump_parse)
+    path = tmpdir.join("a.onering")
+    path.write(PARALLEL_SOURCES["a.onering"])
+    assert loaders._parse_file_in_worker((str(path), False, None, False)) is None
+    # Sources whose parse could not be sent (from the forked workers) are loaded in this process
+    assert loaders.LoaderActions(OneringContext(), workers = 2).parse_files([str(path)]) == {str(path): None}
+    assert load_batches(tmpdir, 3) == load_batches(tmpdir, 1)
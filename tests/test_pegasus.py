@@ -0,0 +1,99 @@
+
+from __future__ import absolute_import
+import json
+from typecube import core as tccore
+from onering.loaders import pegasus
+from onering.loaders.pegasus import dependency_order, IncludedTypeArg
+from tests.conftest import Context, write_package, build_package
+
+def test_dependency_order():
+    deps = {"a": ["b", "c"], "b": ["c"], "c": [], "d": ["a"], "e": ["f"], "f": ["e"]}
+    order = dependency_order(sorted(deps), deps, roots = ["d"])
+    assert order[:4] == ["c", "b", "a", "d"]
+    assert sorted(order) == sorted(deps)
+
+def test_included_fields_are_shared():
+    field = tccore.TypeArg("a", tccore.make_ref("x.Y"), True, None, None, "A field")
+    base = tccore.make_product_type("record", "x.Base", [field], None)
+    shared = IncludedTypeArg(IncludedTypeArg(field))
+    derived = tccore.make_product_type("record", "x.Derived", [shared], None)
+    assert shared.is_shared and shared._source is field
+    assert (shared.name, shared.is_optional, shared.docs) == ("a", True, "A field")
+    assert field.parent is base and shared.parent is derived
+    assert shared.type_expr is not field.type_expr and shared.type_expr.fqn == "x.Y"
+
+    # Changing a shared field copies it first
+    shared.docs = "Changed"
+    assert not shared.is_shared
+    assert (shared.name, shared.docs, field.docs) == ("a", "Changed", "A field")
+
+def test_included_fields_copy_mutable_values_when_read():
+    field = tccore.TypeArg("a", tccore.make_ref("x.Y"), True, {"values": [1]}, None, "A field")
+    base = tccore.make_product_type("record", "x.Base", [field], None)
+    shared = IncludedTypeArg(field)
+    derived = tccore.make_product_type("record", "x.Derived", [shared], None)
+
+    # Values read (and changed) through a shared field are its own deep copies
+    shared.default_value["values"].append(2)
+    assert shared.is_shared
+    assert shared.default_value == {"values": [1, 2]} and field.default_value == {"values": [1]}
+    assert shared.default_value is not field.default_value
+
+    # As are the values copied when it is changed
+    other = IncludedTypeArg(field)
+    other.docs = "Changed"
+    other.default_value["values"].append(3)
+    assert field.default_value == {"values": [1]}
+
+INCLUDES = {
+    "schemas/Base.pdsc": json.dumps({"type": "record", "name": "Base", "namespace": "com.x", "doc": "Base",
+        "fields": [{"name": "id", "type": "long", "doc": "Id"},
+                   {"name": "tags", "type": {"type": "array", "items": "string"}, "optional": True}]}),
+    "schemas/Middle.pdsc": json.dumps({"type": "record", "name": "Middle", "namespace": "com.x", "include": ["Base"],
+        "fields": [{"name": "name", "type": "string", "doc": "Name"}]}),
+    "schemas/Derived.pdsc": json.dumps({"type": "record", "name": "Derived", "namespace": "com.x",
+        "include": ["Middle", "Base"], "fields": [{"name": "base", "type": "Base", "optional": True}]}),
+}
+
+def test_shared_included_fields_generate_the_same_outputs(tmpdir):
+    spec = write_package(tmpdir, "includes", INCLUDES,
+                         [{"loader": "onering.loaders.pegasus.Loader", "args": [{"dir": "schemas", "files": "*.pdsc"}]}])
+    share = pegasus.Loader.share_included_fields
+    try:
+        for platform in ("es6", "java"):
+            outputs = {}
+            for shared in (False, True):
+                pegasus.Loader.share_included_fields = shared
+                outputs[shared] = build_package(spec, str(tmpdir.join("out", platform, str(shared))), platform)
+            assert outputs[True] == outputs[False]
+            assert any("tags" in contents for contents in outputs[True].itervalues())
+    finally:
+        pegasus.Loader.share_included_fields = share
+
+class SchemaResolver(object):
+    """ Resolves the schemas it has (recording the FQNs asked for). """
+    def __init__(self, schemas):
+        self.schemas = schemas
+        self.requests = []
+    def resolve_many(self, fqns, *extensions):
+        self.requests.append(sorted(fqns))
+        return dict((fqn, self.schemas[fqn]) for fqn in fqns if fqn in self.schemas)
+
+def test_prefetch_normalizes_names_to_nested_namespaces():
+    context = Context({"int": "int"})
+    context.parse_workers = 1
+    context.entity_resolver = SchemaResolver({"b.C": {"type": "record", "name": "C", "fields": []}})
+    loader = pegasus.Loader(context)
+    schema = {"type": "record", "name": "A", "namespace": "a", "fields": [
+        {"name": "x", "type": "int"},
+        {"name": "b", "type": {"type": "record", "name": "B", "namespace": "b", "fields": [
+            {"name": "c", "type": "C"}, {"name": "a", "type": "a.A"}]}}]}
+    # Types declared in the schema (even when nested) are not resolved
+    assert loader.prefetch(schema, "a") == ["b.C"]
+    assert context.entity_resolver.requests == [["b.C"]]
+    assert loader.prefetch(schema, "a") == []
+    assert context.entity_resolver.requests == [["b.C"]]
+
+    # And are dropped once the schemas are loaded
+    loader.scan = lambda paths: ({}, {})
+    assert loader.load() == {} and loader.prefetched == {}
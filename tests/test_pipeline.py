@@ -0,0 +1,51 @@
+
+from typecube import core as tccore
+from onering.packaging.pipeline import EntityPipeline
+from tests.conftest import Record
+
+def make_pipeline(external = ()):
+    analyzed = []
+    pipeline = EntityPipeline(lambda fqn: fqn if fqn in external else None,
+                              lambda entities: analyzed.append(sorted(entities.keys())))
+    return pipeline, analyzed
+
+def add(pipeline, *records):
+    """ Adds a batch of records each given as (fqn, refs...) and returns the FQNs of those ready. """
+    batch = [(record[0], Record(record[0], *map(tccore.make_ref, record[1:]))) for record in records]
+    return [ready_fqn for ready_fqn, entity in pipeline.add(batch)]
+
+def test_entities_are_ready_once_their_references_are():
+    pipeline, analyzed = make_pipeline(external = ["int"])
+    assert add(pipeline, ("a.A", "a.B", "int")) == []
+    assert add(pipeline, ("a.C", "A")) == []
+    # a.B makes a.A and then a.C (which refers to it relative to its module) ready
+    assert add(pipeline, ("a.B", "int")) == ["a.B", "a.A", "a.C"]
+    assert analyzed == [["a.A", "a.B", "a.C"]]
+    assert add(pipeline, ("a.D", "a.D")) == ["a.D"]
+    assert pipeline.finish() == []
+
+def test_waiting_entities_are_analyzed_when_finished():
+    pipeline, analyzed = make_pipeline()
+    assert add(pipeline, ("a.A", "a.B")) == []
+    assert add(pipeline, ("a.B", "a.A")) == []
+    assert add(pipeline, ("a.C", "x.Missing")) == []
+    assert [fqn for fqn, entity in pipeline.finish()] == ["a.A", "a.B", "a.C"]
+    assert analyzed == [["a.A", "a.B", "a.C"]]
+
+def test_references_wait_on_the_fqns_they_resolve_to():
+    pipeline, analyzed = make_pipeline()
+    assert add(pipeline, ("a.A", "X")) == []
+    # b.X has the same name but is not one a.A can refer to
+    assert add(pipeline, ("b.X",)) == ["b.X"]
+    assert add(pipeline, ("a.X", "a.Y")) == []
+    # a.X (which a.A refers to) is added but is not ready yet
+    assert add(pipeline, ("X",)) == ["X"]
+    assert add(pipeline, ("a.Y",)) == ["a.Y", "a.X", "a.A"]
+    assert analyzed == [["b.X"], ["X"], ["a.A", "a.X", "a.Y"]]
+
+def test_batches_are_analyzed_when_closed():
+    # The entities of a batch are all registered (and found) before they are added
+    pipeline, analyzed = make_pipeline(external = ["a.A", "a.B"])
+    assert add(pipeline, ("a.A", "a.B"), ("a.B", "x.Missing")) == []
+    assert add(pipeline, ("x.Missing",)) == ["x.Missing", "a.B", "a.A"]
+    assert analyzed == [["a.A", "a.B", "x.Missing"]]
@@ -0,0 +1,88 @@
+from __future__ import absolute_import
+import pytest
+from typecube import core as tccore
+from onering.core.fingerprints import Fingerprints
+from onering.targets.rendercache import RenderCache
+from tests.conftest import Record, Stub, TemplateLoader, write_package, build_package
+
+class Importer(object):
+    def __init__(self, prefix = "m"):
+        self.prefix = prefix
+
+    def ensure(self, fqn):
+        return self.prefix + "." + fqn
+
+def make_file(entities, loader):
+    platform = Stub(name = "es6", generator_class = "onering.targets.es6.Generator", imports = [], exports = [])
+    package = Stub(name = "p", current_platform = platform, found_entities = entities, template_loader = loader)
+    generator = Stub(package = package, fingerprints = Fingerprints(entities.get))
+    return Stub(generator = generator, importer = Importer(), recorders = [{}])
+
+class View(object):
+    def __init__(self, outfile, entity):
+        self.outfile = outfile
+        self.entity = entity
+        self.renders = 0
+
+    def render(self):
+        self.renders += 1
+        for recorder in self.outfile.recorders:
+            recorder["record.tpl"] = self.outfile.generator.package.template_loader.hashes["record.tpl"]
+        return "class %s extends %s" % (self.entity.fqn, self.outfile.importer.ensure(self.entity.fields[0].fqn))
+
+def test_render_cache(tmpdir):
+    loader = TemplateLoader({"record.tpl": "1"})
+    entities = {"a.B": Record("a.B"), "a.A": Record("a.A", tccore.make_ref("a.B"))}
+    cache = RenderCache(str(tmpdir))
+
+    def render(outfile = None):
+        outfile = outfile or make_file(entities, loader)
+        view = View(outfile, entities["a.A"])
+        text = cache.render(outfile, view, view.entity, view.render)
+        return text, view.renders, outfile
+    assert render()[:2] == ("class a.A extends m.a.B", 1)
+
+    # Unchanged entities are not rendered again (and their templates are recorded in the file)
+    text, renders, outfile = render()
+    assert (text, renders, outfile.recorders[0]) == ("class a.A extends m.a.B", 0, {"record.tpl": "1"})
+    assert (RenderCache(str(tmpdir)).hits, cache.hits) == (0, 1)
+
+    # Changes to the entities referred to, templates or imports render entities again
+    entities["a.B"].fields.append(Record("x"))
+    assert render()[1] == 1 and render()[1] == 0
+    loader.hashes["record.tpl"] = "2"
+    cache = RenderCache(str(tmpdir))
+    assert render()[1] == 1 and render()[1] == 0
+    outfile = make_file(entities, loader)
+    outfile.importer.prefix = "n"
+    assert render(outfile)[:2] == ("class a.A extends n.a.B", 1)
+
+EQUIVALENCE_SOURCE = """
+module a {
+    record A {
+        x : int
+        b : B
+        e : E
+    }
+    record B {
+        y : list<string>
+        z : map<string, A>
+    }
+    enum E { P, Q }
+}
+"""
+
+@pytest.mark.parametrize("platform", ["es6", "java"])
+def test_render_cache_generates_the_same_outputs(tmpdir, platform):
+    spec = write_package(tmpdir.join("src"), "p", {"a.onering": EQUIVALENCE_SOURCE}, ["./*.onering"])
+    expected = build_package(spec, str(tmpdir.join("plain")), platform)
+    assert expected
+
+    # Rendered into a fresh cache and then from it (in a new context)
+    cache_dir = str(tmpdir.join("cache"))
+    cache = RenderCache(cache_dir)
+    assert build_package(spec, str(tmpdir.join("cold")), platform, render_cache = cache) == expected
+    assert cache.hits == 0
+    cache = RenderCache(cache_dir)
+    assert build_package(spec, str(tmpdir.join("warm")), platform, render_cache = cache) == expected
+    assert cache.hits > 0
@@ -0,0 +1,144 @@
+
+import os
+import json
+import zipfile
+from onering.loaders import jarindex
+from onering.loaders.schemacache import SchemaCache
+from onering.loaders.resolver import EntityResolver, FilePathEntityResolver, ZipFilePathEntityResolver
+
+def make_jar(path, schemas):
+    zf = zipfile.ZipFile(path, "w")
+    for name, schema in schemas.iteritems():
+        zf.writestr(name, json.dumps(schema))
+    zf.close()
+    return path
+
+def test_jar_resolver_uses_index(tmpdir):
+    jar = make_jar(str(tmpdir.join("a.jar")), {"pegasus/a/b/C.pdsc": {"name": "C"}})
+    index = jarindex.JarIndex()
+    resolver = ZipFilePathEntityResolver(jar, "pegasus", index = index)
+    assert resolver.resolve_schema("a.b.C") == {"name": "C"}
+    assert resolver.resolve_schema("a.b.D") is None
+    assert index.entries(jar) == frozenset(["pegasus/a/b/C.pdsc"])
+
+def test_jar_index_is_persisted(tmpdir):
+    jar = make_jar(str(tmpdir.join("a.jar")), {"a/B.pdsc": {}})
+    cache_dir = str(tmpdir.join("cache"))
+    assert jarindex.JarIndex(cache_dir).entries(jar) == frozenset(["a/B.pdsc"])
+
+    # A new index reads the saved entries instead of the jar
+    index = jarindex.JarIndex(cache_dir)
+    index.open = None
+    assert index.entries(jar) == frozenset(["a/B.pdsc"])
+
+    # ... unless the jar has changed
+    make_jar(jar, {"a/B.pdsc": {}, "a/C.pdsc": {}})
+    os.utime(jar, (0, 0))
+    assert jarindex.JarIndex(cache_dir).entries(jar) == frozenset(["a/B.pdsc", "a/C.pdsc"])
+
+def test_jar_index_refresh(tmpdir):
+    jar = make_jar(str(tmpdir.join("a.jar")), {"a/B.pdsc": {}})
+    index = jarindex.JarIndex()
+    assert index.entries(jar) == frozenset(["a/B.pdsc"])
+    assert index.refresh() == []
+    make_jar(jar, {"a/B.pdsc": {}, "a/C.pdsc": {}})
+    os.utime(jar, (0, 0))
+    assert index.refresh() == [jar]
+    assert index.entries(jar) == frozenset(["a/B.pdsc", "a/C.pdsc"])
+
+def test_jar_index_bounds_open_jars(tmpdir):
+    jars = [make_jar(str(tmpdir.join("%d.jar" % i)), {"a/B.pdsc": {"jar": i}, "a/C%d.pdsc" % i: {}}) for i in xrange(3)]
+    index = jarindex.JarIndex(max_open = 2)
+    resolvers = [ZipFilePathEntityResolver(jar, index = index) for jar in jars]
+    assert [resolver.locate("a.B") for resolver in resolvers] == ["a/B.pdsc"] * 3
+    assert index.jars_with("a/B.pdsc") == jars and index.jars_with("a/C1.pdsc") == [jars[1]]
+
+    # Jars are not opened to find cache keys
+    index._zipfiles.clear()
+    assert resolvers[0].cache_key("a/B.pdsc")[1] == len(json.dumps({"jar": 0}))
+    assert not index._zipfiles
+
+    # Only the jars read last are kept open
+    first = index.open(jars[0])
+    assert [resolver.load("a/B.pdsc") for resolver in resolvers] == [{"jar": i} for i in xrange(3)]
+    assert index._zipfiles.keys() == jars[1:] and first.fp is None
+
+    index.invalidate(jars[1])
+    assert index.jars_with("a/B.pdsc") == [jars[0], jars[2]] and index.jars_with("a/C1.pdsc") == []
+    assert index._zipfiles.keys() == [jars[2]]
+
+def test_entity_resolver_caches_locations(tmpdir):
+    schema_dir = tmpdir.mkdir("schemas")
+    schema_dir.mkdir("a").join("B.pdsc").write(json.dumps({"name": "B"}))
+    jar = make_jar(str(tmpdir.join("c.jar")), {"c/D.pdsc": {"name": "D"}})
+    dir_resolver = FilePathEntityResolver(str(schema_dir))
+    jar_resolver = ZipFilePathEntityResolver(jar, index = jarindex.JarIndex())
+
+    resolver = EntityResolver()
+    resolver.add_resolver(dir_resolver)
+    assert resolver.resolve_schema("a.B") == {"name": "B"}
+    assert resolver.resolve_schema("c.D") is None
+    assert resolver.locate("c.D") is None
+
+    # Adding a resolver forgets what was not found
+    resolver.add_resolver(jar_resolver)
+    assert resolver.resolve_schema("c.D") == {"name": "D"}
+    assert resolver.locate("c.D") == (jar_resolver, "c/D.pdsc")
+
+    # Removing a resolver forgets what was found by it
+    resolver.remove_resolver(ZipFilePathEntityResolver(jar))
+    assert resolver.resolve_schema("c.D") is None
+    assert resolver.resolve_schema("a.B") == {"name": "B"}
+
+    # Jars and the schema files found are the sources of the resolver
+    resolver.add_resolver(jar_resolver)
+    assert resolver.source_paths() == set([str(schema_dir.join("a", "B.pdsc")), jar])
+
+def test_resolve_many(tmpdir):
+    schema_dir = tmpdir.mkdir("schemas")
+    schema_dir.mkdir("a").join("B.pdsc").write(json.dumps({"name": "B"}))
+    jar = make_jar(str(tmpdir.join("c.jar")), {"c/D.pdsc": {"name": "D"}, "c/E.pdsc": {"name": "E"},
+                                               "a/B.pdsc": {"name": "shadowed"}})
+    resolver = EntityResolver()
+    resolver.add_resolver(FilePathEntityResolver(str(schema_dir)))
+    resolver.add_resolver(ZipFilePathEntityResolver(jar, index = jarindex.JarIndex()))
+    assert resolver.resolve_many(["a.B", "c.D", "c.E", "x.Y"]) == {"a.B": {"name": "B"}, "c.D": {"name": "D"},
+                                                                   "c.E": {"name": "E"}}
+    assert resolver.locate("x.Y") is None
+    assert resolver.resolve_many(["c.D", "x.Y"]) == {"c.D": {"name": "D"}}
+
+def test_schema_cache(tmpdir):
+    schema_dir = tmpdir.mkdir("schemas")
+    schema_dir.mkdir("a").join("B.pdsc").write(json.dumps({"name": "B"}))
+    jar = make_jar(str(tmpdir.join("c.jar")), {"c/D.pdsc": {"name": "D"}})
+    cache = SchemaCache()
+    resolvers = []
+    for i in xrange(2):
+        resolver = EntityResolver()
+        resolver.schema_cache = cache
+        resolver.add_resolver(FilePathEntityResolver(str(schema_dir)))
+        resolver.add_resolver(ZipFilePathEntityResolver(jar, index = jarindex.JarIndex()))
+        resolvers.append(resolver)
+    assert resolvers[0].resolve_schema("a.B") == {"name": "B"}
+    assert resolvers[0].resolve_many(["a.B", "c.D"]) == {"a.B": {"name": "B"}, "c.D": {"name": "D"}}
+    assert resolvers[1].resolve_schema("c.D") == {"name": "D"}
+    assert (cache.hits, cache.misses, len(cache)) == (2, 2, 2)
+
+    # Changed schemas are not served from the cache
+    schema_dir.join("a", "B.pdsc").write(json.dumps({"name": "B", "doc": "changed"}))
+    os.utime(str(schema_dir.join("a", "B.pdsc")), (0, 0))
+    assert resolvers[1].resolve_schema("a.B") == {"name": "B", "doc": "changed"}
+
+    # Least recently used schemas are evicted once over budget
+    cache.max_bytes = cache.num_bytes
+    resolvers[0].resolve_schema("c.D")
+    cache.put(("x", "Y"), {}, 1)
+    assert cache.evictions == 1 and ("x", "Y") in cache._entries
+    assert cache.num_bytes <= cache.max_bytes
+
+def test_schema_cache_sizes_unsized_schemas():
+    cache = SchemaCache()
+    cache.put("a", {"name": "A"}, None)
+    assert cache.num_bytes == len(json.dumps({"name": "A"}))
+    cache.put("b", {"name": object()}, None)
+    assert "b" not in cache._entries